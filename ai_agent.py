@@ -1,20 +1,49 @@
 
 # ai_agent.py
 
+import hashlib
 import os
-import re
+import threading
+import time
+from functools import partial
+import httpx
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_community.tools.tavily_search import TavilySearchResults
 from langgraph.prebuilt import create_react_agent
-from langchain_core.messages.ai import AIMessage
+from langchain_core.messages.ai import AIMessage, AIMessageChunk
+
+from brief_cache import normalize_company_name
+from brief_pipeline import TierUsage
+from company_utils import contains_multiple_companies
+from metrics import instrumented, record_usage, timed, timed_stream, timed_transform
+from openai_scheduler import SchedulerRateLimiter
+from postprocess import clean_stream, clean_text, strip_disclaimer
+from singleflight import SingleFlight
 
 # Load environment variables
 load_dotenv()
 
 
-OPENAI_API_KEY = st.secrets["OPENAI_API_KEY"]
-TAVILY_API_KEY = st.secrets["TAVILY_API_KEY"]
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+
+# Connection pool shared by every ChatOpenAI instance in this process
+HTTP_MAX_CONNECTIONS = int(os.getenv("OPENAI_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("OPENAI_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("OPENAI_HTTP_TIMEOUT", "120"))
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+# Ready-built LLM clients and compiled agents, reused across requests
+SEARCH_TOOL_NAME = "tavily_search_results_json"
+_llm_registry = {}
+_agent_registry = {}
+_registry_lock = threading.Lock()
+
+# Identical questions asked while an answer is being generated share that one agent run
+agent_flights = SingleFlight("agent")
 
 # Custom system prompt
 DEFAULT_PROMPT = (
@@ -34,70 +63,199 @@ def clean_ai_response(response_text: str) -> str:
     """
     Removes the initial disclaimer paragraph from the AI response if it contains fallback indicators.
     """
-    # Split the response into paragraphs
-    paragraphs = response_text.strip().split("\n\n")
+    return strip_disclaimer(response_text)
 
-    # Define keywords that identify fallback/disclaimer text
-    fallback_indicators = [
-        "issue retrieving real-time data",
-        "based on my expert knowledge",
-        "latest publicly available information",
-        "compiled from public sources",
-        "prior to june 2024",
-        "i can provide a report",
-        "real-time data isn't available"
-    ]
 
-    # Check if the first paragraph contains any fallback indicators
-    first_paragraph = paragraphs[0].lower()
-    if any(keyword in first_paragraph for keyword in fallback_indicators):
-        # Remove the first paragraph
-        paragraphs = paragraphs[1:]
+MULTIPLE_COMPANIES_NOTICE = "⚠️ Important Notice: To ensure clarity and depth in analysis, our AI system is designed to evaluate one company at a time. Please revise your query to reference a single organization for a precise and comprehensive report. 🏢"
 
-    # Reconstruct the response without the disclaimer
-    return "\n\n".join(paragraphs).strip()
 
+def get_http_client() -> httpx.Client:
+    """
+    Returns the process-wide keep-alive HTTP client used for OpenAI calls, creating it on first use.
+    """
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None or _http_client.is_closed:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE
+                ),
+                timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=10.0)
+            )
+        return _http_client
 
 
+def close_http_client():
+    global _http_client
+    with _http_client_lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+    # Registered clients hold the closed connection pool
+    invalidate_agents()
 
 
-def get_response_from_ai_agent(llm_id, query, allow_search):
-    # Define a list of common company suffixes
-    company_suffixes = ['Inc', 'Ltd', 'LLC', 'PLC', 'GmbH','Industries', 'AG', 'Corp', 'Corporation', 'Co', 'Pvt', 'Limited', 'Group', 'S.A.', 'S.A.S.', 'S.L.', 'S.L.U.']
+def get_tool_names(allow_search):
+    return (SEARCH_TOOL_NAME,) if allow_search else ()
 
-    # Create a regex pattern to detect company names with the defined suffixes
-    suffix_pattern = r'\b(?:[A-Z][a-zA-Z&.\'-]*\s?)+(?:' + '|'.join(company_suffixes) + r')\b'
-    # Also, detect standalone capitalized words (assuming they might be company names)
-    capitalized_pattern = r'\b[A-Z][a-zA-Z&.\'-]{2,}\b'
 
-    # Find all matches for company names in the query
-    from company_utils import extract_companies
-    potential_companies = extract_companies(query)
+def build_tools(tool_names):
+    tools = []
+    for name in tool_names:
+        if name == SEARCH_TOOL_NAME:
+            tools.append(TavilySearchResults(max_results=5))
+        else:
+            raise ValueError(f"Unknown tool: {name}")
+    return tools
 
 
-    # If more than one potential company is detected, prompt the user to specify one
-    if len(potential_companies) > 1:
-        return "⚠️ Important Notice: To ensure clarity and depth in analysis, our AI system is designed to evaluate one company at a time. Please revise your query to reference a single organization for a precise and comprehensive report. 🏢"
+def build_agent(llm_id, allow_search, prompt=DEFAULT_PROMPT, llm=None):
+    """
+    Constructs a fresh ReAct agent. Request handlers should go through get_agent instead.
+    """
+    if llm is None:
+        llm = ChatOpenAI(model=llm_id, http_client=get_http_client())
 
-    # Proceed with generating the response if only one company is detected
-    llm = ChatOpenAI(model=llm_id)
+    return create_react_agent(
+        model=llm,
+        tools=build_tools(get_tool_names(allow_search)),
+        prompt=prompt
+    )
 
-    tools = [TavilySearchResults(max_results=5)] if allow_search else []
 
-    agent = create_react_agent(
-        model=llm,
-        tools=tools,
-        state_modifier=DEFAULT_PROMPT
+def get_llm(llm_id):
+    with _registry_lock:
+        llm = _llm_registry.get(llm_id)
+        if llm is None:
+            # Queues on the same RPM/TPM budget as the direct brief completions
+            # stream_usage reports token counts on streamed runs too, for the metrics
+            llm = ChatOpenAI(model=llm_id, http_client=get_http_client(), rate_limiter=SchedulerRateLimiter(),
+                             stream_usage=True)
+            _llm_registry[llm_id] = llm
+        return llm
+
+
+def get_agent(llm_id, allow_search, prompt=DEFAULT_PROMPT):
+    """
+    Returns the compiled agent for (llm_id, tool set, prompt), building it once per process.
+    Compiled agents hold no per-request state, so one instance serves concurrent requests.
+    """
+    key = (llm_id, get_tool_names(allow_search), prompt)
+    agent = _agent_registry.get(key)
+    if agent is not None:
+        return agent
+
+    llm = get_llm(llm_id)
+    with _registry_lock:
+        agent = _agent_registry.get(key)
+        if agent is None:
+            agent = build_agent(llm_id, allow_search, prompt, llm=llm)
+            _agent_registry[key] = agent
+        return agent
+
+
+def invalidate_agents(llm_id=None):
+    """
+    Drops registered agents and LLM clients (all of them, or only those for llm_id) so the next request rebuilds them.
+    Returns the number of agents removed.
+    """
+    with _registry_lock:
+        if llm_id is None:
+            removed = len(_agent_registry)
+            _agent_registry.clear()
+            _llm_registry.clear()
+            return removed
+
+        keys = [key for key in _agent_registry if key[0] == llm_id]
+        for key in keys:
+            del _agent_registry[key]
+        _llm_registry.pop(llm_id, None)
+        return len(keys)
+
+
+def agent_flight_key(llm_id, query, allow_search, prompt=DEFAULT_PROMPT):
+    raw = "\x1f".join([normalize_company_name(query), llm_id, str(bool(allow_search)), prompt])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@instrumented("agent")
+def get_response_from_ai_agent(llm_id, query, allow_search):
+    # If more than one company is named, prompt the user to specify one
+    if contains_multiple_companies(query):
+        return MULTIPLE_COMPANIES_NOTICE
+
+    # Proceed with generating the response if only one company is detected
+    response, _ = agent_flights.do(
+        agent_flight_key(llm_id, query, allow_search),
+        partial(_invoke_agent, llm_id, query, allow_search)
     )
+    return response
+
+
+def _record_agent_usage(usage, messages):
+    # Every model turn of the run (tool calls included) counts towards the tokens
+    for message in messages:
+        metadata = getattr(message, "usage_metadata", None)
+        if metadata:
+            usage.prompt_tokens += metadata.get("input_tokens", 0)
+            usage.completion_tokens += metadata.get("output_tokens", 0)
+    record_usage(usage)
+
+
+def _invoke_agent(llm_id, query, allow_search):
+    agent = get_agent(llm_id, allow_search)
+    usage = TierUsage("agent")
+    usage.model = llm_id
+    started = time.monotonic()
 
     state = {"messages": query}
     response = agent.invoke(state)
 
     messages = response.get("messages")
+    usage.seconds = time.monotonic() - started
+    _record_agent_usage(usage, [msg for msg in messages if isinstance(msg, AIMessage)])
     ai_messages = [msg.content for msg in messages if isinstance(msg, AIMessage)]
-    return ai_messages[-1] if ai_messages else "No response generated."
+    if not ai_messages:
+        return "No response generated."
+    with timed("clean"):
+        return clean_text(ai_messages[-1])
+
 
-    
+def stream_response_from_ai_agent(llm_id, query, allow_search):
+    """
+    Streaming counterpart of get_response_from_ai_agent: yields the final answer's text as tokens arrive.
+    """
+    if contains_multiple_companies(query):
+        yield MULTIPLE_COMPANIES_NOTICE
+        return
+
+    # Callers arriving mid-answer replay what was produced so far, then follow the live tokens;
+    # the disclaimer and preamble are dropped as they stream, without waiting for the full answer
+    yield from timed_stream("agent", timed_transform("clean", clean_stream, agent_flights.stream(
+        agent_flight_key(llm_id, query, allow_search),
+        partial(_stream_agent, llm_id, query, allow_search)
+    )), streamed=True)
 
 
-    
+def _stream_agent(llm_id, query, allow_search):
+    agent = get_agent(llm_id, allow_search)
+    usage = TierUsage("agent")
+    usage.model = llm_id
+    started = time.monotonic()
+    metered = []
+
+    state = {"messages": query}
+    # "messages" mode emits LLM tokens; tool-call chunks carry no text content and are skipped
+    for chunk, metadata in agent.stream(state, stream_mode="messages"):
+        if metadata.get("langgraph_node") != "agent":
+            continue
+        if isinstance(chunk, AIMessageChunk) and chunk.usage_metadata:
+            # Token usage arrives on the last chunk of each model turn
+            metered.append(chunk)
+        if isinstance(chunk, AIMessageChunk) and isinstance(chunk.content, str) and chunk.content:
+            if usage.first_token_seconds is None:
+                usage.first_token_seconds = time.monotonic() - started
+            yield chunk.content
+    usage.seconds = time.monotonic() - started
+    _record_agent_usage(usage, metered)
@@ -1,209 +1,132 @@
-# ai_agent.py
-
-import os
-import re
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langgraph.prebuilt import create_react_agent
-from langchain_core.messages.ai import AIMessage
-
-# Load environment variables
-load_dotenv()
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-# Custom system prompt
-DEFAULT_PROMPT = (
-    "You are an expert business intelligence analyst. When given a company name, provide a detailed report with the following structure:\n\n"
-    "1. 🔍 Company Overview\n"
-    "2. 💰 Financial Summary (Revenue, Profit, Funding, etc.)\n"
-    "3. 📦 Import Activity\n"
-    "4. 🚢 Export Activity\n"
-    "5. 🌍 Global Presence & Offices\n"
-    "6. 🚛 Freight Forwarding History\n"
-    "7. 📌 Actionable Insights\n"
-    "8. 🔗 List of References (with clickable links)\n\n"
-    "i want in detail business overview ,Be clear, and use bullet points or headings for readability. Ensure references are provided within each category itself."
-)
-
-def clean_ai_response(response_text: str) -> str:
-    """
-    Removes the initial disclaimer paragraph from the AI response if it contains fallback indicators.
-    """
-    paragraphs = response_text.strip().split("\n\n")
-    fallback_indicators = [
-        "issue retrieving real-time data",
-        "based on my expert knowledge",
-        "latest publicly available information",
-        "compiled from public sources",
-        "prior to june 2024",
-        "i can provide a report",
-        "real-time data isn't available"
-    ]
-    first_paragraph = paragraphs[0].lower()
-    if any(keyword in first_paragraph for keyword in fallback_indicators):
-        paragraphs = paragraphs[1:]
-    return "\n\n".join(paragraphs).strip()
-
-def get_response_from_ai_agent(llm_id, query, allow_search=False):
-    # Define a list of common company suffixes
-    company_suffixes = ['Inc', 'Ltd', 'LLC', 'PLC', 'GmbH', 'Industries', 'AG', 'Corp', 'Corporation', 'Co', 'Pvt', 'Limited', 'Group', 'S.A.', 'S.A.S.', 'S.L.', 'S.L.U.']
-
-    suffix_pattern = r'\b(?:[A-Z][a-zA-Z&.\'-]*\s?)+(?:' + '|'.join(company_suffixes) + r')\b'
-    capitalized_pattern = r'\b[A-Z][a-zA-Z&.\'-]{2,}\b'
-
-    from company_utils import extract_companies
-    potential_companies = extract_companies(query)
-
-    if len(potential_companies) > 1:
-        return (
-            "⚠️ Important Notice: To ensure clarity and depth in analysis, "
-            "our AI system is designed to evaluate one company at a time. "
-            "Please revise your query to reference a single organization for a precise and comprehensive report. 🏢"
-        )
-
-    llm = ChatOpenAI(model=llm_id)
-
-    # No tools used, as TavilySearch is removed
-    agent = create_react_agent(
-        model=llm,
-        tools=[],  # No external tools
-        state_modifier= DEFAULT_PROMPT
-    )
-
-    state = {"messages": query}
-    response = agent.invoke(state)
-
-    messages = response.get("messages")
-    ai_messages = [msg.content for msg in messages if isinstance(msg, AIMessage)]
-    return ai_messages[-1] if ai_messages else "No response generated."
-
-# File_operations.py
-
-
+# Shared implementation: markdown-aware rendering on the branded template
+from file_operations import render_markdown_docx
 from io import BytesIO
-from docx import Document
-import uuid
-
-def generate_docx_file(content: str) -> BytesIO:
-    """
-    Converts a string (company insights) into a .docx file and returns a BytesIO object.
-    """
-    doc = Document()
-    doc.add_heading('Company Insights', 0)
-    
-    for line in content.split("\n"):
-        doc.add_paragraph(line)
-
-    buffer = BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer
-
-def generate_share_link(data: str) -> str:
-    """
-    Mocks generating a shareable link. Replace this with actual logic if needed.
-    """
-    unique_id = uuid.uuid4().hex
-    # In real case, you'd store data in a database or pastebin-like service
-    return f"https://mocksharelink.com/report/{unique_id}"
-
-
-# Company_utils.py
-
-
-
-import re
-
-try:
-    import spacy
-    nlp = spacy.load("en_core_web_sm")
-    USE_SPACY = True
-except ImportError:
-    USE_SPACY = False
-
-company_suffixes = [
-    'Inc', 'Ltd', 'LLC', 'PLC', 'GmbH', 'Industries', 'AG', 'Corp',
-    'Corporation', 'Co', 'Pvt', 'Limited', 'Group', 'S.A.', 'S.A.S.', 'S.L.', 'S.L.U.'
-]
-
-# Suffix-based pattern (case insensitive)
-suffix_pattern = r'\b([A-Za-z][\w&.\'-]*(?:\s+[A-Za-z][\w&.\'-]*)*\s+(?:' + '|'.join(company_suffixes) + r'))\b'
-
-# Capitalized phrase pattern (case insensitive)
-capitalized_pattern = r'\b(?:[A-Za-z][a-zA-Z&.\'-]+(?:\s+[A-Za-z][a-zA-Z&.\'-]+){0,3})\b'
-
-def extract_companies(text: str):
-    companies = set()
-
-    # 1. From suffix-based regex (case insensitive)
-    suffix_matches = re.findall(suffix_pattern, text)
-    companies.update([m.strip() for m in suffix_matches if m.strip()])
-
-    # 2. From capitalized word phrases (case insensitive)
-    capitalized_matches = re.findall(capitalized_pattern, text)
-    companies.update([m.strip() for m in capitalized_matches if m.strip()])
-
-    # 3. From spaCy NER if available
-    if USE_SPACY:
-        doc = nlp(text)
-        ner_matches = [ent.text.strip() for ent in doc.ents if ent.label_ == "ORG"]
-        companies.update(ner_matches)
-
-    return list(companies)  # Will keep case-sensitive company names intact
 
 
 
 # frontend.py
 import streamlit as st
 import openai
-import base64
-import requests
-from PIL import Image
-from io import BytesIO
-from docx import Document
-import re
 
 
 
 # === Setup OpenAI client using new SDK style ===
 from openai import OpenAI
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
+from openai_scheduler import INTERACTIVE, ScheduledOpenAI, default_scheduler
+# Interactive searches are admitted ahead of batch and prefetch work under the shared API budget
+client = ScheduledOpenAI(OpenAI(api_key=st.secrets["OPENAI_API_KEY"]), priority=INTERACTIVE)
+
+from brief_cache import BriefCache, normalize_company_name
+from brief_pipeline import (
+    BRIEF_MODEL, BRIEF_SECTIONS, EXPANDED_PROMPT_VERSION, FULL_TIER, PROMPT_VERSION, SECTIONED_PROMPT_VERSION,
+    SNAPSHOT_MODEL, SNAPSHOT_PROMPT_VERSION, SNAPSHOT_TIER, TierUsage, brief_flights, coalesced_brief,
+    coalesced_brief_stream, coalesced_expansion_stream, coalesced_snapshot_stream, complete_brief_sectioned,
+    lookup_cached_brief, lookup_similar_brief, section_title
+)
+from structured_brief import (
+    SECTION_KEYS, STRUCTURED_PROMPT_VERSION, StructuredBrief, coalesced_structured_brief, load_section, load_sections,
+    render_brief, render_section
+)
+from query_index import CachedQueryIndex
+from company_utils import contains_multiple_companies
+from file_operations import cached_docx_bytes, docx_cache, generate_share_link
+from postprocess import clean_text
+from functools import partial
+from assets import logo_data_uri
+from history_store import HistoryStore
+from report_store import ReportRef, report_digest, report_store
+from share_server import SHARE_BASE_URL_CONFIGURED, SHARE_BASE_URL_MISSING, SHARE_SERVER_AUTOSTART, start_background_server
+from popularity_store import PopularityStore
+from prewarm import PREWARM_AUTOSTART, start_background_prewarm
+from metrics import instrumented, record_cache, registry as metrics_registry
+from batch_briefs import SUMMARY_FILE, batch_job, load_checkpoint, read_accounts, start_batch_job
+import logging
+import os
+import time
+import uuid
+import zipfile
+
+# Latency-policy decisions (hedges, first-token times) are logged under "customerbrief.*"
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+@st.cache_resource
+def get_brief_cache():
+    # One cache per process, shared by every session
+    return BriefCache()
+
+@st.cache_resource
+def get_popularity_store():
+    return PopularityStore()
+
+@st.cache_resource
+def get_prewarm_thread():
+    # Off-peak refresh of the hottest accounts; in-process, so it queues behind this app's searches
+    if not PREWARM_AUTOSTART:
+        return None
+    return start_background_prewarm(client, get_brief_cache(), get_popularity_store())
+
+@st.cache_resource
+def get_query_index(model, prompt_version):
+    # Near-duplicate lookup over the cached briefs of one tier, shared by every session
+    return CachedQueryIndex(get_brief_cache(), model, prompt_version)
 
 # --- Helper Functions ---
 def clean_response(text):
-    cleaned_text = re.sub(
-        r"(🧠 Company Analysis\s*)(.*?)(?=\n\s*1\.\s*[🔍A-Z])",
-        r"\1\n",
-        text,
-        flags=re.DOTALL
-    )
-    return cleaned_text.strip()
+    return clean_text(text)
+
+def format_age(seconds):
+    if seconds < 60:
+        return f"{int(seconds)}s"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} min"
+    if seconds < 86400:
+        return f"{int(seconds // 3600)} h"
+    return f"{int(seconds // 86400)} d"
 
 def slugify(text):
     return "".join(c if c.isalnum() else "_" for c in text.lower()).strip("_")
 
+@instrumented("generate_docx")
 def generate_docx(query, response):
-    doc = Document()
-    doc.add_heading("CustomerBrief", level=1)
-    doc.add_paragraph(f"Query: {query}")
-    doc.add_paragraph("Response:")
-    doc.add_paragraph(response)
-    buffer = BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer
-
-def contains_multiple_companies(query):
-    delimiters = [",", "&", " and ", "/", " vs ", " versus ", ";"]
-    count = sum([query.lower().count(d) for d in delimiters])
-    return count >= 1
-
+    return render_markdown_docx(response, title="CustomerBrief", subtitle=f"Query: {query}")
+
+def docx_download(query, response):
+    # Built only when the download is clicked, and at most once per distinct report
+    return partial(cached_docx_bytes, "app.generate_docx", generate_docx, query, response)
+
+def section_docx(query, key):
+    # Re-rendered from the one cached section; the rest of the report is neither loaded nor reparsed
+    section = load_section(get_brief_cache(), query, key)
+    if section is None:
+        return b""
+    return cached_docx_bytes("app.generate_docx", generate_docx, query, render_section(key, section))
+
+def load_report(ref, owner_id):
+    # Served from the shared in-memory store; the history store is only read after an eviction
+    return report_store.get(ref, loader=partial(get_history_store().get_body, owner_id, ref.entry_id))
+
+def report_docx(ref, owner_id):
+    # The report is only loaded when its download is clicked
+    body = load_report(ref, owner_id)
+    if body is None:
+        return b""
+    return cached_docx_bytes("app.generate_docx", generate_docx, ref.query, body)
+
+@st.cache_resource
+def get_share_server():
+    # One server per process; if the port is taken, another process is already serving the shares
+    return start_background_server() if SHARE_SERVER_AUTOSTART else None
+
+def create_share_link(query, response):
+    get_share_server()
+    st.session_state.share_links[report_digest(response)] = generate_share_link(response, title=query)
 
         
  # Show response only once
-def show_download_buttons(query, response, key_prefix="main"):
-    st.markdown("### 🧠 Company Analysis")
+def show_download_buttons(query, response, key_prefix="main", streamed=False):
+    # A streamed response has already been rendered token by token, so only the download is added
+    if not streamed:
+        st.markdown("### 🧠 Company Analysis")
 
     if contains_multiple_companies(query):
         # Show the warning only once
@@ -217,19 +140,20 @@ def show_download_buttons(query, response, key_prefix="main"):
 
     else:
         file_name = f"{slugify(query)}.docx"
-        docx_file = generate_docx(query, response)
-
-        # Top download button
-        st.download_button(
-            label="📥 Download Analysis",
-            data=docx_file,
-            file_name=file_name,
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            key=f"{key_prefix}_download_top"
-        )
+        docx_file = docx_download(query, response)
+
+        if not streamed:
+            # Top download button
+            st.download_button(
+                label="📥 Download Analysis",
+                data=docx_file,
+                file_name=file_name,
+                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                key=f"{key_prefix}_download_top"
+            )
 
-        # Show response
-        st.write(response)
+            # Show response
+            st.write(response)
 
         # Bottom download button
         st.download_button(
@@ -240,6 +164,15 @@ def show_download_buttons(query, response, key_prefix="main"):
             key=f"{key_prefix}_download_bottom"
         )
 
+        # Published once per distinct report and served as static HTML by the share server
+        if not SHARE_BASE_URL_CONFIGURED:
+            st.warning(SHARE_BASE_URL_MISSING)
+        else:
+            st.button("🔗 Share", key=f"{key_prefix}_share", on_click=create_share_link, args=(query, response))
+            share_link = st.session_state.share_links.get(report_digest(response))
+            if share_link:
+                st.code(share_link, language=None)
+
 # --- Streamlit Config ---
 st.set_page_config(
     page_title="CustomerBrief",
@@ -268,20 +201,52 @@ st.markdown("""
 
 
 # --- Logo Setup ---
-logo_url = "https://raw.githubusercontent.com/aakashs227/CustomerBrief/main/WORLDWIDE_Logo%207.png"
-try:
-    logo_img = Image.open(BytesIO(requests.get(logo_url).content))
-    buffered = BytesIO()
-    logo_img.save(buffered, format="PNG")
-    logo_base64 = base64.b64encode(buffered.getvalue()).decode()
-except Exception as e:
-    st.error(f"Logo loading error: {e}")
-    logo_base64 = ""
+# Bundled file or disk cache, encoded once per process (no network call per rerun)
+logo_uri = logo_data_uri()
+if not logo_uri:
+    st.error("Logo loading error: the logo is neither bundled nor cached locally.")
+
+get_prewarm_thread()
+if metrics_registry.enabled:
+    # /metrics is served by the in-process share server, so start it up front rather than on first share
+    get_share_server()
+
+@st.cache_resource
+def get_history_store():
+    return HistoryStore()
+
+def get_owner_id():
+    # Kept in the URL so a reconnecting (or reloaded) browser finds its history again
+    owner_id = st.query_params.get("uid")
+    if not owner_id:
+        owner_id = uuid.uuid4().hex
+        st.query_params["uid"] = owner_id
+    return owner_id
+
+def record_history(query, response):
+    entry_id = get_history_store().add(get_owner_id(), query, response)
+    # The session keeps a small reference; identical reports across sessions are stored once
+    st.session_state.viewed_report = report_store.put(response, query, entry_id)
+    st.session_state.history_page = 0
+
+def reset_history_page():
+    st.session_state.history_page = 0
 
 # --- Initialize State ---
-for key in ["chat_history", "last_query", "selected_menu"]:
+for key in ["last_query", "selected_menu"]:
     if key not in st.session_state:
-        st.session_state[key] = [] if "history" in key else ""
+        st.session_state[key] = ""
+if "history_page" not in st.session_state:
+    st.session_state.history_page = 0
+if "viewed_report" not in st.session_state:
+    st.session_state.viewed_report = None
+if "share_links" not in st.session_state:
+    st.session_state.share_links = {}
+if "snapshot" not in st.session_state:
+    # (query, text) of the latest snapshot, kept so it can be expanded into the full brief
+    st.session_state.snapshot = None
+if "tier_usage" not in st.session_state:
+    st.session_state.tier_usage = {}
 
 # --- Sidebar ---
 with st.sidebar:
@@ -290,39 +255,72 @@ with st.sidebar:
         st.markdown(
             f"""
             <div style="background-color: white; padding: 3px; display: inline-block; border-radius: 8px;">
-                <img src="data:image/png;base64,{logo_base64}" width="120"/>
+                <img src="{logo_uri}" width="120"/>
             </div>
             """, unsafe_allow_html=True
         )
     st.markdown("---")
     st.markdown("<h3 style='color: white;'>Chat History</h3>", unsafe_allow_html=True)
 
-    for i, (q, a) in enumerate(reversed(st.session_state.chat_history)):
-        idx = len(st.session_state.chat_history) - 1 - i
+    history_store = get_history_store()
+    owner_id = get_owner_id()
+    history_search = st.text_input("Search history", placeholder="🔎 Search history", key="history_search",
+                                   label_visibility="collapsed", on_change=reset_history_page)
+
+    # Only one page of metadata rows is read per rerun; report bodies stay in the store
+    history_page = history_store.page(owner_id, st.session_state.history_page, search=history_search.strip())
+    st.session_state.history_page = history_page.page
+
+    for entry in history_page.entries:
         col1, col2 = st.columns([0.85, 0.15])
         with col1:
-            st.markdown(f"<div class='chat-history-item'>• {q[:50]}</div>", unsafe_allow_html=True)
+            st.markdown(f"<div class='chat-history-item'>• {entry.query[:50]}</div>", unsafe_allow_html=True)
         with col2:
-            if st.button("⋮", key=f"menu_{i}"):
-                st.session_state.selected_menu = idx
-        if st.session_state.get("selected_menu") == idx:
+            if st.button("⋮", key=f"menu_{entry.id}"):
+                st.session_state.selected_menu = entry.id
+        if st.session_state.get("selected_menu") == entry.id:
             bcols = st.columns(3)
             with bcols[0]:
-                if st.button(" View", key=f"view_{i}"):
-                    st.session_state.last_query = q
+                if st.button(" View", key=f"view_{entry.id}"):
+                    st.session_state.viewed_report = ReportRef(entry.digest, entry.query, entry.characters, entry.id)
                     st.session_state.selected_menu = None
                     st.rerun()
             with bcols[1]:
-                docx = generate_docx(q, a)
-                st.download_button("⬇️", data=docx, file_name=f"{slugify(q)}.docx",
+                st.download_button("⬇️", data=partial(report_docx, ReportRef(entry.digest, entry.query, entry.characters, entry.id), owner_id),
+                                   file_name=f"{slugify(entry.query)}.docx",
                                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                                   key=f"download_{i}")
+                                   key=f"download_{entry.id}")
             with bcols[2]:
-                if st.button(" Delete", key=f"delete_{i}"):
-                    st.session_state.chat_history.pop(idx)
+                if st.button(" Delete", key=f"delete_{entry.id}"):
+                    history_store.delete(owner_id, entry.id)
+                    if st.session_state.viewed_report and st.session_state.viewed_report.entry_id == entry.id:
+                        st.session_state.viewed_report = None
                     st.session_state.selected_menu = None
                     st.rerun()
 
+    if history_page.page_count > 1:
+        col_prev, col_page, col_next = st.columns([0.3, 0.4, 0.3])
+        with col_prev:
+            if st.button("◀", key="history_prev", disabled=not history_page.has_previous):
+                st.session_state.history_page -= 1
+                st.rerun()
+        with col_page:
+            st.markdown(f"<div class='chat-history-item'>{history_page.page + 1} / {history_page.page_count}</div>",
+                        unsafe_allow_html=True)
+        with col_next:
+            if st.button("▶", key="history_next", disabled=not history_page.has_next):
+                st.session_state.history_page += 1
+                st.rerun()
+    elif not history_page.entries and history_search.strip():
+        st.caption("No matching briefs.")
+
+    # Shared per-process stores and counters, for sizing deployments (open the app with ?debug=1)
+    if st.query_params.get("debug"):
+        with st.expander("🧮 Process stats"):
+            st.json({"reports": report_store.stats(), "docx": docx_cache.stats(), "coalescing": brief_flights.stats(),
+                     "openai_scheduler": default_scheduler.stats(), "popularity": get_popularity_store().stats(),
+                     "metrics": metrics_registry.snapshot() if metrics_registry.enabled else "disabled"})
+
 # --- Welcome Banner ---
 st.markdown("""
     <div style='background-color: #f4f4f4; padding: 25px; border-radius: 10px; margin-bottom: 30px;'>
@@ -333,95 +331,394 @@ st.markdown("""
     </div>
 """, unsafe_allow_html=True)
 
-# --- Query Input ---
-user_query = st.text_input(
-    label="", placeholder="Enter company name or market query...", label_visibility="collapsed"
-)
-search_clicked = st.button("🔍 Search")
+# --- Near-Duplicate Queries ---
+def queue_search(query, fuzzy):
+    st.session_state.queued_search = (query, fuzzy)
 
+def lookup_brief(query, prompt_version, model=BRIEF_MODEL, fuzzy=True):
+    """
+    Returns the cached brief for the query, or for a near-duplicate of it ("Apple Inc." for "apple brief").
+    When the closest match is only similar, a "did you mean" prompt is shown and False is returned:
+    the caller should stop, as no brief is generated until the user picks one.
+    """
+    cache = get_brief_cache()
+    cached = lookup_cached_brief(cache, query, prompt_version, model)
+    if cached is not None or not fuzzy:
+        record_cache("brief", "hit" if cached is not None else "miss")
+        return cached
+    similar, match = lookup_similar_brief(cache, get_query_index(model, prompt_version), query, prompt_version, model)
+    record_cache("brief", "fuzzy_hit" if similar is not None else "suggested" if match is not None else "miss")
+    if similar is None and match is not None:
+        st.info(f"🤔 Did you mean **{match.company}**? A brief for it is already available.")
+        col_open, col_new = st.columns(2)
+        with col_open:
+            st.button(f"Open the brief for {match.company}", key="suggestion_open",
+                      on_click=queue_search, args=(match.company, True))
+        with col_new:
+            st.button(f"Generate a new brief for {query}", key="suggestion_new",
+                      on_click=queue_search, args=(query, False))
+        return False
+    return similar
+
+def describe_cache_hit(query, cached):
+    source = "cache" if normalize_company_name(cached.query) == normalize_company_name(query) \
+        else f"the brief for **{cached.query}**"
+    return f"⚡ Served from {source} (generated {format_age(cached.age_seconds)} ago). Tick **Force refresh** to regenerate."
 
 # --- Handle Query with Detailed Business Overview ---
-def process_with_openai(query):
-    with st.spinner("🔍 Analyzing the business..."):
-        try:
-            # System prompt designed for up-to-date, detailed company analysis
-            messages = [
-                {"role": "system", "content": (
-                    "You are CustomerBrief, an expert market analyst. "
-                    "Provide a clear, structured, and insightful business analysis of any company using the most recent and relevant data available.\n\n"
-                    "Your response must include:\n\n"
-                    "1. 🏢 Company Overview\n"
-                    "2. 💰 Financial Summary (revenue, profit, funding, etc.)\n"
-                    "3. 🌍 Market & Industry Position\n"
-                    "4. 📦 Import Activity\n"
-                    "5. 🚢 Export Activity\n"
-                    "6. 🌍 Global Presence & Office Locations\n"
-                    "7. 🚛 Freight Forwarding History\n"
-                    "8. 🔍 Competitive Landscape\n"
-                    "9. 📈 Recent Developments or Strategic Moves\n"
-                    "10. 🧠 Actionable Insights & Recommendations\n"
-                    "11. 🔗 Source Links (insert relevant links within each section if available)\n\n"
-                    "Be factual, neutral, and use bullet points or sub-sections for clarity. "
-                    "Use the most current information and trends available at the time of analysis. "
-                    "If some data is estimated or not publicly available, clearly mention that."
-                )},
-                {"role": "user", "content": query}
-            ]
-
-            response = client.chat.completions.create(
-                model="gpt-4.1-2025-04-14",  # Use whichever model your system prefers
-                messages=messages,
-                temperature=0.4
-            )
-
-            result = response.choices[0].message.content.strip()
+@instrumented("process_with_openai")
+def process_with_openai(query, force_refresh=False, stream=False, parallel_sections=False, fuzzy=True):
+    cache = get_brief_cache()
+    prompt_version = SECTIONED_PROMPT_VERSION if parallel_sections else PROMPT_VERSION
+
+    # Serve repeated accounts, and near-duplicate spellings of them, from the shared brief cache
+    if not force_refresh:
+        cached = lookup_brief(query, prompt_version, fuzzy=fuzzy)
+        if cached is False:
+            return
+        # Request frequency and recency drive the pre-warm job, which keeps the regular full brief fresh
+        get_popularity_store().record(cached.query if cached is not None else query,
+                                      cached=cached is not None and prompt_version == PROMPT_VERSION)
+        if cached is not None:
+            st.info(describe_cache_hit(query, cached))
+            show_download_buttons(query, cached.text)
+            record_history(query, cached.text)
+            return
+    else:
+        record_cache("brief", "bypass")
+        get_popularity_store().record(query, cached=False)
+
+    try:
+        if parallel_sections:
+            # All sections are requested at once; the brief is assembled once the slowest lands
+            section_progress = st.progress(0.0, text="🔍 Analyzing the business section by section...")
+            ready = []
+
+            def mark_section_ready(index, text):
+                ready.append(index)
+                section_progress.progress(len(ready) / len(BRIEF_SECTIONS),
+                                          text=f"✔️ {section_title(index)} ({len(ready)}/{len(BRIEF_SECTIONS)})")
+
+            # Another session already generating this account is joined instead (its progress is not shown)
+            result, _ = coalesced_brief(client, query, cache, prompt_version,
+                                        complete=partial(complete_brief_sectioned, on_section=mark_section_ready))
+            section_progress.empty()
+            stream = False
+        elif stream:
+            # Sections appear as tokens arrive; the download is offered once the stream completes
+            st.markdown("### 🧠 Company Analysis")
+            result = st.write_stream(coalesced_brief_stream(client, query, cache, prompt_version)).strip()
+        else:
+            with st.spinner("🔍 Analyzing the business..."):
+                result, _ = coalesced_brief(client, query, cache, prompt_version)
 
-            st.success("✅ Analysis Complete")
-            show_download_buttons(query, result)
-            st.session_state.chat_history.append((query, result))
+        get_query_index(BRIEF_MODEL, prompt_version).add(query)
+        st.success("✅ Analysis Complete")
+        st.caption("🆕 Freshly generated (cache miss)" if not force_refresh else "🔄 Regenerated (cache refreshed)")
+        show_download_buttons(query, result, streamed=stream)
+        record_history(query, result)
 
-        except Exception as e:
-            st.error(f"❌ OpenAI API Error: {e}")
+    except openai.RateLimitError:
+        st.error("⏳ OpenAI is rate limiting requests right now, even after retrying. Please try again in a minute.")
+    except Exception as e:
+        st.error(f"❌ OpenAI API Error: {e}")
 
 
+# --- Tiered Briefs: Snapshot, Expandable to the Full Deep-Dive ---
+TIER_LABELS = {SNAPSHOT_TIER: "⚡ Snapshot", FULL_TIER: "📚 Full brief"}
 
+def show_tier_usage():
+    for tier, usage in st.session_state.tier_usage.items():
+        st.caption(f"{TIER_LABELS[tier]}: {usage.describe() if usage is not None else 'served from cache'}")
 
-# --- Run on Click ---
-if search_clicked or (user_query and user_query != st.session_state.last_query):
-    if user_query.strip():
-        import re
-        query = user_query.strip()
+def request_expansion(query):
+    st.session_state.expand_query = query
 
-        # Heuristic: multiple separators or more than 5 capitalized "words"
-        multi_company_separators = [" and ", ",", " vs ", "/", " versus "]
-        has_multiple_separators = any(sep in query.lower() for sep in multi_company_separators)
+def show_expand_button(query, key_prefix="main"):
+    st.button("📚 Expand to full brief", key=f"{key_prefix}_expand", on_click=request_expansion, args=(query,),
+              help="Generate the remaining sections; the snapshot is kept as the overview.")
 
-        # Detect capitalized words (common in company names)
-        company_like_keywords = re.findall(r"\b[A-Z][a-zA-Z&.\-']{2,}\b", query)
-        likely_multiple_companies = len(company_like_keywords) > 5
+def run_tier(usage, stream, chunks):
+    # Renders the chunks (streamed, or in one piece behind a spinner) and returns the text
+    started = time.monotonic()
+    if stream:
+        st.markdown("### 🧠 Company Analysis")
+        text = st.write_stream(chunks).strip()
+    else:
+        with st.spinner("🔍 Analyzing the business..."):
+            text = "".join(chunks).strip()
+    if usage.model is None:
+        # Joined another session's request: only the wait is ours
+        usage.seconds = time.monotonic() - started
+    return text
+
+@instrumented("process_snapshot")
+def process_snapshot(query, force_refresh=False, stream=False, fuzzy=True):
+    cache = get_brief_cache()
+    st.session_state.tier_usage = {}
+
+    cached = None if force_refresh else lookup_brief(query, SNAPSHOT_PROMPT_VERSION, SNAPSHOT_MODEL, fuzzy)
+    if force_refresh:
+        record_cache("brief", "bypass")
+    if cached is False:
+        return
+    try:
+        if cached is not None:
+            text = cached.text
+            st.info(describe_cache_hit(query, cached))
+            st.session_state.tier_usage[SNAPSHOT_TIER] = None
+        else:
+            usage = TierUsage(SNAPSHOT_TIER)
+            text = run_tier(usage, stream, coalesced_snapshot_stream(client, query, cache, usage))
+            st.session_state.tier_usage[SNAPSHOT_TIER] = usage
+            get_query_index(SNAPSHOT_MODEL, SNAPSHOT_PROMPT_VERSION).add(query)
+    except openai.RateLimitError:
+        st.error("⏳ OpenAI is rate limiting requests right now, even after retrying. Please try again in a minute.")
+        return
+    except Exception as e:
+        st.error(f"❌ OpenAI API Error: {e}")
+        return
+
+    st.session_state.snapshot = (query, text)
+    show_tier_usage()
+    show_download_buttons(query, text, streamed=stream and cached is None)
+    show_expand_button(query)
+    record_history(query, text)
+
+def expand_snapshot(query, stream=False):
+    snapshot = st.session_state.snapshot
+    if snapshot is None or snapshot[0] != query:
+        # The snapshot is gone (e.g. a new session); fall back to a regular full brief
+        process_with_openai(query, stream=stream)
+        return
+
+    cache = get_brief_cache()
+    # An existing full brief (e.g. from a regular search or the pre-warm job) is served instead of expanding
+    cached = lookup_cached_brief(cache, query, EXPANDED_PROMPT_VERSION) or lookup_cached_brief(cache, query)
+    try:
+        if cached is not None:
+            text = cached.text
+            st.session_state.tier_usage[FULL_TIER] = None
+        else:
+            usage = TierUsage(FULL_TIER)
+            # The snapshot is reused as the overview, so it renders at once and only the rest is generated
+            text = run_tier(usage, stream, coalesced_expansion_stream(client, query, snapshot[1], cache, usage))
+            st.session_state.tier_usage[FULL_TIER] = usage
+    except openai.RateLimitError:
+        st.error("⏳ OpenAI is rate limiting requests right now, even after retrying. Please try again in a minute.")
+        return
+    except Exception as e:
+        st.error(f"❌ OpenAI API Error: {e}")
+        return
+
+    st.success("✅ Analysis Complete")
+    show_tier_usage()
+    show_download_buttons(query, text, streamed=stream and cached is None)
+    record_history(query, text)
+
+
+# --- Structured Briefs: Typed Sections, Stored and Rendered One by One ---
+def show_structured_brief(query, brief, key_prefix="main"):
+    st.markdown("### 🧠 Company Analysis")
+    for index, (key, section) in enumerate(brief.sections()):
+        st.markdown(render_section(key, section))
+        st.download_button(
+            label=f"📥 {section_title(index)}",
+            data=partial(section_docx, query, key),
+            file_name=f"{slugify(query)}_{key}.docx",
+            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            key=f"{key_prefix}_section_{key}"
+        )
 
-        if has_multiple_separators or likely_multiple_companies:
-            st.warning("⚠️ **Important Notice:** To ensure clarity and depth in analysis, our AI system is designed to evaluate one company at a time. "
-                       "Please revise your query to reference a single organization for a precise and comprehensive report. 🏢")
+@instrumented("process_structured")
+def process_structured(query, force_refresh=False, fuzzy=True):
+    cache = get_brief_cache()
+    st.session_state.tier_usage = {}
+
+    cached = None if force_refresh else lookup_brief(query, STRUCTURED_PROMPT_VERSION, fuzzy=fuzzy)
+    if force_refresh:
+        record_cache("brief", "bypass")
+    if cached is False:
+        return
+    get_popularity_store().record(cached.query if cached is not None else query, cached=False)
+
+    # A near-duplicate hit is served from (and downloads its sections from) the matched company's entry
+    source, brief = query, None
+    if cached is not None:
+        sections = load_sections(cache, cached.query)
+        if len(sections) == len(SECTION_KEYS):
+            source, brief = cached.query, StructuredBrief(**sections)
+            st.info(describe_cache_hit(query, cached))
+    try:
+        if brief is None:
+            with st.spinner("🔍 Analyzing the business..."):
+                brief, _ = coalesced_structured_brief(client, query, cache)
+            get_query_index(BRIEF_MODEL, STRUCTURED_PROMPT_VERSION).add(query)
+            st.success("✅ Analysis Complete")
+    except openai.RateLimitError:
+        st.error("⏳ OpenAI is rate limiting requests right now, even after retrying. Please try again in a minute.")
+        return
+    except Exception as e:
+        st.error(f"❌ OpenAI API Error: {e}")
+        return
+
+    text = render_brief(brief)
+    show_structured_brief(source, brief)
+    # The sections are already on screen, so only the full download and sharing are added
+    show_download_buttons(query, text, streamed=True)
+    record_history(query, text)
+
+
+# --- Tabs ---
+search_tab, batch_tab = st.tabs(["🔍 Search", "📂 Batch"])
+
+with search_tab:
+    # --- Query Input ---
+    user_query = st.text_input(
+        label="", placeholder="Enter company name or market query...", label_visibility="collapsed"
+    )
+    brief_mode = st.radio("Brief mode", [SNAPSHOT_TIER, FULL_TIER], index=1, horizontal=True,
+                          format_func=lambda tier: {SNAPSHOT_TIER: "⚡ Snapshot (30-second overview)",
+                                                    FULL_TIER: "📚 Full deep-dive"}[tier],
+                          label_visibility="collapsed")
+    col_search, col_refresh, col_stream, col_parallel, col_structured = st.columns([0.16, 0.21, 0.21, 0.21, 0.21])
+    with col_search:
+        search_clicked = st.button("🔍 Search")
+    with col_refresh:
+        force_refresh = st.checkbox("🔄 Force refresh", help="Ignore the cached brief and generate a new one.")
+    with col_stream:
+        stream_output = st.toggle("⚡ Stream response", value=True, help="Render the analysis as it is being written.")
+    with col_parallel:
+        parallel_sections = st.toggle("🧩 Parallel sections", value=False,
+                                      help="Generate all sections concurrently; the brief appears once every section is ready.")
+    with col_structured:
+        structured_sections = st.toggle("🧱 Structured sections", value=False,
+                                        help="Full deep-dive as typed sections, each stored and downloadable on its own. "
+                                             "Not streamed.")
+
+
+    def run_search(query, fuzzy=True):
+        if brief_mode == SNAPSHOT_TIER:
+            process_snapshot(query, force_refresh=force_refresh, stream=stream_output, fuzzy=fuzzy)
+        elif structured_sections:
+            process_structured(query, force_refresh=force_refresh, fuzzy=fuzzy)
         else:
-            st.session_state.last_query = query
-            process_with_openai(query)
-    else:
-        st.warning("Please enter a valid query.")
+            st.session_state.tier_usage = {}
+            process_with_openai(query, force_refresh=force_refresh, stream=stream_output,
+                                parallel_sections=parallel_sections, fuzzy=fuzzy)
+
+    # --- Run on Click ---
+    searched = False
+    expand_query = st.session_state.pop("expand_query", None)
+    # Set by the "did you mean" buttons: the suggested company, or the original query without fuzzy matching
+    queued_search = st.session_state.pop("queued_search", None)
+    if expand_query:
+        searched = True
+        expand_snapshot(expand_query, stream=stream_output)
+    elif queued_search:
+        searched = True
+        run_search(*queued_search)
+    elif search_clicked or (user_query and user_query != st.session_state.last_query):
+        if user_query.strip():
+            query = user_query.strip()
+
+            if contains_multiple_companies(query):
+                st.warning("⚠️ **Important Notice:** To ensure clarity and depth in analysis, our AI system is designed to evaluate one company at a time. "
+                           "Please revise your query to reference a single organization for a precise and comprehensive report. 🏢")
+            else:
+                st.session_state.last_query = query
+                searched = True
+                run_search(query)
+        else:
+            st.warning("Please enter a valid query.")
+
+
+
+
+    # --- Reload the Viewed Entry ---
+    # A fresh search has already rendered its result in this run
+    viewed = st.session_state.viewed_report
+    if viewed is not None and not searched:
+        viewed_body = load_report(viewed, get_owner_id())
+        if viewed_body is not None:
+            st.markdown(f"### **User Query:** {viewed.query}")
+            if st.session_state.snapshot == (viewed.query, viewed_body):
+                show_tier_usage()
+            show_download_buttons(viewed.query, viewed_body, key_prefix=f"history_{viewed.entry_id}")
+            if st.session_state.snapshot == (viewed.query, viewed_body):
+                show_expand_button(viewed.query, key_prefix=f"history_{viewed.entry_id}")
 
 
+# --- Batch Upload ---
+BATCH_REFRESH_SECONDS = 2
 
 
-# --- Reload Last Output if Exists ---
-if (
-    st.session_state.last_query
-    and not search_clicked
-    and st.session_state.last_query not in [q for q, _ in st.session_state.chat_history[-1:]]
-):
-    # Only show saved last query result if NOT a fresh search submission
-    for idx, (q, a) in enumerate(reversed(st.session_state.chat_history)):
-        if q == st.session_state.last_query:
-            st.markdown(f"### **User Query:** {q}")
-            show_download_buttons(q, a, key_prefix=f"history_{idx}_{slugify(q)[:30]}")
+@st.fragment(run_every=BATCH_REFRESH_SECONDS)
+def show_batch_progress(job):
+    # Only this fragment re-runs while the job works, so searching in the other tab is not interrupted
+    if not job.running:
+        st.rerun()
+    st.progress(job.fraction)
+    progress = job.progress
+    st.markdown(f"{progress.describe()} — last: {job.last_account}" if progress is not None else "Starting…")
 
 
+with batch_tab:
+    st.markdown("Upload a CSV or Excel list of accounts to generate one brief per account.")
+    uploaded_accounts = st.file_uploader("Account list", type=["csv", "xlsx"], label_visibility="collapsed")
+
+    if uploaded_accounts is not None:
+        try:
+            uploaded_accounts.seek(0)
+            accounts = read_accounts(uploaded_accounts, file_name=uploaded_accounts.name)
+        except Exception as e:
+            st.error(f"❌ Could not read the account list: {e}")
+            accounts = []
+
+        if accounts:
+            batch_dir = os.path.join("batch_output", slugify(os.path.splitext(uploaded_accounts.name)[0]))
+            already_done = len(load_checkpoint(batch_dir))
+            st.write(f"**{len(accounts)}** accounts found" +
+                     (f", **{already_done}** already completed in a previous run (will resume)." if already_done else "."))
+            col_workers, col_rpm = st.columns(2)
+            with col_workers:
+                batch_workers = st.slider("Parallel briefs", 1, 16, 4)
+            with col_rpm:
+                batch_rpm = st.number_input("Max requests per minute", min_value=1, max_value=10000, value=60)
+
+            # The batch runs on a background thread of the server, so reruns and leaving the page do not stop it;
+            # if the server itself restarts, starting again resumes from the checkpoint
+            job = batch_job(batch_dir)
+            if job is not None and job.running:
+                st.info("⏳ Batch running in the background. You can keep searching and come back to this tab.")
+                show_batch_progress(job)
+            else:
+                if job is not None and job.error is not None:
+                    st.error(f"❌ The batch stopped: {job.error}. Resume to continue from the last finished account.")
+                elif job is not None and st.session_state.get("batch_result_dir") == batch_dir:
+                    st.success("✅ Batch complete")
+                if st.button(f"▶️ Resume batch ({already_done} done)" if already_done else "🚀 Start batch"):
+                    start_batch_job(
+                        accounts, batch_dir, client,
+                        workers=batch_workers,
+                        requests_per_minute=batch_rpm,
+                        cache=get_brief_cache()
+                    )
+                    st.session_state.batch_result_dir = batch_dir
+                    st.rerun()
+
+            if (st.session_state.get("batch_result_dir") == batch_dir and not (job is not None and job.running)
+                    and os.path.exists(os.path.join(batch_dir, SUMMARY_FILE))):
+                with open(os.path.join(batch_dir, SUMMARY_FILE), "rb") as f:
+                    st.download_button(
+                        "📊 Download summary workbook", data=f.read(), file_name=f"{os.path.basename(batch_dir)}_summary.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                    )
+                zip_buffer = BytesIO()
+                with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+                    for name in sorted(os.listdir(os.path.join(batch_dir, "docx"))):
+                        archive.write(os.path.join(batch_dir, "docx", name), arcname=name)
+                st.download_button(
+                    "📦 Download all briefs (.zip)", data=zip_buffer.getvalue(),
+                    file_name=f"{os.path.basename(batch_dir)}_briefs.zip", mime="application/zip"
+                )
@@ -0,0 +1,172 @@
+# assets.py
+"""
+Process-wide cache for static UI assets (currently the company logo).
+
+Lookup order for an asset:
+1. The file bundled with the repository, if present
+2. The copy in the on-disk asset cache (ASSET_CACHE_DIR)
+3. The remote URL, fetched once and written to the disk cache
+
+A cached remote copy older than ASSET_REVALIDATE_SECONDS is revalidated with a
+conditional GET (If-None-Match / If-Modified-Since); if the network is
+unreachable, or ASSET_OFFLINE is set, the cached copy is served as is.
+Encoded data URIs are computed once per process, not on every Streamlit rerun.
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+
+import requests
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSET_CACHE_DIR = os.getenv("ASSET_CACHE_DIR", os.path.join(".cache", "assets"))
+ASSET_REVALIDATE_SECONDS = int(os.getenv("ASSET_REVALIDATE_SECONDS", str(24 * 3600)))
+ASSET_FETCH_TIMEOUT = float(os.getenv("ASSET_FETCH_TIMEOUT", "5"))
+ASSET_OFFLINE = os.getenv("ASSET_OFFLINE", "").lower() in ("1", "true", "yes")
+
+# name -> (bundled file name, remote fallback URL)
+ASSETS = {
+    "logo": (
+        "WORLDWIDE_Logo 7.png",
+        "https://raw.githubusercontent.com/aakashs227/CustomerBrief/main/WORLDWIDE_Logo%207.png",
+    ),
+}
+
+_MIME_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"<svg", "image/svg+xml"),
+    (b"<?xml", "image/svg+xml"),
+]
+
+_data_uris = {}
+_lock = threading.Lock()
+
+
+def sniff_mime(data: bytes) -> str:
+    for signature, mime in _MIME_SIGNATURES:
+        if data.startswith(signature):
+            return mime
+    return "application/octet-stream"
+
+
+def _cache_paths(name):
+    return os.path.join(ASSET_CACHE_DIR, name), os.path.join(ASSET_CACHE_DIR, name + ".json")
+
+
+def _read_cached(name):
+    data_path, meta_path = _cache_paths(name)
+    if not os.path.exists(data_path):
+        return None, {}
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {}
+    with open(data_path, "rb") as f:
+        return f.read(), meta
+
+
+def _write_cached(name, data, meta):
+    data_path, meta_path = _cache_paths(name)
+    os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+    # Write then rename, so a concurrent reader never sees half a file
+    for path, payload, mode in ((data_path, data, "wb"), (meta_path, json.dumps(meta), "w")):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, mode) as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+
+def _fetch(name, url, data, meta):
+    """
+    Fetches (or revalidates) a remote asset. Returns the current bytes, or the cached ones on failure.
+    """
+    headers = {}
+    if data is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    try:
+        response = requests.get(url, headers=headers, timeout=ASSET_FETCH_TIMEOUT)
+    except requests.RequestException:
+        return data
+
+    if response.status_code == 304 and data is not None:
+        meta["checked_at"] = time.time()
+        _write_cached(name, data, meta)
+        return data
+    if response.status_code != 200 or not response.content:
+        return data
+
+    meta = {
+        "url": url,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "checked_at": time.time(),
+    }
+    _write_cached(name, response.content, meta)
+    return response.content
+
+
+def asset_path(name):
+    """
+    Returns a local file path for the asset, fetching it into the disk cache if needed, or None.
+    """
+    bundled, url = ASSETS[name]
+    bundled_path = os.path.join(ASSET_DIR, bundled)
+    if os.path.exists(bundled_path):
+        return bundled_path
+    if load_asset(name) is None:
+        return None
+    return _cache_paths(name)[0]
+
+
+def load_asset(name):
+    """
+    Returns the asset bytes following the bundled file -> disk cache -> network order, or None.
+    """
+    bundled, url = ASSETS[name]
+    bundled_path = os.path.join(ASSET_DIR, bundled)
+    if os.path.exists(bundled_path):
+        with open(bundled_path, "rb") as f:
+            return f.read()
+
+    data, meta = _read_cached(name)
+    stale = data is None or time.time() - meta.get("checked_at", 0) > ASSET_REVALIDATE_SECONDS
+    if stale and url and not ASSET_OFFLINE:
+        data = _fetch(name, url, data, meta)
+    return data
+
+
+def data_uri(name):
+    """
+    Returns the asset as a base64 data URI, computed once per process ("" if it is unavailable).
+    """
+    uri = _data_uris.get(name)
+    if uri is not None:
+        return uri
+    with _lock:
+        if name not in _data_uris:
+            data = load_asset(name)
+            _data_uris[name] = (
+                f"data:{sniff_mime(data)};base64,{base64.b64encode(data).decode('ascii')}" if data else ""
+            )
+        return _data_uris[name]
+
+
+def logo_data_uri():
+    return data_uri("logo")
+
+
+def clear_asset_cache():
+    """
+    Drops the in-process data URIs; the next call re-reads the bundled file or disk cache.
+    """
+    with _lock:
+        _data_uris.clear()
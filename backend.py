@@ -0,0 +1,154 @@
+# backend.py
+
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from ai_agent import close_http_client, get_http_client, get_response_from_ai_agent, stream_response_from_ai_agent
+from metrics import PROMETHEUS_CONTENT_TYPE, registry
+
+ALLOWED_MODEL_NAMES = ["gpt-4.1-2025-04-14", "gpt-4.1-mini", "gpt-4o", "gpt-4o-mini"]
+ALLOWED_MODEL_PROVIDERS = ["OpenAI"]
+
+# Agent calls are blocking, so they run on a dedicated pool whose size is the concurrency bound
+MAX_CONCURRENT_REQUESTS = int(os.getenv("BACKEND_MAX_CONCURRENCY", "8"))
+# Requests beyond running + queued slots are turned away instead of piling up
+MAX_QUEUED_REQUESTS = int(os.getenv("BACKEND_MAX_QUEUED", "32"))
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("BACKEND_REQUEST_TIMEOUT", "180"))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="agent")
+_admission = None
+
+
+class RequestState(BaseModel):
+    model_name: str
+    model_provider: str
+    messages: List[str]
+    allow_search: bool = False
+    stream: bool = False
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _admission
+    _admission = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS + MAX_QUEUED_REQUESTS)
+    # Open the pooled OpenAI connection up front so the first request doesn't pay for it
+    get_http_client()
+    yield
+    _executor.shutdown(wait=False, cancel_futures=True)
+    close_http_client()
+
+
+app = FastAPI(title="CustomerBrief Backend", lifespan=lifespan)
+
+
+def error_response(status_code, message):
+    return JSONResponse(status_code=status_code, content={"error": message})
+
+
+def validate_request(request: RequestState):
+    if request.model_provider not in ALLOWED_MODEL_PROVIDERS:
+        return error_response(400, f"Unsupported model provider: {request.model_provider}")
+    if request.model_name not in ALLOWED_MODEL_NAMES:
+        return error_response(400, f"Invalid model name. Kindly select one of: {', '.join(ALLOWED_MODEL_NAMES)}")
+    if not request.messages or not request.messages[-1].strip():
+        return error_response(400, "Please provide a query.")
+    return None
+
+
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+async def stream_events(request: RequestState, query: str):
+    """
+    Relays the agent's token stream as Server-Sent Events while holding an admission slot.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + REQUEST_TIMEOUT_SECONDS
+    chunks = stream_response_from_ai_agent(request.model_name, query, request.allow_search)
+    done = object()
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            chunk = await asyncio.wait_for(loop.run_in_executor(_executor, next, chunks, done), timeout=remaining)
+            if chunk is done:
+                break
+            yield sse_event({"delta": chunk})
+        yield sse_event({}, event="done")
+    except asyncio.TimeoutError:
+        yield sse_event({"error": "The analysis timed out. Please try again."}, event="error")
+    except Exception as e:
+        yield sse_event({"error": str(e)}, event="error")
+    finally:
+        try:
+            chunks.close()
+        except ValueError:
+            # Still running on a worker after a timeout; it finishes on its own
+            pass
+        _admission.release()
+
+
+@app.post("/chat")
+async def chat_endpoint(request: RequestState):
+    """
+    Runs the AI agent for the latest message; set "stream" to receive Server-Sent Events instead of JSON.
+    """
+    invalid = validate_request(request)
+    if invalid is not None:
+        return invalid
+
+    if _admission.locked():
+        registry.inc("customerbrief_rejected_requests_total", endpoint="chat")
+        return error_response(503, "The analysis service is busy. Please retry in a moment.")
+    await _admission.acquire()
+
+    query = request.messages[-1].strip()
+    if request.stream:
+        # The generator releases the admission slot once the stream ends
+        return StreamingResponse(
+            stream_events(request, query),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    loop = asyncio.get_running_loop()
+    try:
+        response = await asyncio.wait_for(
+            loop.run_in_executor(_executor, get_response_from_ai_agent, request.model_name, query, request.allow_search),
+            timeout=REQUEST_TIMEOUT_SECONDS
+        )
+        return {"response": response}
+    except asyncio.TimeoutError:
+        return error_response(504, "The analysis timed out. Please try again.")
+    except Exception as e:
+        return error_response(500, f"Agent error: {e}")
+    finally:
+        _admission.release()
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/metrics")
+async def metrics():
+    if not registry.enabled:
+        return error_response(404, "Metrics are disabled; set METRICS_ENABLED=1.")
+    return PlainTextResponse(registry.render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=9999, timeout_keep_alive=30)
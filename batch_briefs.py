@@ -0,0 +1,329 @@
+# batch_briefs.py
+"""
+Bulk brief generation from a CSV/Excel account list.
+
+Usage:
+    python batch_briefs.py accounts.xlsx --column "Company" --out batch_output/q3_review --workers 4 --rpm 60
+
+Each finished account is appended to <out>/checkpoint.jsonl, so re-running the same
+command after an interruption resumes where it stopped. start_batch_job runs a batch on a
+background thread of the calling process instead, as the Streamlit batch tab does.
+Briefs are written to <out>/docx/<account>_<hash>.docx and a summary workbook to <out>/summary.xlsx.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+
+import pandas as pd
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from brief_cache import BriefCache
+from brief_pipeline import BULK_LATENCY_POLICY, BriefResult, coalesced_brief, complete_brief, lookup_cached_brief
+from file_operations import generate_docx_file
+from openai_scheduler import BULK, scheduled_client
+
+ACCOUNT_COLUMN_HINTS = ["company", "account", "customer", "organization", "name"]
+CHECKPOINT_FILE = "checkpoint.jsonl"
+SUMMARY_FILE = "summary.xlsx"
+
+
+def slugify(text):
+    return "".join(c if c.isalnum() else "_" for c in text.lower()).strip("_")
+
+
+def docx_file_name(account):
+    # The hash keeps accounts that slugify alike ("Apple Inc" and "Apple, Inc") in separate files
+    digest = hashlib.sha256(account.encode("utf-8")).hexdigest()[:8]
+    return f"{slugify(account)[:80] or 'account'}_{digest}.docx"
+
+
+def read_accounts(source, column=None, file_name=None):
+    """
+    Reads account names from a CSV or XLSX path (or uploaded file object).
+    Without an explicit column, the first column whose header looks like a company name is used.
+    Blank rows and duplicates are dropped, preserving the original order.
+    """
+    file_name = file_name or str(source)
+    if file_name.lower().endswith((".xlsx", ".xls")):
+        df = pd.read_excel(source)
+    else:
+        df = pd.read_csv(source)
+
+    if column is None:
+        column = next(
+            (c for c in df.columns if any(hint in str(c).lower() for hint in ACCOUNT_COLUMN_HINTS)),
+            df.columns[0]
+        )
+    elif column not in df.columns:
+        raise ValueError(f"Column '{column}' not found. Available columns: {', '.join(map(str, df.columns))}")
+
+    accounts = []
+    seen = set()
+    for value in df[column].dropna():
+        name = str(value).strip()
+        if name and name.casefold() not in seen:
+            seen.add(name.casefold())
+            accounts.append(name)
+    return accounts
+
+
+class RateLimiter:
+    """
+    Spaces request starts to stay under this batch's requests-per-minute budget.
+    The process-wide OpenAI scheduler still applies on top (and handles 429s).
+    """
+
+    def __init__(self, requests_per_minute):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class BatchProgress:
+    __slots__ = ("total", "completed", "failed", "skipped", "started_at")
+
+    def __init__(self, total, skipped=0):
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.skipped = skipped
+        self.started_at = time.monotonic()
+
+    @property
+    def processed(self):
+        return self.completed + self.failed
+
+    @property
+    def remaining(self):
+        return self.total - self.skipped - self.processed
+
+    @property
+    def throughput(self):
+        """Accounts per minute processed in this run (resumed accounts excluded)."""
+        elapsed = time.monotonic() - self.started_at
+        return self.processed / elapsed * 60 if elapsed > 0 else 0.0
+
+    @property
+    def eta_seconds(self):
+        if not self.processed:
+            return None
+        return self.remaining / (self.throughput / 60)
+
+    def describe(self):
+        eta = self.eta_seconds
+        eta_text = "--" if eta is None else time.strftime("%H:%M:%S", time.gmtime(eta))
+        return (
+            f"[{self.skipped + self.processed}/{self.total}] "
+            f"{self.throughput:.1f} accounts/min, ETA {eta_text}, failed {self.failed}"
+        )
+
+
+def load_checkpoint(out_dir):
+    """
+    Returns {account: record} for every account already finished successfully.
+    """
+    path = os.path.join(out_dir, CHECKPOINT_FILE)
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run
+                continue
+            if record.get("status") == "ok":
+                records[record["account"]] = record
+    return records
+
+
+def brief_account(client, account, out_dir, limiter, cache=None):
+    """
+    Generates and saves the brief for one account. Rate limits and transient API errors are
+    retried by the scheduler the client goes through.
+    """
+    started = time.monotonic()
+    result = lookup_cached_brief(cache, account) if cache is not None else None
+    if result is None:
+        # Only requests that reach the API are paced; cache hits are written straight away
+        limiter.wait()
+        text, _ = coalesced_brief(client, account, cache,
+                                  complete=partial(complete_brief, policy=BULK_LATENCY_POLICY))
+        result = BriefResult(account, text)
+
+    docx_path = os.path.join(out_dir, "docx", docx_file_name(account))
+    with open(docx_path, "wb") as f:
+        f.write(generate_docx_file(result.text).getvalue())
+
+    return {
+        "account": account,
+        "status": "ok",
+        "file": docx_path,
+        "cached": result.cached,
+        "seconds": round(time.monotonic() - started, 2),
+        "characters": len(result.text),
+        "error": "",
+    }
+
+
+def write_summary(out_dir, records):
+    path = os.path.join(out_dir, SUMMARY_FILE)
+    columns = ["account", "status", "file", "cached", "seconds", "characters", "error"]
+    pd.DataFrame(records, columns=columns).to_excel(path, index=False, sheet_name="Briefs")
+    return path
+
+
+def run_batch(accounts, out_dir, client, workers=4, requests_per_minute=60, cache=None, on_progress=None):
+    """
+    Briefs every account not already in the checkpoint using a bounded worker pool.
+    on_progress(progress, record) is called from the calling thread after each account,
+    which keeps it safe for Streamlit widgets. Returns the summary workbook path.
+    """
+    os.makedirs(os.path.join(out_dir, "docx"), exist_ok=True)
+    # Batch work queues behind interactive searches for the shared API budget
+    client = scheduled_client(client, BULK)
+
+    done = load_checkpoint(out_dir)
+    pending = [account for account in accounts if account not in done]
+    progress = BatchProgress(len(accounts), skipped=len(accounts) - len(pending))
+    limiter = RateLimiter(requests_per_minute)
+    records = [done[account] for account in accounts if account in done]
+
+    with open(os.path.join(out_dir, CHECKPOINT_FILE), "a", encoding="utf-8") as checkpoint, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(brief_account, client, account, out_dir, limiter, cache): account
+            for account in pending
+        }
+        for future in as_completed(futures):
+            account = futures[future]
+            try:
+                record = future.result()
+                progress.completed += 1
+            except Exception as e:
+                record = {"account": account, "status": "failed", "file": "", "cached": False,
+                          "seconds": 0, "characters": 0, "error": str(e)}
+                progress.failed += 1
+
+            checkpoint.write(json.dumps(record) + "\n")
+            checkpoint.flush()
+            records.append(record)
+            if on_progress is not None:
+                on_progress(progress, record)
+
+    # Keep the summary in the order of the input list
+    order = {account: i for i, account in enumerate(accounts)}
+    records.sort(key=lambda r: order.get(r["account"], len(order)))
+    return write_summary(out_dir, records)
+
+
+class BatchJob:
+    """
+    A run_batch call on a daemon thread, for callers that must not block on it (the Streamlit
+    batch tab). progress, last_account and the outcome (summary or error) can be read from any thread.
+    """
+    __slots__ = ("out_dir", "progress", "last_account", "summary", "error", "_thread")
+
+    def __init__(self, accounts, out_dir, client, **options):
+        self.out_dir = out_dir
+        self.progress = None
+        self.last_account = None
+        self.summary = None
+        self.error = None
+        self._thread = threading.Thread(target=self._run, args=(accounts, client, options),
+                                        name=f"batch-{os.path.basename(out_dir)}", daemon=True)
+
+    def _run(self, accounts, client, options):
+        try:
+            self.summary = run_batch(accounts, self.out_dir, client, on_progress=self._on_progress, **options)
+        except Exception as e:
+            self.error = e
+
+    def _on_progress(self, progress, record):
+        self.progress = progress
+        self.last_account = record["account"]
+
+    @property
+    def running(self):
+        return self._thread.is_alive()
+
+    @property
+    def fraction(self):
+        progress = self.progress
+        if progress is None or not progress.total:
+            return 0.0
+        return (progress.skipped + progress.processed) / progress.total
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def start_batch_job(accounts, out_dir, client, **options):
+    """
+    Starts run_batch(accounts, out_dir, client, **options) in the background and returns its BatchJob,
+    or the job already running for out_dir: two runs appending to one checkpoint would brief accounts twice.
+    """
+    with _jobs_lock:
+        job = _jobs.get(out_dir)
+        if job is None or not job.running:
+            job = _jobs[out_dir] = BatchJob(accounts, out_dir, client, **options)
+            job._thread.start()
+        return job
+
+
+def batch_job(out_dir):
+    """
+    Returns the last BatchJob started in this process for out_dir (running or finished), or None.
+    """
+    with _jobs_lock:
+        return _jobs.get(out_dir)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Generate CustomerBrief reports for a list of accounts.")
+    parser.add_argument("accounts_file", help="CSV or XLSX file with one account per row")
+    parser.add_argument("--column", help="Column holding the account names (auto-detected by default)")
+    parser.add_argument("--out", default=None, help="Output directory (default: batch_output/<file name>)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent briefs in flight")
+    parser.add_argument("--rpm", type=int, default=60, help="Maximum requests per minute")
+    parser.add_argument("--no-cache", action="store_true", help="Always generate fresh briefs")
+    args = parser.parse_args()
+
+    accounts = read_accounts(args.accounts_file, args.column)
+    out_dir = args.out or os.path.join("batch_output", os.path.splitext(os.path.basename(args.accounts_file))[0])
+    cache = None if args.no_cache else BriefCache()
+
+    def report(progress, record):
+        status = "cached" if record.get("cached") else record["status"]
+        print(f"{progress.describe()}  {record['account']}: {status}", flush=True)
+
+    print(f"Briefing {len(accounts)} accounts into {out_dir}")
+    summary = run_batch(accounts, out_dir, OpenAI(), workers=args.workers,
+                        requests_per_minute=args.rpm, cache=cache, on_progress=report)
+    print(f"Summary written to {summary}")
+
+
+if __name__ == "__main__":
+    main()
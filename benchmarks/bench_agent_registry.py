@@ -0,0 +1,84 @@
+# bench_agent_registry.py
+"""
+Micro-benchmark of the per-request agent setup removed by the ai_agent registry.
+
+Run from the repository root:
+    python -m benchmarks.bench_agent_registry --iterations 200
+
+No API calls are made: only client and graph construction are timed, which is the
+overhead every request used to pay before reaching the model.
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langchain_openai import ChatOpenAI
+from langgraph.prebuilt import create_react_agent
+
+import ai_agent
+
+
+def time_calls(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def per_call_construction(llm_id, allow_search):
+    # What get_response_from_ai_agent did before the registry: a new client, pool and graph per request
+    llm = ChatOpenAI(model=llm_id)
+    return create_react_agent(
+        model=llm,
+        tools=ai_agent.build_tools(ai_agent.get_tool_names(allow_search)),
+        prompt=ai_agent.DEFAULT_PROMPT
+    )
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "mean_ms": statistics.fmean(samples) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p99_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+    }
+
+
+def run(iterations=200, llm_id="gpt-4.1-2025-04-14", allow_search=False):
+    ai_agent.invalidate_agents()
+    before = time_calls(lambda: per_call_construction(llm_id, allow_search), iterations)
+
+    ai_agent.get_agent(llm_id, allow_search)  # warm the registry once
+    after = time_calls(lambda: ai_agent.get_agent(llm_id, allow_search), iterations)
+
+    result = {
+        "iterations": iterations,
+        "per_call_construction": summarize(before),
+        "registry_lookup": summarize(after),
+    }
+    result["saved_per_request_ms"] = result["per_call_construction"]["mean_ms"] - result["registry_lookup"]["mean_ms"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--model", default="gpt-4.1-2025-04-14")
+    parser.add_argument("--allow-search", action="store_true")
+    args = parser.parse_args()
+
+    result = run(args.iterations, args.model, args.allow_search)
+    for name in ("per_call_construction", "registry_lookup"):
+        stats = result[name]
+        print(f"{name:<24} mean {stats['mean_ms']:8.3f} ms   p50 {stats['p50_ms']:8.3f} ms   p99 {stats['p99_ms']:8.3f} ms")
+    print(f"{'saved per request':<24} {result['saved_per_request_ms']:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
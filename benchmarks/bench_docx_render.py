@@ -0,0 +1,124 @@
+# bench_docx_render.py
+"""
+Render time and peak memory of .docx generation for large briefs.
+
+Run from the repository root:
+    python -m benchmarks.bench_docx_render --sections 11 --bullets 60
+
+Builds a synthetic brief shaped like the model's output (numbered section headings,
+nested bullets, bold labels, reference links and a financial table), then compares
+the previous generators, one plain paragraph per line or the whole response in a
+single paragraph, with render_markdown_docx on the cloned branded template.
+Peak memory is measured with tracemalloc for Python allocations only.
+"""
+
+import argparse
+import time
+import tracemalloc
+from io import BytesIO
+
+from docx import Document
+
+from file_operations import get_template_bytes, render_markdown_docx
+
+SECTION_TITLES = [
+    "🏢 Company Overview", "💰 Financial Summary", "🌍 Market & Industry Position", "📦 Import Activity",
+    "🚢 Export Activity", "🌍 Global Presence & Office Locations", "🚛 Freight Forwarding History",
+    "🔍 Competitive Landscape", "📈 Recent Developments or Strategic Moves",
+    "🧠 Actionable Insights & Recommendations", "🔗 Source Links",
+]
+
+
+def make_brief(sections=11, bullets=60):
+    lines = ["🧠 Company Analysis", ""]
+    for s in range(sections):
+        lines.append(f"{s + 1}. {SECTION_TITLES[s % len(SECTION_TITLES)]}")
+        lines.append("")
+        lines.append("| Metric | FY2023 | FY2024 |")
+        lines.append("|---|---|---|")
+        lines.append("| Revenue | $12.4B | $13.1B |")
+        lines.append("| Shipments (TEU) | 410,000 | 438,500 |")
+        lines.append("")
+        for b in range(bullets):
+            if b % 10 == 0:
+                lines.append(f"**Highlight {b // 10 + 1}:**")
+            indent = "  " if b % 3 == 2 else ""
+            lines.append(
+                f"{indent}- **Point {b + 1}:** The company expanded its logistics footprint across key trade lanes, "
+                f"with *notable* growth in regional volumes ([source](https://example.com/report/{s}/{b}))."
+            )
+        lines.append("")
+    return "\n".join(lines)
+
+
+def per_line_paragraphs(content):
+    # Previous file_operations.generate_docx_file
+    doc = Document()
+    doc.add_heading("Company Insights", 0)
+    for line in content.split("\n"):
+        doc.add_paragraph(line)
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer
+
+
+def single_paragraph(content):
+    # Previous app.py / frontend.py generate_docx
+    doc = Document()
+    doc.add_heading("CustomerBrief", level=1)
+    doc.add_paragraph("Response:")
+    doc.add_paragraph(content)
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer
+
+
+def measure(fn, content, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        buffer = fn(content)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    # Separate pass: tracemalloc slows allocation-heavy code too much to time under it
+    tracemalloc.start()
+    fn(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"render_ms": elapsed * 1000, "peak_mb": peak / 1024 / 1024, "size_kb": len(buffer.getvalue()) / 1024}
+
+
+def run(sections=11, bullets=60, repeat=3):
+    content = make_brief(sections, bullets)
+    get_template_bytes()  # preloaded once per process in the app too
+
+    rendered = render_markdown_docx(content)
+    pages = len(Document(rendered).paragraphs) / 38  # ~38 short paragraphs per page
+
+    return {
+        "characters": len(content),
+        "estimated_pages": round(pages, 1),
+        "per_line_paragraphs": measure(per_line_paragraphs, content, repeat),
+        "single_paragraph": measure(single_paragraph, content, repeat),
+        "render_markdown_docx": measure(render_markdown_docx, content, repeat),
+        "render_markdown_docx_streamed": measure(
+            lambda text: render_markdown_docx(text[i:i + 32] for i in range(0, len(text), 32)), content, repeat
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sections", type=int, default=11)
+    parser.add_argument("--bullets", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    result = run(args.sections, args.bullets, args.repeat)
+    print(f"{result['characters']} characters, ~{result['estimated_pages']} pages")
+    for name in ("per_line_paragraphs", "single_paragraph", "render_markdown_docx", "render_markdown_docx_streamed"):
+        stats = result[name]
+        print(f"{name:<30} {stats['render_ms']:8.1f} ms   peak {stats['peak_mb']:6.1f} MB   {stats['size_kb']:7.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
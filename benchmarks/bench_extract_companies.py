@@ -0,0 +1,101 @@
+# bench_extract_companies.py
+"""
+Benchmark of company extraction cost per query, before and after lazy/trimmed spaCy loading.
+
+Run from the repository root:
+    python -m benchmarks.bench_extract_companies --queries 2000
+
+"before" replays the original implementation: a full en_core_web_sm pipeline loaded
+at import, regexes looked up on every call and one nlp(text) per query.
+"after" uses company_utils as shipped: the trimmed pipeline loaded on first use,
+precompiled regexes, and extract_companies_batch (nlp.pipe) for bulk lists.
+Without spaCy or the model installed, only the regex stages are measured.
+"""
+
+import argparse
+import random
+import re
+import time
+
+import company_utils
+
+SAMPLE_ACCOUNTS = [
+    "Apple Inc", "Siemens AG", "Maersk", "DHL Group", "Tata Steel Limited", "Reliance Industries",
+    "Acme Corp", "Nestle S.A.", "Zara S.L.U.", "Bosch GmbH", "Unilever PLC", "Infosys Ltd",
+    "brief on toyota motor corporation", "export activity of samsung electronics co",
+    "tell me about procter & gamble", "walmart", "freight history for ikea group",
+]
+
+
+def make_queries(count, seed=7):
+    rng = random.Random(seed)
+    return [rng.choice(SAMPLE_ACCOUNTS) for _ in range(count)]
+
+
+def original_extract(text, nlp):
+    companies = set()
+    companies.update(m.strip() for m in re.findall(company_utils.suffix_pattern, text) if m.strip())
+    companies.update(m.strip() for m in re.findall(company_utils.capitalized_pattern, text) if m.strip())
+    if nlp is not None:
+        doc = nlp(text)
+        companies.update(ent.text.strip() for ent in doc.ents if ent.label_ == "ORG")
+    return list(companies)
+
+
+def load_full_pipeline():
+    if not company_utils.USE_SPACY:
+        return None
+    try:
+        return company_utils.spacy.load(company_utils.SPACY_MODEL)
+    except OSError:
+        return None
+
+
+def timed(fn):
+    start = time.perf_counter()
+    value = fn()
+    return time.perf_counter() - start, value
+
+
+def run(query_count=2000):
+    queries = make_queries(query_count)
+
+    load_before, full_nlp = timed(load_full_pipeline)
+    per_query_before, _ = timed(lambda: [original_extract(q, full_nlp) for q in queries])
+
+    company_utils._nlp = None
+    load_after, trimmed_nlp = timed(company_utils.get_nlp)
+    per_query_after, _ = timed(lambda: [company_utils.extract_companies(q) for q in queries])
+    batch_after, _ = timed(lambda: company_utils.extract_companies_batch(queries))
+
+    return {
+        "queries": query_count,
+        "spacy": full_nlp is not None,
+        "pipeline_before": full_nlp.pipe_names if full_nlp is not None else [],
+        "pipeline_after": trimmed_nlp.pipe_names if trimmed_nlp is not None else [],
+        "model_load_before_s": load_before,
+        "model_load_after_s": load_after,
+        "per_query_before_us": per_query_before / query_count * 1e6,
+        "per_query_after_us": per_query_after / query_count * 1e6,
+        "per_query_batched_us": batch_after / query_count * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    result = run(args.queries)
+    if not result["spacy"]:
+        print("spaCy/en_core_web_sm not available: NER stages skipped, regex cost only.")
+    else:
+        print(f"pipeline before: {result['pipeline_before']}")
+        print(f"pipeline after:  {result['pipeline_after']}")
+    print(f"model load       before {result['model_load_before_s'] * 1000:10.1f} ms   after {result['model_load_after_s'] * 1000:10.1f} ms (on first use only)")
+    print(f"per query        before {result['per_query_before_us']:10.1f} us   after {result['per_query_after_us']:10.1f} us")
+    print(f"per query, batch                        after {result['per_query_batched_us']:10.1f} us (extract_companies_batch)")
+
+
+if __name__ == "__main__":
+    main()
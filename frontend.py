@@ -1,20 +1,69 @@
 import streamlit as st
-import base64
 import requests
-from PIL import Image
-from io import BytesIO
-from docx import Document
-import re
 import os
+import uuid
+from functools import partial
+from assets import logo_data_uri
+from company_utils import contains_multiple_companies
+from file_operations import cached_docx_bytes, generate_share_link, render_markdown_docx
+from history_store import HistoryStore
+from metrics import instrumented
+from postprocess import clean_text
+from report_store import ReportRef, report_digest, report_store
+from share_server import SHARE_BASE_URL_CONFIGURED, SHARE_BASE_URL_MISSING, SHARE_SERVER_AUTOSTART, start_background_server
 
 def clean_response(text):
-    cleaned_text = re.sub(
-        r"(🧠 Company Analysis\s*)(.*?)(?=\n\s*1\.\s*[🔍A-Z])",
-        r"\1\n",
-        text,
-        flags=re.DOTALL
-    )
-    return cleaned_text.strip()
+    return clean_text(text)
+
+# --- Helper Functions ---
+def slugify(text):
+    return "".join(c if c.isalnum() else "_" for c in text.lower()).strip("_")
+
+@instrumented("generate_docx")
+def generate_docx(query, response):
+    return render_markdown_docx(response, title="MIRA Company Analysis", subtitle=f"Query: {query}")
+
+def docx_download(query, response):
+    # Built only when the download is clicked, and at most once per distinct report
+    return partial(cached_docx_bytes, "frontend.generate_docx", generate_docx, query, response)
+
+@st.cache_resource
+def get_history_store():
+    return HistoryStore()
+
+def get_owner_id():
+    # Kept in the URL so a reconnecting (or reloaded) browser finds its history again
+    owner_id = st.query_params.get("uid")
+    if not owner_id:
+        owner_id = uuid.uuid4().hex
+        st.query_params["uid"] = owner_id
+    return owner_id
+
+def load_report(ref, owner_id):
+    # Served from the shared in-memory store; the history store is only read after an eviction
+    return report_store.get(ref, loader=partial(get_history_store().get_body, owner_id, ref.entry_id))
+
+def report_docx(ref, owner_id):
+    # The report is only loaded when its download is clicked
+    body = load_report(ref, owner_id)
+    if body is None:
+        return b""
+    return cached_docx_bytes("frontend.generate_docx", generate_docx, ref.query, body)
+
+def reset_history_page():
+    st.session_state.history_page = 0
+
+@st.cache_resource
+def get_share_server():
+    # One server per process; if the port is taken, another process is already serving the shares
+    return start_background_server() if SHARE_SERVER_AUTOSTART else None
+
+def create_share_link(query, response):
+    # The report is published once (keyed by its hash) and served as static HTML
+    if not SHARE_BASE_URL_CONFIGURED:
+        return
+    get_share_server()
+    st.session_state.share_links[report_digest(response)] = generate_share_link(response, title=query)
 
 # --- Page Setup ---
 st.set_page_config(
@@ -63,21 +112,10 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-# --- Load Logos from GitHub URL ---
-logo_url = "https://raw.githubusercontent.com/aakashs227/CustomerBrief/main/WORLDWIDE_Logo%207.png"  # Your GitHub image URL
-
-try:
-    response = requests.get(logo_url)
-    if response.status_code != 200:
-        raise FileNotFoundError("Logo image could not be loaded from GitHub.")
-
-    logo = Image.open(BytesIO(response.content))
-    buffered = BytesIO()
-    logo.save(buffered, format="PNG")
-    logo_base64 = base64.b64encode(buffered.getvalue()).decode()
-except Exception as e:
-    st.error(f"❌ Error loading logo image: {e}")
-    logo_base64 = ""
+# --- Load Logo (bundled file or local asset cache, encoded once per process) ---
+logo_uri = logo_data_uri()
+if not logo_uri:
+    st.error("❌ Error loading logo image: it is neither bundled nor cached locally.")
 
   
 
@@ -88,9 +126,16 @@ for key in ["chat_history", "last_query", "download_clicked", "share_clicked", "
 
 
 # --- Initialize Session State ---
-for key in ["chat_history", "last_query", "download_clicked", "share_clicked", "selected_menu"]:
+for key in ["last_query", "download_clicked", "share_clicked", "selected_menu"]:
     if key not in st.session_state:
-        st.session_state[key] = [] if "history" in key else ""
+        st.session_state[key] = ""
+if "history_page" not in st.session_state:
+    st.session_state.history_page = 0
+if "viewed_report" not in st.session_state:
+    st.session_state.viewed_report = None
+if "share_links" not in st.session_state:
+    # Kept across the rerun that follows a search, so the link is shown with the viewed report
+    st.session_state.share_links = {}
 
 # --- Sidebar ---
 with st.sidebar:
@@ -107,7 +152,7 @@ with st.sidebar:
         align-items: center;
         box-sizing: border-box;
     ">
-        <img src="data:image/png;base64,{logo_base64}" width="100" style="display: block;"/>
+        <img src="{logo_uri}" width="100" style="display: block;"/>
     </div>
     """,
     unsafe_allow_html=True
@@ -122,48 +167,73 @@ with st.sidebar:
         </h3>
     """, unsafe_allow_html=True)
 
-    for i, (q, a) in enumerate(reversed(st.session_state.chat_history)):
-        index = len(st.session_state.chat_history) - 1 - i
+    history_store = get_history_store()
+    owner_id = get_owner_id()
+    history_search = st.text_input(
+        "Search history",
+        placeholder="🔎 Search history",
+        key="history_search",
+        label_visibility="collapsed",
+        on_change=reset_history_page
+    )
+
+    # Only one page of metadata rows is read per rerun; report bodies stay in the store
+    history_page = history_store.page(owner_id, st.session_state.history_page, search=history_search.strip())
+    st.session_state.history_page = history_page.page
+
+    for entry in history_page.entries:
         col1, col2 = st.columns([0.85, 0.15])
         with col1:
             st.markdown(
-                f"<div class='chat-history-item'>• {q[:50]}</div>",
+                f"<div class='chat-history-item'>• {entry.query[:50]}</div>",
                 unsafe_allow_html=True
             )
         with col2:
-            if st.button("⋮", key=f"menu_{i}"):
-                st.session_state.selected_menu = index
+            if st.button("⋮", key=f"menu_{entry.id}"):
+                st.session_state.selected_menu = entry.id
 
-        if st.session_state.get("selected_menu") == index:
+        if st.session_state.get("selected_menu") == entry.id:
             button_cols = st.columns([1, 1, 1])
             with button_cols[0]:
-                if st.button("👁 View", key=f"view_{i}", help="View"):
-                    st.session_state.last_query = q
+                if st.button("👁 View", key=f"view_{entry.id}", help="View"):
+                    st.session_state.viewed_report = ReportRef(entry.digest, entry.query, entry.characters, entry.id)
                     st.session_state.selected_menu = None
                     st.rerun()
             with button_cols[1]:
-                doc_buffer = BytesIO()
-                doc = Document()
-                doc.add_heading("MIRA Company Analysis", level=1)
-                doc.add_paragraph(f"Query: {q}")
-                doc.add_paragraph("Response:")
-                doc.add_paragraph(a)
-                doc.save(doc_buffer)
-                doc_buffer.seek(0)
                 st.download_button(
                     label="⬇️",
-                    data=doc_buffer,
-                    file_name=f"chat_history_{index+1}.docx",
+                    data=partial(report_docx, ReportRef(entry.digest, entry.query, entry.characters, entry.id), owner_id),
+                    file_name=f"chat_history_{entry.id}.docx",
                     mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                    key=f"download_btn_{i}",
+                    key=f"download_btn_{entry.id}",
                     help="Download"
                 )
             with button_cols[2]:
-                if st.button("🗑 Delete", key=f"delete_{i}", help="Delete"):
-                    st.session_state.chat_history.pop(index)
-                    st.session_state.selected_menu = None   
+                if st.button("🗑 Delete", key=f"delete_{entry.id}", help="Delete"):
+                    history_store.delete(owner_id, entry.id)
+                    if st.session_state.viewed_report and st.session_state.viewed_report.entry_id == entry.id:
+                        st.session_state.viewed_report = None
+                    st.session_state.selected_menu = None
                     st.rerun()
 
+    if history_page.page_count > 1:
+        col_prev, col_page, col_next = st.columns([0.3, 0.4, 0.3])
+        with col_prev:
+            if st.button("◀", key="history_prev", disabled=not history_page.has_previous):
+                st.session_state.history_page -= 1
+                st.rerun()
+        with col_page:
+            st.markdown(
+                f"<div class='chat-history-item'>{history_page.page + 1} / {history_page.page_count}</div>",
+                unsafe_allow_html=True
+            )
+        with col_next:
+            if st.button("▶", key="history_next", disabled=not history_page.has_next):
+                st.session_state.history_page += 1
+                st.rerun()
+    elif not history_page.entries and history_search.strip():
+        st.caption("No matching briefs.")
+
 # --- Welcome Message ---
 st.markdown("""
     <div style='background-color: #f4f4f4; padding: 25px; border-radius: 10px; margin-bottom: 30px;'>
@@ -174,26 +244,6 @@ st.markdown("""
     </div>
 """, unsafe_allow_html=True)
 
-# --- Helper Functions ---
-def slugify(text):
-    return "".join(c if c.isalnum() else "_" for c in text.lower()).strip("_")
-
-def generate_docx(query, response):
-    doc = Document()
-    doc.add_heading("MIRA Company Analysis", level=1)
-    doc.add_paragraph(f"Query: {query}")
-    doc.add_paragraph("Response:")
-    doc.add_paragraph(response)
-    buffer = BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer
-
-def contains_multiple_companies(query):
-    delimiters = [",", "&", " and ", "/", " vs ", " versus ", ";"]
-    count = sum([query.lower().count(d) for d in delimiters])
-    return count >= 1
-
 def show_download_buttons(query, response, key_prefix="main"):
     st.markdown("### 🧠 Company Analysis")
     if contains_multiple_companies(query):
@@ -204,25 +254,38 @@ def show_download_buttons(query, response, key_prefix="main"):
         st.write(response)
     else:
         file_name = f"{slugify(query)}.docx"
-        docx_file_top = generate_docx(query, response)
+        docx_file = docx_download(query, response)
         st.download_button(
             label="📥 Download Analysis",
-            data=docx_file_top,
+            data=docx_file,
             file_name=file_name,
             mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
             key=f"{key_prefix}_download_top"
         )
         st.write(response)
-        docx_file_bottom = generate_docx(query, response)
         st.download_button(
             label="📥 Download Analysis",
-            data=docx_file_bottom,
+            data=docx_file,
             file_name=file_name,
             mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
             key=f"{key_prefix}_download_bottom"
         )
 
+# --- Backend Connection ---
+BACKEND_URL = os.getenv("CUSTOMERBRIEF_BACKEND_URL", "http://127.0.0.1:9999/chat")
+BACKEND_TIMEOUT_SECONDS = 200
+
+@st.cache_resource
+def get_backend_session():
+    # One keep-alive session per process, shared by every session and rerun
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=20)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 # --- Process Query ---
+@instrumented("process_query")
 def process_query(query):
     with st.spinner("Processing..."):
         payload = {
@@ -233,7 +296,7 @@ def process_query(query):
         }
         try:
             # Send query to backend for processing
-            response = requests.post("http://127.0.0.1:9999/chat", json=payload)
+            response = get_backend_session().post(BACKEND_URL, json=payload, timeout=BACKEND_TIMEOUT_SECONDS)
             data = response.json()
             if "error" in data:
                 st.error(data["error"])  # Display error if response has an error
@@ -243,13 +306,14 @@ def process_query(query):
                 # Show download and share buttons, along with the response
                 show_download_buttons(query, data["response"], key_prefix="current")
 
-                # Store the current query and response in session history
-                st.session_state.chat_history.append((query, data["response"]))
+                # Store the current query and response in the persistent history
+                entry_id = get_history_store().add(get_owner_id(), query, data["response"])
+                # The session keeps a small reference; identical reports across sessions are stored once
+                st.session_state.viewed_report = report_store.put(data["response"], query, entry_id)
+                st.session_state.history_page = 0
 
-                # Enable share button and download feature if the analysis is successful
-                share_url = f"Check out the analysis for {query} at this link: [Company Analysis](http://127.0.0.1:9999/chat)"
-                st.markdown(f"### Share this Analysis")
-                st.markdown(f"[Share via Link]({share_url})")  # Shareable link to the analysis
+                # Enable the share link if the analysis is successful; it is shown with the viewed report
+                create_share_link(query, data["response"])
 
         except Exception as e:
             # Handle exceptions, such as network errors
@@ -277,8 +341,19 @@ if search_clicked or (user_query and user_query != st.session_state.last_query):
         st.warning("Please enter a query before searching.")
 
 # --- Show Saved Output if Needed ---
-if st.session_state.last_query:
-    for idx, (q, a) in enumerate(reversed(st.session_state.chat_history)):
-        if q == st.session_state.last_query:
-            st.markdown(f"### **User Query:** {q}")
-            show_download_buttons(q, a, key_prefix=f"history_{idx}_{slugify(q)[:30]}")
+viewed = st.session_state.viewed_report
+if viewed is not None:
+    viewed_body = load_report(viewed, get_owner_id())
+    if viewed_body is not None:
+        st.markdown(f"### **User Query:** {viewed.query}")
+        show_download_buttons(viewed.query, viewed_body, key_prefix=f"history_{viewed.entry_id}")
+
+        share_url = st.session_state.share_links.get(report_digest(viewed_body))
+        if share_url:
+            st.markdown("### Share this Analysis")
+            st.markdown(f"[Share via Link]({share_url})")  # Shareable link to the analysis
+        elif not SHARE_BASE_URL_CONFIGURED:
+            st.warning(SHARE_BASE_URL_MISSING)
+        else:
+            st.button("🔗 Share", key=f"history_{viewed.entry_id}_share", on_click=create_share_link,
+                      args=(viewed.query, viewed_body))
@@ -0,0 +1,165 @@
+# history_store.py
+
+import os
+import sqlite3
+import threading
+import time
+
+from report_store import report_digest
+
+DEFAULT_HISTORY_PATH = os.getenv("HISTORY_DB_PATH", os.path.join(".cache", "history.sqlite3"))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+HISTORY_MAX_ENTRIES = int(os.getenv("HISTORY_MAX_ENTRIES", "500"))  # per owner
+
+# Listing rows never touch report bodies; those are read one at a time, on demand
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner      TEXT NOT NULL,
+    query      TEXT NOT NULL,
+    query_fold TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    characters INTEGER NOT NULL,
+    digest     TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_history_owner ON history (owner, id);
+CREATE TABLE IF NOT EXISTS history_bodies (
+    entry_id INTEGER PRIMARY KEY REFERENCES history (id) ON DELETE CASCADE,
+    response TEXT NOT NULL
+);
+"""
+
+
+class HistoryEntry:
+    __slots__ = ("id", "query", "created_at", "characters", "digest")
+
+    def __init__(self, id, query, created_at, characters, digest):
+        self.id = id
+        self.query = query
+        self.created_at = created_at
+        self.characters = characters
+        self.digest = digest
+
+
+class HistoryPage:
+    __slots__ = ("entries", "page", "page_size", "total")
+
+    def __init__(self, entries, page, page_size, total):
+        self.entries = entries
+        self.page = page
+        self.page_size = page_size
+        self.total = total
+
+    @property
+    def page_count(self):
+        return max(1, -(-self.total // self.page_size))
+
+    @property
+    def has_previous(self):
+        return self.page > 0
+
+    @property
+    def has_next(self):
+        return self.page + 1 < self.page_count
+
+
+def _like_pattern(search):
+    escaped = search.casefold().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class HistoryStore:
+    """
+    SQLite-backed chat history, keyed by an owner id (one per browser).
+    Metadata rows are kept apart from report bodies, so paging and searching the
+    sidebar costs the same however long the reports are.
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH, max_entries=HISTORY_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(history)")]
+        if "digest" not in columns:
+            # Databases created before report bodies were content-addressed
+            self._conn.execute("ALTER TABLE history ADD COLUMN digest TEXT NOT NULL DEFAULT ''")
+        self._conn.commit()
+
+    def add(self, owner: str, query: str, response: str) -> int:
+        """
+        Appends an entry and returns its id; the owner's oldest entries beyond max_entries are dropped.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO history (owner, query, query_fold, created_at, characters, digest) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (owner, query, query.casefold(), time.time(), len(response), report_digest(response))
+            )
+            entry_id = cursor.lastrowid
+            self._conn.execute("INSERT INTO history_bodies (entry_id, response) VALUES (?, ?)", (entry_id, response))
+            self._conn.execute(
+                "DELETE FROM history WHERE id IN ("
+                "SELECT id FROM history WHERE owner = ? ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                (owner, self.max_entries)
+            )
+            self._conn.commit()
+        return entry_id
+
+    def page(self, owner: str, page=0, page_size=HISTORY_PAGE_SIZE, search=None) -> HistoryPage:
+        """
+        Returns one page of entries, newest first, optionally filtered by a case-insensitive substring.
+        """
+        where = "owner = ?"
+        params = [owner]
+        if search:
+            where += " AND query_fold LIKE ? ESCAPE '\\'"
+            params.append(_like_pattern(search))
+
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM history WHERE {where}", params).fetchone()[0]
+            page = min(max(0, page), max(0, -(-total // page_size) - 1))
+            rows = self._conn.execute(
+                f"SELECT id, query, created_at, characters, digest FROM history WHERE {where} "
+                "ORDER BY id DESC LIMIT ? OFFSET ?",
+                params + [page_size, page * page_size]
+            ).fetchall()
+        return HistoryPage([HistoryEntry(*row) for row in rows], page, page_size, total)
+
+    def get_entry(self, owner: str, entry_id: int):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, query, created_at, characters, digest FROM history WHERE owner = ? AND id = ?",
+                (owner, entry_id)
+            ).fetchone()
+        return HistoryEntry(*row) if row else None
+
+    def get_body(self, owner: str, entry_id: int):
+        """
+        Returns the full report for one entry, or None if it does not exist (or belongs to another owner).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT b.response FROM history_bodies b JOIN history h ON h.id = b.entry_id "
+                "WHERE h.owner = ? AND h.id = ?",
+                (owner, entry_id)
+            ).fetchone()
+        return row[0] if row else None
+
+    def delete(self, owner: str, entry_id: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM history WHERE owner = ? AND id = ?", (owner, entry_id))
+            self._conn.commit()
+
+    def count(self, owner: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM history WHERE owner = ?", (owner,)).fetchone()[0]
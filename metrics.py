@@ -0,0 +1,321 @@
+# metrics.py
+"""
+Per-stage latency, token and cache instrumentation.
+
+Stages are timed with the `timed` context manager or the `instrumented` decorator;
+token counts, first-token latency and cache outcomes are recorded explicitly. The
+process-wide registry is rendered in the Prometheus text format on /metrics (share
+server and backend), and every observation is also logged as one JSON line under
+"customerbrief.metrics".
+
+Instrumentation is off unless METRICS_ENABLED=1. When off, `instrumented` returns the
+function unchanged and the other helpers return before touching any state, so the
+only cost is one attribute check per call.
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "0").lower() in ("1", "true", "yes")
+METRICS_JSON_LOGS = os.getenv("METRICS_JSON_LOGS", "1").lower() in ("1", "true", "yes")
+
+# Upper bounds in seconds; a brief spans milliseconds (cache hit, docx) to minutes (deep-dive)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+logger = logging.getLogger("customerbrief.metrics")
+
+# name -> (type, help)
+METRICS = {
+    "customerbrief_stage_seconds": ("histogram", "Duration of one pipeline stage."),
+    "customerbrief_first_token_seconds": ("histogram", "Time from request to the first streamed token."),
+    "customerbrief_llm_tokens_total": ("counter", "Prompt and completion tokens used, by model and tier."),
+    "customerbrief_llm_cost_usd_total": ("counter", "Estimated completion cost in USD, by model and tier."),
+    "customerbrief_cache_requests_total": ("counter", "Cache lookups by cache and outcome."),
+    "customerbrief_stage_errors_total": ("counter", "Stages that raised, by stage and exception type."),
+    "customerbrief_rejected_requests_total": ("counter", "Requests turned away because the service was full."),
+}
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms keyed by metric name and label set.
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED, buckets=DEFAULT_BUCKETS, json_logs=METRICS_JSON_LOGS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self.json_logs = json_logs
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    def log(self, event, **fields):
+        if self.enabled and self.json_logs and logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"event": event, "ts": round(time.time(), 3), **fields}, default=str))
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render_prometheus(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format (version 0.0.4).
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (list(h.counts), h.total, h.count)) for key, h in self._histograms.items())
+
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described:
+                described.add(name)
+                kind, help_text = METRICS.get(name, ("untyped", ""))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, key), value in counters:
+            describe(name)
+            lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        for (name, key), (counts, total, count) in histograms:
+            describe(name)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        Returns {"counters": ..., "histograms": ...} as plain data, for JSON stats views.
+        """
+        with self._lock:
+            return {
+                "counters": {f"{name}{_format_labels(key)}": value for (name, key), value in self._counters.items()},
+                "histograms": {
+                    f"{name}{_format_labels(key)}": {"count": h.count, "sum": round(h.total, 4)}
+                    for (name, key), h in self._histograms.items()
+                },
+            }
+
+
+registry = MetricsRegistry()
+
+
+class _Timer:
+    __slots__ = ("stage", "labels", "started")
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _record_stage(self.stage, time.perf_counter() - self.started, exc_type, self.labels)
+        return False
+
+
+def _record_stage(stage, seconds, exc_type, labels):
+    registry.observe("customerbrief_stage_seconds", seconds, stage=stage, **labels)
+    if exc_type is not None:
+        registry.inc("customerbrief_stage_errors_total", stage=stage, error=exc_type.__name__)
+    registry.log("stage", stage=stage, seconds=round(seconds, 4),
+                 error=exc_type.__name__ if exc_type else None, **labels)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(stage, **labels):
+    """
+    Context manager recording the duration of one stage (and whether it raised).
+    """
+    if not registry.enabled:
+        return _NULL_TIMER
+    return _Timer(stage, labels)
+
+
+def instrumented(stage):
+    """
+    Decorator timing every call of the function as a stage; a no-op when metrics are disabled.
+    """
+    def decorate(fn):
+        if not registry.enabled:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Timer(stage, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def timed_stream(stage, chunks, **labels):
+    """
+    Yields from chunks, recording the stage from the first pull to exhaustion (or abandonment).
+    """
+    if not registry.enabled:
+        yield from chunks
+        return
+    with _Timer(stage, labels):
+        yield from chunks
+
+
+def timed_transform(stage, transform, chunks, **labels):
+    """
+    Yields from transform(chunks), a generator over a stream such as postprocess.clean_stream,
+    recording as the stage only the time spent inside transform: waiting for chunks is left out.
+    """
+    if not registry.enabled:
+        yield from transform(chunks)
+        return
+    waited = 0.0
+    upstream_failed = False
+
+    def source():
+        nonlocal waited, upstream_failed
+        iterator = iter(chunks)
+        while True:
+            started = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            except BaseException:
+                upstream_failed = True
+                raise
+            finally:
+                waited += time.perf_counter() - started
+            yield chunk
+
+    spent = 0.0
+    exc_type = None
+    iterator = transform(source())
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                spent += time.perf_counter() - started
+            yield item
+    except Exception as exc:
+        # An error from the stream being transformed belongs to the stage producing it
+        if not upstream_failed:
+            exc_type = type(exc)
+        raise
+    finally:
+        iterator.close()
+        _record_stage(stage, max(0.0, spent - waited), exc_type, labels)
+
+
+def record_cache(cache, outcome):
+    """
+    outcome is "hit", "miss", "fuzzy_hit", "suggested" or "bypass" (forced refresh).
+    """
+    if not registry.enabled:
+        return
+    registry.inc("customerbrief_cache_requests_total", cache=cache, outcome=outcome)
+    registry.log("cache", cache=cache, outcome=outcome)
+
+
+def record_usage(usage):
+    """
+    Records a finished TierUsage: first-token latency, token counts and estimated cost.
+    """
+    if not registry.enabled or usage.model is None:
+        return
+    labels = {"model": usage.model, "tier": usage.tier}
+    if usage.first_token_seconds is not None:
+        registry.observe("customerbrief_first_token_seconds", usage.first_token_seconds, **labels)
+    registry.inc("customerbrief_llm_tokens_total", usage.prompt_tokens, kind="prompt", **labels)
+    registry.inc("customerbrief_llm_tokens_total", usage.completion_tokens, kind="completion", **labels)
+    cost = usage.cost
+    if cost is not None:
+        registry.inc("customerbrief_llm_cost_usd_total", cost, **labels)
+    registry.log("llm", seconds=round(usage.seconds, 4), first_token_seconds=usage.first_token_seconds,
+                 prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens,
+                 cost_usd=cost, hedged=usage.hedged, **labels)
+
+
+def render_prometheus() -> str:
+    return registry.render_prometheus()
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,421 @@
+# openai_scheduler.py
+"""
+Process-wide admission control for OpenAI calls.
+
+Every completion passes through one Scheduler that enforces a requests-per-minute and a
+tokens-per-minute budget (token buckets), serves waiting callers strictly by priority
+(interactive searches before bulk batches before background prefetch), and retries
+429 / 5xx / connection errors with jittered exponential backoff. A 429 drains the
+buckets so every caller backs off, not just the one that received it.
+
+Wrap a client once and pass it wherever an OpenAI client is expected:
+    client = ScheduledOpenAI(OpenAI(), priority=INTERACTIVE)
+Pointing OPENAI_BASE_URL at a local mock server exercises the whole path offline.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+
+import openai
+from langchain_core.rate_limiters import BaseRateLimiter
+
+INTERACTIVE = 0
+BULK = 1
+PREFETCH = 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk", PREFETCH: "prefetch"}
+
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "200000"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "1.0"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "30"))
+
+# Used for the token budget when a request does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 1500
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,  # includes APITimeoutError
+)
+
+
+def estimate_prompt_tokens(messages):
+    # About four characters per token for English text; close enough for budgeting
+    return sum(len(str(message.get("content") or "")) for message in messages) // 4
+
+
+def estimate_tokens(messages, max_tokens=None):
+    return estimate_prompt_tokens(messages) + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+def retry_delay(error, attempt, base=OPENAI_BACKOFF_BASE, cap=OPENAI_BACKOFF_MAX):
+    """
+    Honours a Retry-After header when the API sends one, otherwise full-jitter exponential backoff.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return min(cap, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RequestCancelled(Exception):
+    """
+    Raised by a scheduled create() whose on_admitted hook declined to send the admitted request.
+    """
+
+
+class TokenBucket:
+    """
+    Refills continuously at rate_per_minute up to capacity (one minute's worth by default).
+    Not thread-safe on its own; the Scheduler serializes access.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """
+        Seconds until amount is available (0 when it is available now).
+        """
+        self._refill(now)
+        # A request larger than the bucket waits for a full bucket rather than forever
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def drain(self, seconds, now):
+        # Nothing is available again for `seconds`
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class _Ticket:
+    __slots__ = ("priority", "sequence", "tokens")
+
+    def __init__(self, priority, sequence, tokens):
+        self.priority = priority
+        self.sequence = sequence
+        self.tokens = tokens
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class Scheduler:
+    """
+    Admits requests under RPM/TPM budgets, highest priority (lowest number) first, FIFO within a priority.
+    """
+
+    def __init__(self, requests_per_minute=OPENAI_RPM, tokens_per_minute=OPENAI_TPM,
+                 max_retries=OPENAI_MAX_RETRIES, backoff_base=OPENAI_BACKOFF_BASE, backoff_max=OPENAI_BACKOFF_MAX):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+        self.admitted = {priority: 0 for priority in PRIORITY_NAMES}
+        self.wait_seconds = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self.max_wait_seconds = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self.retries = 0
+        self.rate_limited = 0
+        self.server_errors = 0
+        self.failures = 0
+
+    def acquire(self, priority=INTERACTIVE, tokens=DEFAULT_COMPLETION_TOKENS) -> float:
+        """
+        Blocks until the request may be sent; returns the seconds spent waiting.
+        """
+        started = time.monotonic()
+        with self._condition:
+            ticket = _Ticket(priority, next(self._sequence), tokens)
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    if self._queue[0] is ticket:
+                        now = time.monotonic()
+                        delay = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+                        if delay <= 0:
+                            self.requests.take(1)
+                            self.tokens.take(tokens)
+                            heapq.heappop(self._queue)
+                            break
+                        self._condition.wait(timeout=delay)
+                    else:
+                        self._condition.wait()
+            except BaseException:
+                # An abandoned waiter must not block the queue behind it
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                raise
+            finally:
+                # The next ticket in line re-checks the buckets
+                self._condition.notify_all()
+
+            waited = time.monotonic() - started
+            self.admitted[priority] += 1
+            self.wait_seconds[priority] += waited
+            self.max_wait_seconds[priority] = max(self.max_wait_seconds[priority], waited)
+        return waited
+
+    def settle(self, estimated, actual):
+        """
+        Corrects the token budget once the real usage of a request is known.
+        """
+        with self._condition:
+            if actual < estimated:
+                self.tokens.give_back(estimated - actual)
+                self._condition.notify_all()
+            elif actual > estimated:
+                self.tokens.take(actual - estimated)
+
+    def refund(self, tokens):
+        """
+        Returns the budget of a request that was admitted but never sent.
+        """
+        with self._condition:
+            self.requests.give_back(1)
+            self.tokens.give_back(tokens)
+            self._condition.notify_all()
+
+    def back_off(self, seconds):
+        # A 429 means the server-side budget is spent: hold every caller, not only the one that got it
+        with self._condition:
+            self.requests.drain(seconds, time.monotonic())
+            self._condition.notify_all()
+
+    def call(self, fn, priority=INTERACTIVE, tokens=DEFAULT_COMPLETION_TOKENS):
+        """
+        Runs fn() once admitted, retrying rate limits, server errors and connection errors.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority, tokens)
+            try:
+                return fn()
+            except RETRYABLE_ERRORS as e:
+                # A failed attempt generated nothing: only its request counts against the budget,
+                # so retries do not drain the token bucket during the bursts they back off from
+                self.settle(tokens, 0)
+                with self._condition:
+                    if isinstance(e, openai.RateLimitError):
+                        self.rate_limited += 1
+                    elif isinstance(e, openai.InternalServerError):
+                        self.server_errors += 1
+                    if attempt == self.max_retries:
+                        self.failures += 1
+                        raise
+                    self.retries += 1
+                delay = retry_delay(e, attempt, self.backoff_base, self.backoff_max)
+                if isinstance(e, openai.RateLimitError):
+                    self.back_off(delay)
+                else:
+                    time.sleep(delay)
+
+    def queue_depth(self):
+        with self._condition:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for ticket in self._queue:
+                depth[PRIORITY_NAMES.get(ticket.priority, str(ticket.priority))] += 1
+            return depth
+
+    def stats(self):
+        depth = self.queue_depth()
+        with self._condition:
+            return {
+                "queue_depth": depth,
+                "admitted": {PRIORITY_NAMES[p]: n for p, n in self.admitted.items()},
+                "avg_wait_seconds": {
+                    PRIORITY_NAMES[p]: round(self.wait_seconds[p] / n, 3) if n else 0.0
+                    for p, n in self.admitted.items()
+                },
+                "max_wait_seconds": {PRIORITY_NAMES[p]: round(w, 3) for p, w in self.max_wait_seconds.items()},
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "server_errors": self.server_errors,
+                "failures": self.failures,
+            }
+
+
+default_scheduler = Scheduler()
+
+
+class _SettlingStream:
+    """
+    Passes a streamed response through and settles its token charge once it ends, is closed or is
+    abandoned: with the usage chunk when the request set stream_options.include_usage, otherwise
+    with the prompt estimate plus the streamed text at four characters per token.
+    """
+
+    def __init__(self, stream, scheduler, estimated, prompt_tokens):
+        self._stream = stream
+        self._scheduler = scheduler
+        self._estimated = estimated
+        self._prompt_tokens = prompt_tokens
+        self._characters = 0
+        self._total_tokens = None
+        self._settled = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                usage = getattr(chunk, "usage", None)
+                if usage is not None and getattr(usage, "total_tokens", None):
+                    self._total_tokens = usage.total_tokens
+                for choice in getattr(chunk, "choices", None) or ():
+                    content = getattr(getattr(choice, "delta", None), "content", None)
+                    if content:
+                        self._characters += len(content)
+                yield chunk
+        finally:
+            self._settle()
+
+    def close(self):
+        # May be called from another thread to abort the read (e.g. a cancelled hedge)
+        try:
+            self._stream.close()
+        finally:
+            self._settle()
+
+    def _settle(self):
+        with self._lock:
+            if self._settled:
+                return
+            self._settled = True
+        actual = self._total_tokens or self._prompt_tokens + self._characters // 4
+        self._scheduler.settle(self._estimated, actual)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _ScheduledCompletions:
+    # Callers may pass on_admitted to create(); plain OpenAI clients don't accept it
+    reports_admission = True
+
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, on_admitted=None, **kwargs):
+        """
+        Like chat.completions.create, once admitted by the scheduler. on_admitted() is called on
+        every admission, right before the request is sent (so a caller can time from there);
+        returning False cancels it instead: the budget is refunded and RequestCancelled raised.
+        """
+        owner = self._owner
+        messages = kwargs.get("messages") or []
+        tokens = estimate_tokens(messages, kwargs.get("max_tokens") or kwargs.get("max_completion_tokens"))
+
+        def send():
+            if on_admitted is not None and on_admitted() is False:
+                owner.scheduler.refund(tokens)
+                raise RequestCancelled()
+            return owner.client.chat.completions.create(**kwargs)
+
+        response = owner.scheduler.call(send, owner.priority, tokens)
+        if kwargs.get("stream"):
+            # A stream is admitted (and retried) up to its first byte; errors mid-stream surface to the caller.
+            # Its usage is only known at the end, so the charge is settled then
+            return _SettlingStream(response, owner.scheduler, tokens, estimate_prompt_tokens(messages))
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "total_tokens", None):
+            owner.scheduler.settle(tokens, usage.total_tokens)
+        return response
+
+
+class _ScheduledChat:
+    def __init__(self, owner):
+        self.completions = _ScheduledCompletions(owner)
+
+
+class ScheduledOpenAI:
+    """
+    Drop-in wrapper for an OpenAI client whose chat completions go through a Scheduler at a
+    fixed priority. The SDK's own retries are disabled so backoff is decided in one place.
+    """
+
+    def __init__(self, client, scheduler=None, priority=INTERACTIVE):
+        self.client = client.with_options(max_retries=0)
+        self.scheduler = scheduler or default_scheduler
+        self.priority = priority
+        self.chat = _ScheduledChat(self)
+
+    def with_options(self, **options):
+        scheduled = ScheduledOpenAI.__new__(ScheduledOpenAI)
+        scheduled.client = self.client.with_options(**options)
+        scheduled.scheduler = self.scheduler
+        scheduled.priority = self.priority
+        scheduled.chat = _ScheduledChat(scheduled)
+        return scheduled
+
+    def with_priority(self, priority):
+        scheduled = self.with_options()
+        scheduled.priority = priority
+        return scheduled
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+class SchedulerRateLimiter(BaseRateLimiter):
+    """
+    Lets LangChain chat models (the search agent) queue on the same budgets as direct completions.
+    Only admission is shared; the model client keeps its own retries.
+    """
+
+    def __init__(self, scheduler=None, priority=INTERACTIVE, tokens=DEFAULT_COMPLETION_TOKENS):
+        self.scheduler = scheduler or default_scheduler
+        self.priority = priority
+        self.tokens = tokens
+
+    def acquire(self, *, blocking=True):
+        if not blocking:
+            return False
+        self.scheduler.acquire(self.priority, self.tokens)
+        return True
+
+    async def aacquire(self, *, blocking=True):
+        if not blocking:
+            return False
+        await asyncio.to_thread(self.scheduler.acquire, self.priority, self.tokens)
+        return True
+
+
+def scheduled_client(client, priority, scheduler=None):
+    """
+    Returns client scheduled at priority, whether or not it is already a ScheduledOpenAI.
+    """
+    if isinstance(client, ScheduledOpenAI):
+        return client.with_priority(priority)
+    return ScheduledOpenAI(client, scheduler=scheduler, priority=priority)
@@ -0,0 +1,153 @@
+# popularity_store.py
+
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from brief_cache import normalize_company_name
+
+DEFAULT_POPULARITY_PATH = os.getenv("POPULARITY_DB_PATH", os.path.join(".cache", "popularity.sqlite3"))
+# A request counts half as much after this long, so the ranking follows what is searched now
+POPULARITY_HALF_LIFE_SECONDS = float(os.getenv("POPULARITY_HALF_LIFE", str(3 * 24 * 3600)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS popularity (
+    company         TEXT PRIMARY KEY,
+    query           TEXT NOT NULL,
+    requests        INTEGER NOT NULL DEFAULT 0,
+    cache_hits      INTEGER NOT NULL DEFAULT 0,
+    score           REAL NOT NULL DEFAULT 0,
+    last_request    REAL NOT NULL,
+    prewarmed_at    REAL,
+    prewarm_used    INTEGER NOT NULL DEFAULT 0,
+    prewarms        INTEGER NOT NULL DEFAULT 0,
+    prewarm_hits    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_popularity_last_request ON popularity (last_request);
+"""
+
+
+class PopularAccount:
+    __slots__ = ("company", "query", "requests", "score", "last_request", "prewarmed_at")
+
+    def __init__(self, company, query, requests, score, last_request, prewarmed_at):
+        self.company = company
+        self.query = query
+        self.requests = requests
+        self.score = score
+        self.last_request = last_request
+        self.prewarmed_at = prewarmed_at
+
+
+def decayed(score, since, now, half_life=POPULARITY_HALF_LIFE_SECONDS):
+    return score * math.pow(0.5, max(0.0, now - since) / half_life)
+
+
+class PopularityStore:
+    """
+    SQLite-backed per-company request counts for pre-warming the brief cache.
+    Each company keeps an exponentially decayed request score (frequency weighted by recency),
+    plus whether its current brief was produced by the pre-warm job and has been used since,
+    which is what the pre-warm hit rate is computed from.
+    """
+
+    def __init__(self, path=DEFAULT_POPULARITY_PATH, half_life=POPULARITY_HALF_LIFE_SECONDS):
+        self.path = path
+        self.half_life = half_life
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def record(self, query: str, cached: bool):
+        """
+        Counts one interactive request for the query's company; cached tells whether it was served
+        from the full-brief cache entry that the pre-warm job keeps fresh.
+        """
+        company = normalize_company_name(query)
+        if not company:
+            return
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT score, last_request, prewarmed_at, prewarm_used FROM popularity WHERE company = ?",
+                (company,)
+            ).fetchone()
+            if row is None:
+                self._conn.execute(
+                    "INSERT INTO popularity (company, query, requests, cache_hits, score, last_request) "
+                    "VALUES (?, ?, 1, ?, 1, ?)",
+                    (company, query.strip(), int(cached), now)
+                )
+            else:
+                score, last_request, prewarmed_at, prewarm_used = row
+                # The first cache hit on a pre-warmed brief is a pre-warm hit; a miss means the
+                # brief is regenerated interactively, so later hits are no longer the job's
+                prewarm_hit = cached and prewarmed_at is not None and not prewarm_used
+                self._conn.execute(
+                    "UPDATE popularity SET query = ?, requests = requests + 1, cache_hits = cache_hits + ?, "
+                    "score = ?, last_request = ?, prewarmed_at = ?, prewarm_used = prewarm_used OR ?, "
+                    "prewarm_hits = prewarm_hits + ? WHERE company = ?",
+                    (query.strip(), int(cached), decayed(score, last_request, now, self.half_life) + 1, now,
+                     prewarmed_at if cached else None, int(prewarm_hit), int(prewarm_hit), company)
+                )
+            self._conn.commit()
+
+    def mark_prewarmed(self, company: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE popularity SET prewarmed_at = ?, prewarm_used = 0, prewarms = prewarms + 1 WHERE company = ?",
+                (time.time(), normalize_company_name(company))
+            )
+            self._conn.commit()
+
+    def top(self, limit=200, now=None):
+        """
+        Returns the limit most popular companies, highest decayed score first.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT company, query, requests, score, last_request, prewarmed_at FROM popularity"
+            ).fetchall()
+        accounts = [
+            PopularAccount(company, query, requests, decayed(score, last_request, now, self.half_life),
+                           last_request, prewarmed_at)
+            for company, query, requests, score, last_request, prewarmed_at in rows
+        ]
+        accounts.sort(key=lambda account: account.score, reverse=True)
+        return accounts[:limit]
+
+    def prune(self, older_than):
+        """
+        Forgets companies not requested for older_than seconds; returns how many were removed.
+        """
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM popularity WHERE last_request < ?", (time.time() - older_than,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self):
+        with self._lock:
+            tracked, requests, cache_hits, prewarms, prewarm_hits = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(requests), 0), COALESCE(SUM(cache_hits), 0), "
+                "COALESCE(SUM(prewarms), 0), COALESCE(SUM(prewarm_hits), 0) FROM popularity"
+            ).fetchone()
+        return {
+            "tracked_companies": tracked,
+            "requests": requests,
+            "cache_hit_rate": round(cache_hits / requests, 3) if requests else 0.0,
+            "prewarmed_briefs": prewarms,
+            "prewarm_hits": prewarm_hits,
+            # Share of pre-warmed briefs that an interactive request went on to use
+            "prewarm_hit_rate": round(prewarm_hits / prewarms, 3) if prewarms else 0.0,
+        }
@@ -0,0 +1,159 @@
+# postprocess.py
+"""
+Clean-up of model responses before they are shown, stored or exported.
+
+The model sometimes opens with a fallback disclaimer ("based on my expert knowledge...")
+and an introduction between the "🧠 Company Analysis" heading and the first numbered
+section. ResponseCleaner removes both from a token stream: it buffers only the text
+before the first section heading (bounded by max_head_chars), cleans that once, and then
+passes every chunk through with O(chunk) work, holding back trailing whitespace so the
+output equals the stripped batch result. clean_text applies the same rules to a whole
+response, so a stream and its concatenation always clean to the same text.
+"""
+
+import re
+
+ANALYSIS_HEADING = "🧠 Company Analysis"
+
+# Phrases that mark a leading paragraph as the model's fallback disclaimer
+FALLBACK_INDICATORS = (
+    "issue retrieving real-time data",
+    "based on my expert knowledge",
+    "latest publicly available information",
+    "compiled from public sources",
+    "prior to june 2024",
+    "i can provide a report",
+    "real-time data isn't available",
+)
+
+# A numbered section heading at the start of a line: "1. 🏢 Company Overview", "### 2. 💰 ...", "3) ..."
+# Whitespace is required after the number so figures such as "10.5% growth" never match
+_SECTION_HEADING_RE = re.compile(r"[ \t]*(?:#{1,6}[ \t]*)?(?:\*\*)?\d{1,2}[.)][ \t]+\S")
+
+# Long enough for a disclaimer and an introduction; a stream with no section heading by then is passed through
+MAX_HEAD_CHARS = 4000
+
+
+def is_disclaimer(paragraph: str) -> bool:
+    paragraph = paragraph.lower()
+    return any(indicator in paragraph for indicator in FALLBACK_INDICATORS)
+
+
+def strip_disclaimer(text: str) -> str:
+    """
+    Removes the first paragraph when it is a fallback disclaimer.
+    """
+    paragraphs = text.strip().split("\n\n")
+    if is_disclaimer(paragraphs[0]):
+        paragraphs = paragraphs[1:]
+    return "\n\n".join(paragraphs).strip()
+
+
+def _clean_head(head: str, before_section: bool) -> str:
+    """
+    Cleans the text before the first section heading (or all of it when there is none).
+    """
+    cleaned = strip_disclaimer(head) if head.strip() else ""
+    if not cleaned:
+        return ""
+    if not before_section:
+        # The head may have been cut mid-line by max_head_chars: keep the whitespace it ended with
+        return cleaned + head[len(head.rstrip()):]
+    # Keep the analysis heading itself; what follows it up to section 1 is the preamble
+    marker = cleaned.find(ANALYSIS_HEADING)
+    if marker != -1:
+        cleaned = cleaned[:marker + len(ANALYSIS_HEADING)]
+    return cleaned + "\n\n"
+
+
+class ResponseCleaner:
+    """
+    Incremental post-processor: feed() each chunk and emit what it returns, then emit finish().
+    Not thread-safe; use one instance per stream.
+    """
+    __slots__ = ("max_head_chars", "_head", "_scan_from", "_passing", "_started", "_pending")
+
+    def __init__(self, max_head_chars=MAX_HEAD_CHARS):
+        self.max_head_chars = max_head_chars
+        self._head = ""
+        self._scan_from = 0      # start of the first line not yet ruled out as a section heading
+        self._passing = False
+        self._started = False    # whether any text has been emitted (leading whitespace is dropped)
+        self._pending = ""       # trailing whitespace held back until more text follows
+
+    def feed(self, chunk: str) -> str:
+        if not chunk:
+            return ""
+        if self._passing:
+            return self._emit(chunk)
+
+        self._head += chunk
+        heading_at = self._find_section_heading()
+        if heading_at is not None:
+            return self._release(heading_at)
+        if self.max_head_chars is not None and len(self._head) > self.max_head_chars:
+            return self._release(None)
+        return ""
+
+    def finish(self) -> str:
+        """
+        Returns the rest of the cleaned text once the stream has ended.
+        """
+        text = "" if self._passing else self._release(None)
+        self._pending = ""
+        return text
+
+    def _find_section_heading(self):
+        head = self._head
+        position = self._scan_from
+        while position < len(head):
+            if _SECTION_HEADING_RE.match(head, position):
+                return position
+            newline = head.find("\n", position)
+            if newline == -1:
+                # An unfinished line is checked again when the next chunk arrives
+                break
+            position = newline + 1
+        self._scan_from = position
+        return None
+
+    def _release(self, heading_at):
+        head = self._head
+        self._head = ""
+        self._passing = True
+        if heading_at is None:
+            return self._emit(_clean_head(head, before_section=False))
+        return self._emit(_clean_head(head[:heading_at], before_section=True) + head[heading_at:])
+
+    def _emit(self, text):
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        text = self._pending + text
+        stripped = text.rstrip()
+        self._pending = text[len(stripped):]
+        return stripped
+
+
+def clean_stream(chunks, max_head_chars=MAX_HEAD_CHARS):
+    """
+    Yields the cleaned text of a stream of chunks; only non-empty chunks are yielded.
+    """
+    cleaner = ResponseCleaner(max_head_chars)
+    for chunk in chunks:
+        text = cleaner.feed(chunk)
+        if text:
+            yield text
+    text = cleaner.finish()
+    if text:
+        yield text
+
+
+def clean_text(text: str) -> str:
+    """
+    Batch form of clean_stream: drops a leading disclaimer and the preamble before section 1.
+    """
+    cleaner = ResponseCleaner(max_head_chars=None)
+    return cleaner.feed(text) + cleaner.finish()
@@ -0,0 +1,214 @@
+# prewarm.py
+"""
+Off-peak pre-warming of the brief cache for the most requested accounts.
+
+Usage:
+    python prewarm.py --top 200 --window 01:00-06:00 --max-briefs 100 --max-cost 5 --every 3600
+
+Accounts are ranked by their decayed request score in the popularity store (filled by
+app.py on every search). An account is regenerated when its brief is missing or expires
+within --horizon seconds, so popular briefs are renewed before users hit an expired entry.
+Each pass stops at the --max-briefs / --max-cost budget, and requests go out one at a
+time at the lowest (prefetch) priority, so interactive searches in the same process
+always go first. Without --every the job runs one pass (for cron); with it, it keeps
+running and only works inside the window. The pre-warm hit rate is printed after each pass.
+
+Run as a separate process, the job only shares the OpenAI budget through --rpm. With
+PREWARM_AUTOSTART=1, app.py runs it on a background thread instead, where it queues
+behind the app's own searches on the shared scheduler.
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from functools import partial
+
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from batch_briefs import RateLimiter
+from brief_cache import BriefCache
+from brief_pipeline import BRIEF_MODEL, PROMPT_VERSION, LatencyPolicy, TierUsage, coalesced_brief, complete_brief
+from openai_scheduler import PREFETCH, scheduled_client
+from popularity_store import PopularityStore
+
+PREWARM_TOP = int(os.getenv("PREWARM_TOP", "200"))
+PREWARM_HORIZON_SECONDS = float(os.getenv("PREWARM_HORIZON", str(24 * 3600)))
+PREWARM_MAX_BRIEFS = int(os.getenv("PREWARM_MAX_BRIEFS", "100"))
+PREWARM_MAX_COST_USD = float(os.getenv("PREWARM_MAX_COST", "5"))
+PREWARM_RPM = int(os.getenv("PREWARM_RPM", "10"))
+PREWARM_WINDOW = os.getenv("PREWARM_WINDOW", "01:00-06:00")
+# Accounts searched only once in the last half-life or so are not worth a pre-warmed brief
+PREWARM_MIN_SCORE = float(os.getenv("PREWARM_MIN_SCORE", "1.5"))
+PREWARM_AUTOSTART = os.getenv("PREWARM_AUTOSTART", "0").lower() in ("1", "true", "yes")
+PREWARM_EVERY_SECONDS = float(os.getenv("PREWARM_EVERY", "3600"))
+
+# Background work never hedges: a second request would double its cost to save latency nobody waits on
+PREWARM_POLICY = LatencyPolicy(hedge_after=0)
+
+logger = logging.getLogger("customerbrief.prewarm")
+
+
+def parse_window(window):
+    """
+    "01:00-06:00" -> (60, 360) in minutes after midnight; an empty window means always.
+    """
+    if not window:
+        return None
+    start, end = window.split("-")
+    to_minutes = lambda text: int(text.split(":")[0]) * 60 + int(text.split(":")[1])
+    return to_minutes(start), to_minutes(end)
+
+
+def in_window(window, now=None):
+    if window is None:
+        return True
+    now = now or datetime.now()
+    minute = now.hour * 60 + now.minute
+    start, end = window
+    # A window such as 22:00-05:00 wraps around midnight
+    return start <= minute < end if start <= end else minute >= start or minute < end
+
+
+class PrewarmBudget:
+    __slots__ = ("max_briefs", "max_cost", "briefs", "cost")
+
+    def __init__(self, max_briefs=PREWARM_MAX_BRIEFS, max_cost=PREWARM_MAX_COST_USD):
+        self.max_briefs = max_briefs
+        self.max_cost = max_cost
+        self.briefs = 0
+        self.cost = 0.0
+
+    @property
+    def exhausted(self):
+        return self.briefs >= self.max_briefs or self.cost >= self.max_cost
+
+    def charge(self, usage):
+        self.briefs += 1
+        # An unpriced model is charged nothing, so the brief count remains the only cap
+        self.cost += usage.cost or 0.0
+
+
+def select_accounts(popularity, cache, top=PREWARM_TOP, horizon=PREWARM_HORIZON_SECONDS, min_score=PREWARM_MIN_SCORE):
+    """
+    Returns the popular accounts whose brief is missing or expires within horizon seconds, hottest first.
+    """
+    deadline = time.time() + horizon
+    due = []
+    for account in popularity.top(top):
+        if account.score < min_score:
+            break
+        cached = cache.peek(account.company, BRIEF_MODEL, PROMPT_VERSION)
+        if cached is None or cached.expires_at <= deadline:
+            due.append(account)
+    return due
+
+
+def run_prewarm(client, cache, popularity, top=PREWARM_TOP, horizon=PREWARM_HORIZON_SECONDS, budget=None,
+                requests_per_minute=PREWARM_RPM, window=None, on_brief=None):
+    """
+    Regenerates the due accounts one at a time until the list, the budget or the window runs out.
+    on_brief(account, usage) is called after each brief. Returns a summary dict for the pass.
+    """
+    budget = budget or PrewarmBudget()
+    # Lowest priority on the shared budget: any waiting interactive or batch request is admitted first
+    client = scheduled_client(client, PREFETCH)
+    limiter = RateLimiter(requests_per_minute)
+    due = select_accounts(popularity, cache, top, horizon)
+    warmed, failed, stopped = 0, 0, "done"
+
+    for account in due:
+        if budget.exhausted:
+            stopped = "budget"
+            break
+        if not in_window(window):
+            stopped = "window"
+            break
+        limiter.wait()
+        usage = TierUsage("prewarm")
+        try:
+            # Joins an interactive request for the same account instead of generating it twice
+            coalesced_brief(client, account.query, cache, PROMPT_VERSION,
+                            complete=partial(complete_brief, policy=PREWARM_POLICY, usage=usage))
+        except Exception as e:
+            failed += 1
+            logger.warning("prewarm failed: company=%r error=%r", account.company, e)
+            continue
+        budget.charge(usage)
+        popularity.mark_prewarmed(account.company)
+        warmed += 1
+        logger.info("prewarmed: company=%r score=%.2f %s", account.company, account.score, usage.describe())
+        if on_brief is not None:
+            on_brief(account, usage)
+
+    return {
+        "due": len(due),
+        "warmed": warmed,
+        "failed": failed,
+        "stopped": stopped,
+        "cost_usd": round(budget.cost, 4),
+        **popularity.stats(),
+    }
+
+
+def prewarm_forever(client, cache, popularity, window=None, every=PREWARM_EVERY_SECONDS, **options):
+    while True:
+        if in_window(window):
+            try:
+                logger.info("prewarm pass: %s", run_prewarm(client, cache, popularity, window=window, **options))
+            except Exception:
+                logger.exception("prewarm pass failed")
+        time.sleep(every)
+
+
+def start_background_prewarm(client, cache, popularity, window=PREWARM_WINDOW, every=PREWARM_EVERY_SECONDS):
+    """
+    Runs pre-warm passes on a daemon thread of the calling process and returns the thread.
+    """
+    thread = threading.Thread(target=prewarm_forever, args=(client, cache, popularity, parse_window(window), every),
+                              name="prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Pre-warm the brief cache for the most requested accounts.")
+    parser.add_argument("--top", type=int, default=PREWARM_TOP, help="How many of the most requested accounts to keep warm")
+    parser.add_argument("--horizon", type=float, default=PREWARM_HORIZON_SECONDS,
+                        help="Regenerate briefs expiring within this many seconds")
+    parser.add_argument("--max-briefs", type=int, default=PREWARM_MAX_BRIEFS, help="Brief budget per pass")
+    parser.add_argument("--max-cost", type=float, default=PREWARM_MAX_COST_USD, help="Estimated USD budget per pass")
+    parser.add_argument("--rpm", type=int, default=PREWARM_RPM, help="Maximum requests per minute")
+    parser.add_argument("--window", default=PREWARM_WINDOW, help="Off-peak hours, e.g. 01:00-06:00 (empty: any time)")
+    parser.add_argument("--every", type=float, default=0, help="Seconds between passes (default: run one pass and exit)")
+    parser.add_argument("--stats", action="store_true", help="Print popularity and pre-warm statistics and exit")
+    args = parser.parse_args()
+
+    cache = BriefCache()
+    popularity = PopularityStore()
+    if args.stats:
+        print(json.dumps(popularity.stats(), indent=2))
+        return
+
+    window = parse_window(args.window)
+    client = OpenAI()
+    while True:
+        if in_window(window):
+            summary = run_prewarm(client, cache, popularity, args.top, args.horizon,
+                                  PrewarmBudget(args.max_briefs, args.max_cost), args.rpm, window)
+            print(json.dumps(summary), flush=True)
+        elif not args.every:
+            print(f"Outside the pre-warm window {args.window}; nothing to do.")
+        if not args.every:
+            return
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
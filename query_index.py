@@ -0,0 +1,210 @@
+# query_index.py
+
+import hashlib
+import os
+import random
+import threading
+import time
+import unicodedata
+
+from brief_cache import normalize_company_name
+from company_utils import company_suffixes
+
+# Near-duplicates at or above FUZZY_SERVE_THRESHOLD are served from the existing brief;
+# matches between the two thresholds are offered as "did you mean"
+FUZZY_SERVE_THRESHOLD = float(os.getenv("FUZZY_SERVE_THRESHOLD", "0.85"))
+FUZZY_SUGGEST_THRESHOLD = float(os.getenv("FUZZY_SUGGEST_THRESHOLD", "0.5"))
+
+SHINGLE_SIZE = 3
+MINHASH_BANDS = 16
+MINHASH_ROWS = 4
+# New cache rows are picked up at most this often, so other sessions' and processes' briefs become matchable
+INDEX_REFRESH_SECONDS = 30
+
+_MERSENNE_PRIME = (1 << 61) - 1
+# Suffixes as token sequences, normalized like the cache keys ("S.A.S." -> ("s", "a", "s")); longest first
+_SUFFIX_TOKENS = sorted({tuple(normalize_company_name(s).split()) for s in company_suffixes}, key=len, reverse=True)
+
+# Only words that phrase a request, never words that can be part of a name: "Amazon Logistics" or
+# "General Motors Financial" is another company than "Amazon" or "General Motors", so business and
+# topic words (the detector's QUERY_FILLER_WORDS) are kept and only count towards shingle similarity
+REQUEST_FILLER_WORDS = {
+    "a", "an", "the", "of", "on", "for", "in", "about", "me", "tell", "give", "show", "get", "please",
+    "its", "their", "it", "is", "what", "who",
+    "brief", "briefing", "report", "analysis", "overview", "summary", "profile", "info", "information", "details",
+    "company", "account",
+}
+
+
+def canonical_company(query: str) -> str:
+    """
+    Reduces a query to the bare company name: "Apple Inc. brief" -> "apple".
+    Request filler words and trailing legal suffixes are dropped; a query made only of those is kept as normalized.
+    """
+    normalized = normalize_company_name(query)
+    # Accents are dropped too, so "Nestlé" and "Nestle" are the same name, and "and" is spelled "&"
+    tokens = ["&" if token == "and" else token
+              for token in unicodedata.normalize("NFKD", normalized).encode("ascii", "ignore").decode("ascii").split()]
+    # Trailing suffixes go before any filler word, as a suffix can contain one ("S.A." -> "s a")
+    stripped = True
+    while stripped and len(tokens) > 1:
+        stripped = False
+        for suffix in _SUFFIX_TOKENS:
+            if len(tokens) > len(suffix) and tuple(tokens[-len(suffix):]) == suffix:
+                del tokens[-len(suffix):]
+                stripped = True
+                break
+        if not stripped and tokens[-1] in REQUEST_FILLER_WORDS:
+            tokens.pop()
+            stripped = True
+    tokens = [token for token in tokens if token not in REQUEST_FILLER_WORDS]
+    return " ".join(tokens) or normalized
+
+
+def shingles(text: str, size=SHINGLE_SIZE):
+    padded = f" {text} "
+    if len(padded) <= size:
+        return {padded}
+    return {padded[i:i + size] for i in range(len(padded) - size + 1)}
+
+
+def jaccard(a, b) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class QueryMatch:
+    __slots__ = ("company", "score")
+
+    def __init__(self, company, score):
+        self.company = company
+        self.score = score
+
+    @property
+    def servable(self) -> bool:
+        return self.score >= FUZZY_SERVE_THRESHOLD
+
+
+class QueryIndex:
+    """
+    In-memory similarity index over the companies that already have a brief, so near-duplicate
+    queries ("apple", "Apple Inc.", "apple inc brief") reuse one brief instead of a new completion.
+
+    Queries are reduced to their canonical company name and character-shingled; MinHash
+    signatures split into LSH bands find candidates without scanning every entry, and the best
+    candidate is scored by exact shingle Jaccard similarity. Entries are the normalized company
+    names stored in the brief cache; add() registers new ones as they are generated.
+    """
+
+    def __init__(self, bands=MINHASH_BANDS, rows=MINHASH_ROWS, seed=1):
+        self.bands = bands
+        self.rows = rows
+        rng = random.Random(seed)
+        self._permutations = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(bands * rows)
+        ]
+        self._entries = {}   # company -> (canonical name, shingles)
+        self._buckets = {}   # (band, band signature) -> set of companies
+        self._canonical = {}  # canonical name -> set of companies
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _signature(self, shingle_set):
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+                  for s in shingle_set]
+        return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._permutations]
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, tuple(signature[band * self.rows:(band + 1) * self.rows])
+
+    def add(self, company: str):
+        company = normalize_company_name(company)
+        canonical = canonical_company(company)
+        shingle_set = shingles(canonical)
+        signature = self._signature(shingle_set)
+        with self._lock:
+            if company in self._entries:
+                return
+            self._entries[company] = (canonical, shingle_set)
+            self._canonical.setdefault(canonical, set()).add(company)
+            for key in self._band_keys(signature):
+                self._buckets.setdefault(key, set()).add(company)
+
+    def discard(self, company: str):
+        company = normalize_company_name(company)
+        with self._lock:
+            entry = self._entries.pop(company, None)
+            if entry is None:
+                return
+            canonical, shingle_set = entry
+            self._canonical[canonical].discard(company)
+            if not self._canonical[canonical]:
+                del self._canonical[canonical]
+            for key in self._band_keys(self._signature(shingle_set)):
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(company)
+                    if not bucket:
+                        del self._buckets[key]
+
+    def match(self, query: str, threshold=FUZZY_SUGGEST_THRESHOLD):
+        """
+        Returns the QueryMatch of the most similar indexed company scoring at least threshold, or None.
+        An exact normalized match is not reported: the regular cache lookup already covers it.
+        """
+        normalized = normalize_company_name(query)
+        canonical = canonical_company(normalized)
+        shingle_set = shingles(canonical)
+        signature = self._signature(shingle_set)
+        with self._lock:
+            exact = self._canonical.get(canonical, set()) - {normalized}
+            if exact:
+                # Same company once suffixes and filler are stripped; prefer the shortest stored spelling
+                return QueryMatch(min(exact, key=len), 1.0)
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates.update(self._buckets.get(key, ()))
+            candidates.discard(normalized)
+            scored = [(jaccard(shingle_set, self._entries[company][1]), company) for company in candidates]
+        if not scored:
+            return None
+        score, company = max(scored, key=lambda item: (item[0], -len(item[1])))
+        return QueryMatch(company, score) if score >= threshold else None
+
+
+class CachedQueryIndex(QueryIndex):
+    """
+    QueryIndex over the briefs of one model and prompt version in a BriefCache, kept in step
+    with the cache by periodically pulling rows created since the last refresh.
+    """
+
+    def __init__(self, cache, model, prompt_version, refresh_seconds=INDEX_REFRESH_SECONDS, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+        self.model = model
+        self.prompt_version = prompt_version
+        self.refresh_seconds = refresh_seconds
+        self._synced_at = 0.0   # cache clock (created_at) of the newest row seen
+        self._checked_at = None  # monotonic time of the last refresh
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self, force=False):
+        with self._refresh_lock:
+            now = time.monotonic()
+            if not force and self._checked_at is not None and now - self._checked_at < self.refresh_seconds:
+                return
+            self._checked_at = now
+            rows = self.cache.companies(self.model, self.prompt_version, since=self._synced_at)
+        for company, created_at in rows:
+            self.add(company)
+            self._synced_at = max(self._synced_at, created_at)
+
+    def match(self, query: str, threshold=FUZZY_SUGGEST_THRESHOLD):
+        self.refresh()
+        return super().match(query, threshold)
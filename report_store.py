@@ -0,0 +1,125 @@
+# report_store.py
+
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+
+# Upper bound on compressed report bytes held in memory (per process)
+REPORT_STORE_MAX_BYTES = int(os.getenv("REPORT_STORE_MAX_BYTES", str(32 * 1024 * 1024)))
+REPORT_COMPRESSION_LEVEL = int(os.getenv("REPORT_COMPRESSION_LEVEL", "6"))
+
+
+def report_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ReportRef:
+    """
+    What a session keeps instead of a report: the content hash plus enough to find it again.
+    entry_id points at the history row, used to reload the body after it has been evicted.
+    """
+    __slots__ = ("digest", "query", "characters", "entry_id")
+
+    def __init__(self, digest, query, characters, entry_id=None):
+        self.digest = digest
+        self.query = query
+        self.characters = characters
+        self.entry_id = entry_id
+
+
+class ReportStore:
+    """
+    Process-wide store of report texts, interned by content hash and zlib-compressed in memory.
+    Identical reports (the same cached brief opened by many sessions) are held once.
+    Least recently used reports are evicted once the compressed total exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes=REPORT_STORE_MAX_BYTES, level=REPORT_COMPRESSION_LEVEL):
+        self.max_bytes = max_bytes
+        self.level = level
+        self.compressed_bytes = 0
+        self.raw_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.deduplicated = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # digest -> (compressed bytes, raw size)
+        self._lock = threading.Lock()
+
+    def put(self, text: str, query="", entry_id=None) -> ReportRef:
+        """
+        Interns a report and returns a reference to it; storing the same text again costs nothing.
+        """
+        digest = report_digest(text)
+        with self._lock:
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+                self.deduplicated += 1
+                return ReportRef(digest, query, len(text), entry_id)
+
+        # Compression happens outside the lock so sessions don't wait on each other
+        raw = text.encode("utf-8")
+        compressed = zlib.compress(raw, self.level)
+
+        with self._lock:
+            if digest not in self._entries and len(compressed) <= self.max_bytes:
+                self._entries[digest] = (compressed, len(raw))
+                self.compressed_bytes += len(compressed)
+                self.raw_bytes += len(raw)
+                while self.compressed_bytes > self.max_bytes:
+                    _, (evicted, evicted_raw) = self._entries.popitem(last=False)
+                    self.compressed_bytes -= len(evicted)
+                    self.raw_bytes -= evicted_raw
+                    self.evictions += 1
+        return ReportRef(digest, query, len(text), entry_id)
+
+    def get(self, ref, loader=None):
+        """
+        Returns the report text for a ReportRef (or digest). After an eviction, loader() is called
+        to fetch the text from durable storage and the result is interned again; without a loader
+        an evicted report returns None.
+        """
+        digest = ref.digest if isinstance(ref, ReportRef) else ref
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is not None:
+            return zlib.decompress(entry[0]).decode("utf-8")
+        if loader is None:
+            return None
+        text = loader()
+        if text is not None:
+            self.put(text)
+        return text
+
+    def __contains__(self, digest):
+        with self._lock:
+            return digest in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "compressed_bytes": self.compressed_bytes,
+                "raw_bytes": self.raw_bytes,
+                "compression_ratio": round(self.raw_bytes / self.compressed_bytes, 2) if self.compressed_bytes else 0.0,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "deduplicated": self.deduplicated,
+                "evictions": self.evictions,
+            }
+
+
+report_store = ReportStore()
@@ -0,0 +1,172 @@
+# share_server.py
+"""
+Serves shared briefs as pre-rendered, gzip-compressed HTML.
+
+Usage:
+    python share_server.py --host 0.0.0.0 --port 8502
+
+Shared reports are stored once under SHARE_DIR as <sha256 of the report>.html.gz,
+so sharing the same report again reuses the file. Pages never change once written,
+which lets browsers and proxies cache them indefinitely; opening a shared brief
+costs a file read, not an LLM call.
+"""
+
+import argparse
+import gzip
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from assets import load_asset, sniff_mime
+from metrics import PROMETHEUS_CONTENT_TYPE, registry
+
+SHARE_DIR = os.getenv("SHARE_DIR", os.path.join(".cache", "shares"))
+SHARE_HOST = os.getenv("SHARE_HOST", "127.0.0.1")
+SHARE_PORT = int(os.getenv("SHARE_PORT", "8502"))
+SHARE_BASE_URL = os.getenv("SHARE_BASE_URL", f"http://{SHARE_HOST}:{SHARE_PORT}").rstrip("/")
+# Without an explicit base URL, links point at this machine's own address, which nobody else can open,
+# so the apps withhold them until it is set
+SHARE_BASE_URL_CONFIGURED = bool(os.getenv("SHARE_BASE_URL"))
+SHARE_BASE_URL_MISSING = "🔗 Sharing is unavailable: set SHARE_BASE_URL to the address others use to reach the share server."
+# The Streamlit apps start an in-process server on first share unless this is off
+SHARE_SERVER_AUTOSTART = os.getenv("SHARE_SERVER_AUTOSTART", "1").lower() in ("1", "true", "yes")
+
+_DIGEST_RE = re.compile(r"^/r/([0-9a-f]{64})/?$")
+_IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def share_path(digest: str) -> str:
+    return os.path.join(SHARE_DIR, f"{digest}.html.gz")
+
+
+def share_url(digest: str) -> str:
+    return f"{SHARE_BASE_URL}/r/{digest}"
+
+
+def is_published(digest: str) -> bool:
+    return os.path.exists(share_path(digest))
+
+
+def store_page(digest: str, page: str):
+    """
+    Writes a compressed page for the digest unless one already exists.
+    """
+    path = share_path(digest)
+    if os.path.exists(path):
+        return path
+    os.makedirs(SHARE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    # mtime=0 keeps the bytes identical for identical pages
+    with open(tmp_path, "wb") as f:
+        f.write(gzip.compress(page.encode("utf-8"), compresslevel=9, mtime=0))
+    os.replace(tmp_path, path)
+    return path
+
+
+class ShareHandler(BaseHTTPRequestHandler):
+    server_version = "CustomerBriefShare/1.0"
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body):
+        path = self.path.split("?", 1)[0]
+        if path == "/health":
+            return self._send(200, b"ok", "text/plain; charset=utf-8", send_body=send_body)
+        if path == "/metrics" and registry.enabled:
+            # The in-process server doubles as the Streamlit app's scrape target
+            return self._send(200, registry.render_prometheus().encode("utf-8"), PROMETHEUS_CONTENT_TYPE,
+                              cache_control="no-store", send_body=send_body)
+        if path == "/assets/logo":
+            logo = load_asset("logo")
+            if not logo:
+                return self._send(404, b"Not found", "text/plain; charset=utf-8", send_body=send_body)
+            return self._send(200, logo, sniff_mime(logo), cache_control="public, max-age=86400", send_body=send_body)
+
+        match = _DIGEST_RE.match(path)
+        if not match:
+            return self._send(404, b"Not found", "text/plain; charset=utf-8", send_body=send_body)
+
+        digest = match.group(1)
+        etag = f'"{digest}"'
+        if etag in (self.headers.get("If-None-Match") or ""):
+            return self._send(304, b"", None, etag=etag, cache_control=_IMMUTABLE, send_body=False)
+
+        try:
+            with open(share_path(digest), "rb") as f:
+                compressed = f.read()
+        except FileNotFoundError:
+            return self._send(404, b"This shared brief does not exist.", "text/plain; charset=utf-8",
+                              send_body=send_body)
+
+        # Pages are stored compressed; only clients without gzip support pay for decompression
+        if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            body, encoding = compressed, "gzip"
+        else:
+            body, encoding = gzip.decompress(compressed), None
+        self._send(200, body, "text/html; charset=utf-8", etag=etag, cache_control=_IMMUTABLE,
+                   encoding=encoding, send_body=send_body)
+
+    def _send(self, status, body, content_type, etag=None, cache_control=None, encoding=None, send_body=True):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        if etag:
+            self.send_header("ETag", etag)
+        if cache_control:
+            self.send_header("Cache-Control", cache_control)
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body and body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(host=SHARE_HOST, port=SHARE_PORT):
+    server = ThreadingHTTPServer((host, port), ShareHandler)
+    server.daemon_threads = True
+    return server
+
+
+def start_background_server(host=SHARE_HOST, port=SHARE_PORT):
+    """
+    Starts the share server on a daemon thread and returns it, or None if the port is
+    already taken (typically by another app process that is serving the same SHARE_DIR).
+    """
+    try:
+        server = make_server(host, port)
+    except OSError:
+        return None
+    threading.Thread(target=server.serve_forever, name="share-server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve shared CustomerBrief reports.")
+    parser.add_argument("--host", default=SHARE_HOST)
+    parser.add_argument("--port", type=int, default=SHARE_PORT)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    print(f"Serving shared briefs from {SHARE_DIR} on http://{args.host}:{args.port}")
+    if not SHARE_BASE_URL_CONFIGURED:
+        print(f"SHARE_BASE_URL is not set; the apps will not hand out links to {SHARE_BASE_URL}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
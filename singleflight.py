@@ -0,0 +1,151 @@
+# singleflight.py
+
+import threading
+
+
+class _Flight:
+    __slots__ = ("chunks", "done", "error", "result", "condition", "followers")
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.result = None
+        self.condition = threading.Condition()
+        self.followers = 0
+
+    def finish(self, result=None, error=None):
+        with self.condition:
+            self.result = "".join(self.chunks) if result is None and error is None else result
+            self.error = error
+            self.done = True
+            self.condition.notify_all()
+
+    def wait(self):
+        with self.condition:
+            while not self.done:
+                self.condition.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def replay(self):
+        """
+        Yields every chunk from the first one, then new chunks as they arrive, until the flight ends.
+        """
+        position = 0
+        while True:
+            with self.condition:
+                while position >= len(self.chunks) and not self.done:
+                    self.condition.wait()
+                pending = self.chunks[position:]
+                position = len(self.chunks)
+                finished = self.done
+            yield from pending
+            if finished and position >= len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                if not self.chunks and self.result:
+                    # Attached to a blocking call, which produces its text in one piece
+                    yield self.result
+                return
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: the first caller for a key does the work and every
+    caller that arrives while it is in flight shares its result (or its exception).
+
+    do() runs a blocking call; stream() runs a generator of text chunks on a background
+    thread, so followers can attach mid-stream and replay what was already produced, and a
+    leader that stops reading does not stall the others. Both share one key space: a blocking
+    follower of a stream receives the joined text, a streaming follower of a blocking call
+    receives the text in one chunk. Keys are released as soon as the call finishes, so this
+    only deduplicates work in flight; finished results belong in a cache.
+    """
+
+    def __init__(self, name="singleflight"):
+        self.name = name
+        self.leaders = 0
+        self.followers = 0
+        self.stream_followers = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key):
+        """
+        Returns (flight, is_leader), registering a new flight when none is in progress.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                self.followers += 1
+                return flight, False
+            flight = _Flight()
+            self._flights[key] = flight
+            self.leaders += 1
+            return flight, True
+
+    def _release(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def do(self, key, fn):
+        """
+        Returns (result, shared): fn() runs at most once per key at a time; shared is True when
+        this caller received another caller's result.
+        """
+        flight, leader = self._join(key)
+        if not leader:
+            return flight.wait(), True
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._release(key, flight)
+            flight.finish(error=e)
+            raise
+        self._release(key, flight)
+        flight.finish(result=result)
+        return result, False
+
+    def stream(self, key, gen_fn):
+        """
+        Returns an iterator over the chunks of gen_fn() shared by every concurrent caller of key.
+        """
+        flight, leader = self._join(key)
+        if leader:
+            threading.Thread(target=self._pump, args=(key, flight, gen_fn),
+                             name=f"{self.name}-stream", daemon=True).start()
+        else:
+            with self._lock:
+                self.stream_followers += 1
+        return flight.replay()
+
+    def _pump(self, key, flight, gen_fn):
+        try:
+            for chunk in gen_fn():
+                with flight.condition:
+                    flight.chunks.append(chunk)
+                    flight.condition.notify_all()
+        except BaseException as e:
+            self._release(key, flight)
+            flight.finish(error=e)
+            return
+        self._release(key, flight)
+        flight.finish()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "calls_saved": self.followers,
+                "stream_followers": self.stream_followers,
+            }
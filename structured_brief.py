@@ -0,0 +1,238 @@
+# structured_brief.py
+"""
+Structured-output mode: the brief as a typed schema instead of free-form markdown.
+
+The model is asked for one JSON object with a field per report section (BRIEF_SECTIONS,
+in order), constrained by the schema upstream and validated with pydantic here. Each
+section is cached as its own JSON row next to the rendered markdown, so the UI and the
+docx renderer can load and re-render one section without reparsing the whole report,
+while history, sharing and the full download keep working on the markdown.
+"""
+
+import hashlib
+import json
+import time
+from functools import partial
+from typing import List
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from brief_cache import make_cache_key
+from brief_pipeline import (
+    BRIEF_GUIDELINES, BRIEF_MODEL, BRIEF_TEMPERATURE, SECTION_OUTLINE, BriefResult, TierUsage,
+    brief_flights, lookup_cached_brief, section_title
+)
+from metrics import record_usage, timed
+
+STRUCTURED_TIER = "structured"
+
+
+class SourceLink(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    title: str
+    url: str
+
+
+class BriefSection(BaseModel):
+    # Every field is required and extra keys are forbidden, as strict structured outputs require
+    model_config = ConfigDict(extra="forbid")
+
+    summary: str = Field(description="One or two sentences summing up the section; empty if there is nothing to add.")
+    points: List[str] = Field(description="Bullet points, most useful first; inline markdown is allowed.")
+    estimated: bool = Field(description="True when figures in this section are estimated or not publicly available.")
+    sources: List[SourceLink] = Field(description="Links backing this section.")
+
+
+class StructuredBrief(BaseModel):
+    """
+    One field per BRIEF_SECTIONS entry, in the same order.
+    """
+    model_config = ConfigDict(extra="forbid")
+
+    company_overview: BriefSection
+    financial_summary: BriefSection
+    market_position: BriefSection
+    import_activity: BriefSection
+    export_activity: BriefSection
+    global_presence: BriefSection
+    freight_forwarding: BriefSection
+    competitive_landscape: BriefSection
+    recent_developments: BriefSection
+    actionable_insights: BriefSection
+    source_links: BriefSection
+
+    def sections(self):
+        """
+        Returns (key, BriefSection) pairs in report order.
+        """
+        return [(key, getattr(self, key)) for key in SECTION_KEYS]
+
+
+SECTION_KEYS = tuple(StructuredBrief.model_fields)
+
+STRUCTURED_SYSTEM_PROMPT = (
+    "You are CustomerBrief, an expert market analyst. "
+    "Provide a clear, structured, and insightful business analysis of the company named by the user "
+    "using the most recent and relevant data available. The report has these sections:\n\n"
+    + SECTION_OUTLINE + "\n"
+    + BRIEF_GUIDELINES + " "
+    "Answer with the JSON object described by the response format: its fields are the sections above, in order. "
+    "Put the report's overall references in the sources of the last section."
+)
+
+STRUCTURED_SCHEMA = StructuredBrief.model_json_schema()
+
+# Versioned on the schema too, so sections stored under an older shape are never loaded
+STRUCTURED_PROMPT_VERSION = "structured-" + hashlib.sha256(
+    (STRUCTURED_SYSTEM_PROMPT + json.dumps(STRUCTURED_SCHEMA, sort_keys=True)).encode("utf-8")
+).hexdigest()[:12]
+
+STRUCTURED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "customer_brief", "strict": True, "schema": STRUCTURED_SCHEMA},
+}
+
+
+def build_structured_messages(query):
+    return [
+        {"role": "system", "content": STRUCTURED_SYSTEM_PROMPT},
+        {"role": "user", "content": query}
+    ]
+
+
+def complete_structured_brief(client, query, usage=None) -> StructuredBrief:
+    """
+    Generates a brief in structured-output mode. Raises ValueError when the model refuses or
+    its answer does not validate (pydantic's ValidationError is a ValueError).
+    """
+    if usage is None:
+        usage = TierUsage(STRUCTURED_TIER)
+    started = time.monotonic()
+    with timed("llm_structured"):
+        response = client.chat.completions.create(
+            model=BRIEF_MODEL,
+            messages=build_structured_messages(query),
+            temperature=BRIEF_TEMPERATURE,
+            response_format=STRUCTURED_RESPONSE_FORMAT
+        )
+    usage.model = getattr(response, "model", None) or BRIEF_MODEL
+    usage.seconds = time.monotonic() - started
+    if getattr(response, "usage", None) is not None:
+        usage.prompt_tokens = response.usage.prompt_tokens or 0
+        usage.completion_tokens = response.usage.completion_tokens or 0
+    record_usage(usage)
+
+    message = response.choices[0].message
+    refusal = getattr(message, "refusal", None)
+    if refusal:
+        raise ValueError(f"The model declined to write the brief: {refusal}")
+    return StructuredBrief.model_validate_json(message.content)
+
+
+# --- Rendering ---
+
+def _link(source):
+    title = source.title.replace("[", "(").replace("]", ")").strip() or source.url
+    return f"[{title}]({source.url})"
+
+
+def render_section(key, section) -> str:
+    """
+    Renders one section as markdown, under the same numbered heading as a free-form brief.
+    """
+    index = SECTION_KEYS.index(key)
+    blocks = [f"### {index + 1}. {section_title(index)}"]
+    if section.summary.strip():
+        blocks.append(section.summary.strip())
+    if section.points:
+        blocks.append("\n".join(f"- {point.strip()}" for point in section.points))
+    if section.estimated:
+        blocks.append("_Some figures in this section are estimated or not publicly available._")
+    if section.sources:
+        blocks.append("Sources:\n" + "\n".join(f"- {_link(source)}" for source in section.sources))
+    return "\n\n".join(blocks)
+
+
+def render_brief(brief) -> str:
+    """
+    Renders the whole brief as markdown, for history, sharing and the full download.
+    """
+    return "\n\n".join(render_section(key, section) for key, section in brief.sections())
+
+
+# --- Storage ---
+
+def store_structured_brief(cache, query, brief):
+    cache.set(query, BRIEF_MODEL, STRUCTURED_PROMPT_VERSION, render_brief(brief),
+              sections={key: section.model_dump_json() for key, section in brief.sections()})
+
+
+def load_sections(cache, query, keys=None):
+    """
+    Returns {key: BriefSection} of the cached structured brief, limited to keys when given ({} on a miss).
+    """
+    stored = cache.get_sections(query, BRIEF_MODEL, STRUCTURED_PROMPT_VERSION, keys)
+    return {key: BriefSection.model_validate_json(content) for key, content in stored.items()}
+
+
+def load_section(cache, query, key):
+    """
+    Returns one cached BriefSection, or None; the other sections are not read.
+    """
+    return load_sections(cache, query, [key]).get(key)
+
+
+def load_structured_brief(cache, query):
+    """
+    Returns the cached StructuredBrief, or None unless every section is stored.
+    """
+    sections = load_sections(cache, query)
+    if len(sections) != len(SECTION_KEYS):
+        return None
+    return StructuredBrief(**sections)
+
+
+def lookup_structured_brief(cache, query):
+    """
+    Returns (BriefResult, StructuredBrief) for a fresh cache entry, or (None, None).
+    """
+    cached = lookup_cached_brief(cache, query, STRUCTURED_PROMPT_VERSION)
+    if cached is None:
+        return None, None
+    brief = load_structured_brief(cache, query)
+    if brief is None:
+        # Expired in between; treat as a miss
+        return None, None
+    return cached, brief
+
+
+def _complete_structured_and_store(client, query, cache, usage):
+    brief = complete_structured_brief(client, query, usage)
+    if cache is not None:
+        store_structured_brief(cache, query, brief)
+    return brief
+
+
+def coalesced_structured_brief(client, query, cache=None, usage=None):
+    """
+    Runs the structured completion once for all concurrent callers asking for the same brief and
+    stores it once. Returns (StructuredBrief, shared); usage is only filled in for the caller that generated it.
+    """
+    return brief_flights.do(
+        make_cache_key(query, BRIEF_MODEL, STRUCTURED_PROMPT_VERSION),
+        partial(_complete_structured_and_store, client, query, cache, usage)
+    )
+
+
+def generate_structured_brief(client, query, cache=None, force_refresh=False):
+    """
+    Returns (BriefResult, StructuredBrief), from the cache when available, otherwise newly generated and cached.
+    """
+    if cache is not None and not force_refresh:
+        cached, brief = lookup_structured_brief(cache, query)
+        if cached is not None:
+            return cached, brief
+
+    brief, _ = coalesced_structured_brief(client, query, cache)
+    return BriefResult(query, render_brief(brief)), brief
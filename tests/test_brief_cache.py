@@ -0,0 +1,139 @@
+# test_brief_cache.py
+
+import pytest
+
+import brief_cache
+from brief_cache import BriefCache, make_cache_key, normalize_company_name
+
+MODEL = "gpt-test"
+VERSION = "v1"
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(brief_cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return BriefCache(str(tmp_path / "briefs.sqlite3"), max_entries=3, default_ttl=100)
+
+
+def test_trivial_variations_share_a_key():
+    assert normalize_company_name(" Apple  Inc. ") == "apple inc"
+    assert make_cache_key("Apple Inc.", MODEL, VERSION) == make_cache_key("apple inc", MODEL, VERSION)
+    assert make_cache_key("Apple", MODEL, VERSION) != make_cache_key("Apple", MODEL, "v2")
+
+
+def test_get_counts_hits(cache):
+    cache.set("Apple", MODEL, VERSION, "brief")
+    assert cache.get("apple", MODEL, VERSION).hits == 1
+    assert cache.get("APPLE", MODEL, VERSION).hits == 2
+    assert cache.peek("apple", MODEL, VERSION).hits == 2
+
+
+def test_entries_expire_after_their_ttl(cache, clock):
+    cache.set("Apple", MODEL, VERSION, "brief")
+    cache.set("Google", MODEL, VERSION, "brief", ttl=10)
+    clock.advance(50)
+    assert cache.peek("Google", MODEL, VERSION) is None
+    assert cache.get("Google", MODEL, VERSION) is None
+    assert cache.get("Apple", MODEL, VERSION).response == "brief"
+    clock.advance(60)
+    assert cache.get("Apple", MODEL, VERSION) is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted(cache, clock):
+    for company in ("Apple", "Google", "Maersk"):
+        cache.set(company, MODEL, VERSION, company)
+        clock.advance(1)
+    cache.get("Apple", MODEL, VERSION)
+    clock.advance(1)
+    cache.set("DHL", MODEL, VERSION, "DHL")
+
+    assert len(cache) == 3
+    assert cache.get("Google", MODEL, VERSION) is None
+    for company in ("Apple", "Maersk", "DHL"):
+        assert cache.get(company, MODEL, VERSION) is not None
+
+
+def test_peek_does_not_refresh_recency(cache, clock):
+    for company in ("Apple", "Google", "Maersk"):
+        cache.set(company, MODEL, VERSION, company)
+        clock.advance(1)
+    cache.peek("Apple", MODEL, VERSION)
+    cache.set("DHL", MODEL, VERSION, "DHL")
+    assert cache.get("Apple", MODEL, VERSION) is None
+
+
+def test_expired_entries_are_evicted_before_fresh_ones(cache, clock):
+    cache.set("Apple", MODEL, VERSION, "a", ttl=5)
+    clock.advance(1)
+    cache.set("Google", MODEL, VERSION, "g")
+    cache.set("Maersk", MODEL, VERSION, "m")
+    clock.advance(10)
+    cache.set("DHL", MODEL, VERSION, "d")
+    assert len(cache) == 3
+    for company in ("Google", "Maersk", "DHL"):
+        assert cache.get(company, MODEL, VERSION) is not None
+
+
+def test_invalidate_and_clear(cache):
+    cache.set("Apple", MODEL, VERSION, "a")
+    cache.set("Google", MODEL, VERSION, "g")
+    cache.invalidate("Apple", MODEL, VERSION)
+    assert cache.get("Apple", MODEL, VERSION) is None
+    assert len(cache) == 1
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_sections_are_stored_in_order_and_replaced(cache):
+    cache.set("Apple", MODEL, VERSION, "full", sections={"overview": "o", "financials": "f", "market": "m"})
+    assert list(cache.get_sections("apple", MODEL, VERSION)) == ["overview", "financials", "market"]
+    assert cache.get_sections("apple", MODEL, VERSION, ["market"]) == {"market": "m"}
+
+    cache.set("Apple", MODEL, VERSION, "full", sections={"overview": "o2"})
+    assert cache.get_sections("apple", MODEL, VERSION) == {"overview": "o2"}
+    cache.set("Apple", MODEL, VERSION, "plain")
+    assert cache.get_sections("apple", MODEL, VERSION) == {}
+
+
+def test_sections_go_with_their_entry(cache, clock):
+    cache.set("Apple", MODEL, VERSION, "full", sections={"overview": "o"})
+    cache.invalidate("Apple", MODEL, VERSION)
+    assert cache.get_sections("Apple", MODEL, VERSION) == {}
+
+    cache.set("Google", MODEL, VERSION, "full", ttl=5, sections={"overview": "o"})
+    clock.advance(10)
+    assert cache.get_sections("Google", MODEL, VERSION) == {}
+
+
+def test_companies_lists_fresh_entries_of_one_version(cache, clock):
+    cache.set("Apple Inc.", MODEL, VERSION, "a")
+    clock.advance(1)
+    cache.set("Google", MODEL, VERSION, "g")
+    cache.set("Maersk", MODEL, "v2", "m")
+    cache.set("Siemens", MODEL, VERSION, "s", ttl=-1)
+    assert [company for company, _ in cache.companies(MODEL, VERSION)] == ["apple inc", "google"]
+    assert [company for company, _ in cache.companies(MODEL, VERSION, since=clock.now)] == ["google"]
+
+
+def test_entries_are_shared_between_instances(tmp_path, clock):
+    path = str(tmp_path / "shared.sqlite3")
+    BriefCache(path).set("Apple", MODEL, VERSION, "brief")
+    assert BriefCache(path).get("apple", MODEL, VERSION).response == "brief"
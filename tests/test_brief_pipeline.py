@@ -0,0 +1,202 @@
+# test_brief_pipeline.py
+
+import re
+import threading
+import time
+
+import pytest
+
+from brief_pipeline import (
+    BRIEF_MODEL, BRIEF_SECTIONS, BULK_LATENCY_POLICY, LatencyPolicy, complete_brief_sectioned, section_title,
+    stream_brief
+)
+from tests.test_singleflight import wait_for
+
+_SECTION_RE = re.compile(r"Write section (\d+)\.")
+
+
+class _Obj:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeStream:
+    """
+    A streamed completion of chunks, optionally held back until release is set; close() aborts it.
+    """
+
+    def __init__(self, chunks, release=None):
+        self.chunks = chunks
+        self.release = release
+        self.closed = False
+
+    def __iter__(self):
+        if self.release is not None:
+            self.release.wait(5)
+        for content in self.chunks:
+            if self.closed:
+                return
+            yield _Obj(choices=[_Obj(delta=_Obj(content=content))], usage=None)
+
+    def close(self):
+        self.closed = True
+        if self.release is not None:
+            self.release.set()
+
+
+class FakeClient:
+    """
+    Answers requests in-process. behaviour maps a 0-based section index (section requests) or a
+    model name (streamed briefs) to a delay in seconds, an exception to raise, or an Event to
+    wait on before answering.
+    """
+
+    def __init__(self, behaviour=None):
+        self.behaviour = behaviour or {}
+        self.options = []
+        self.models = []
+        self.streams = []
+        self.chat = _Obj(completions=_Obj(create=self._create))
+
+    def with_options(self, **options):
+        self.options.append(options)
+        return self
+
+    def _create(self, model, messages, stream=False, **kwargs):
+        if stream:
+            return self._stream(model)
+        index = int(_SECTION_RE.search(messages[-1]["content"]).group(1)) - 1
+        action = self.behaviour.get(index)
+        if isinstance(action, Exception):
+            raise action
+        if isinstance(action, threading.Event):
+            action.wait(5)
+        elif action:
+            time.sleep(action)
+        content = f"### {index + 1}. {section_title(index)}\n\nText of section {index + 1}.\n"
+        return _Obj(choices=[_Obj(message=_Obj(content=content))], usage=None, model=model)
+
+    def _stream(self, model):
+        self.models.append(model)
+        action = self.behaviour.get(model)
+        if isinstance(action, Exception):
+            raise action
+        release = action if isinstance(action, threading.Event) else None
+        if action and release is None:
+            time.sleep(action)
+        stream = FakeStream([f"1. Overview by {model}", "\n- point"], release)
+        self.streams.append(stream)
+        return stream
+
+
+class Declined(Exception):
+    pass
+
+
+class ScheduledFakeClient(FakeClient):
+    """
+    Like FakeClient, but a streamed request first waits queued[model] seconds for admission and
+    reports it through on_admitted, as ScheduledOpenAI does.
+    """
+
+    def __init__(self, behaviour=None, queued=None):
+        super().__init__(behaviour)
+        self.queued = queued or {}
+        self.declined = []
+        self.chat.completions.reports_admission = True
+
+    def _create(self, model, messages, stream=False, on_admitted=None, **kwargs):
+        time.sleep(self.queued.get(model, 0))
+        if on_admitted is not None and on_admitted() is False:
+            self.declined.append(model)
+            raise Declined()
+        return super()._create(model, messages, stream=stream, **kwargs)
+
+
+def test_sections_are_assembled_in_report_order():
+    # Later sections finish first
+    client = FakeClient({index: 0.01 * (len(BRIEF_SECTIONS) - index) for index in range(len(BRIEF_SECTIONS))})
+    landed = []
+    text = complete_brief_sectioned(client, "Maersk", on_section=lambda index, _: landed.append(index))
+
+    positions = [text.index(f"### {index + 1}. {section_title(index)}") for index in range(len(BRIEF_SECTIONS))]
+    assert positions == sorted(positions)
+    assert sorted(landed) == list(range(len(BRIEF_SECTIONS)))
+    assert landed != sorted(landed)
+    assert client.options[0]["max_retries"] == 0
+
+
+def test_failed_section_becomes_a_placeholder():
+    text = complete_brief_sectioned(FakeClient({2: RuntimeError("boom")}), "Maersk")
+    assert "unavailable (error: RuntimeError)" in text
+    assert "Text of section 3." not in text
+    assert text.count("Text of section") == len(BRIEF_SECTIONS) - 1
+
+
+def test_late_section_does_not_hold_up_the_brief():
+    straggler = threading.Event()
+    try:
+        started = time.monotonic()
+        text = complete_brief_sectioned(FakeClient({4: straggler}), "Maersk", section_timeout=0.3)
+        assert time.monotonic() - started < 2
+    finally:
+        straggler.set()
+    assert "unavailable (timed out)" in text
+    assert "Text of section 5." not in text
+    assert "Text of section 11." in text
+
+
+def test_fast_first_token_is_not_hedged():
+    client = FakeClient()
+    text = "".join(stream_brief(client, "Maersk", LatencyPolicy(hedge_after=1, fallback_model="fast")))
+    assert text.startswith(f"1. Overview by {BRIEF_MODEL}")
+    assert client.models == [BRIEF_MODEL]
+
+
+def test_slow_first_token_is_hedged_on_the_fallback_model():
+    stuck = threading.Event()
+    client = FakeClient({BRIEF_MODEL: stuck})
+    try:
+        text = "".join(stream_brief(client, "Maersk", LatencyPolicy(hedge_after=0.05, fallback_model="fast")))
+    finally:
+        stuck.set()
+    assert text.startswith("1. Overview by fast")
+    assert client.models == [BRIEF_MODEL, "fast"]
+    # The losing request is cancelled
+    assert client.streams[0].closed
+
+
+def test_failed_request_is_hedged_straight_away():
+    client = FakeClient({BRIEF_MODEL: RuntimeError("boom")})
+    started = time.monotonic()
+    text = "".join(stream_brief(client, "Maersk", LatencyPolicy(hedge_after=10, fallback_model="fast")))
+    assert time.monotonic() - started < 5
+    assert text.startswith("1. Overview by fast")
+
+
+def test_without_hedging_a_failure_is_raised():
+    client = FakeClient({BRIEF_MODEL: RuntimeError("boom")})
+    with pytest.raises(RuntimeError):
+        "".join(stream_brief(client, "Maersk", LatencyPolicy(hedge_after=0)))
+    assert client.models == [BRIEF_MODEL]
+
+
+def test_time_queued_for_admission_does_not_count_towards_the_hedge():
+    client = ScheduledFakeClient(queued={BRIEF_MODEL: 0.3})
+    text = "".join(stream_brief(client, "Maersk", LatencyPolicy(hedge_after=0.2, fallback_model="fast")))
+    assert text.startswith(f"1. Overview by {BRIEF_MODEL}")
+    assert client.models == [BRIEF_MODEL]
+
+
+def test_hedge_still_queued_when_the_primary_answers_is_never_sent():
+    late = threading.Event()
+    client = ScheduledFakeClient({BRIEF_MODEL: late}, queued={"fast": 0.3})
+    threading.Timer(0.1, late.set).start()
+    text = "".join(stream_brief(client, "Maersk", LatencyPolicy(hedge_after=0.05, fallback_model="fast")))
+    assert text.startswith(f"1. Overview by {BRIEF_MODEL}")
+    wait_for(lambda: client.declined == ["fast"])
+    assert client.models == [BRIEF_MODEL]
+
+
+def test_bulk_briefs_are_never_hedged():
+    assert BULK_LATENCY_POLICY.hedge_after == 0
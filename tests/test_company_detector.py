@@ -0,0 +1,45 @@
+# test_company_detector.py
+
+import pytest
+
+from company_utils import CompanyCountDetector, contains_multiple_companies, count_companies
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Apple", 1),
+    ("Apple Inc.", 1),
+    ("brief on Apple Inc", 1),
+    ("Procter & Gamble", 1),
+    ("Samsung Co., Ltd.", 1),
+    ("Apple Inc, Cupertino", 1),
+    ("Nestle S.A., Vevey, Switzerland", 1),
+    ("Siemens AG, Germany", 1),
+    ("Apple, Google", 2),
+    ("Apple and Google", 2),
+    ("Apple vs Microsoft", 2),
+    ("Apple Inc Google LLC", 2),
+    ("Siemens AG, ABB Ltd", 2),
+    ("Apple, Google, Microsoft", 3),
+    ("brief on", 0),
+])
+def test_count(query, expected):
+    assert count_companies(query) == expected
+
+
+def test_contains_multiple_companies():
+    assert not contains_multiple_companies("Samsung Co., Ltd.")
+    assert contains_multiple_companies("Maersk / DHL")
+
+
+def test_known_names_can_contain_separators():
+    detector = CompanyCountDetector(known_companies=["Kuehne + Nagel"])
+    assert detector.count("Kuehne + Nagel") == 1
+    assert detector.count("Kuehne + Nagel and DHL") == 2
+    detector = CompanyCountDetector(known_companies=[])
+    assert detector.count("Kuehne + Nagel") == 2
+
+
+def test_custom_locations():
+    detector = CompanyCountDetector(known_locations=["Vevey"])
+    assert detector.count("Nestle, Vevey") == 1
+    assert detector.count("Nestle, Switzerland") == 2
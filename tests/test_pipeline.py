@@ -0,0 +1,72 @@
+# test_pipeline.py
+"""
+End-to-end brief generation through the real OpenAI client against benchmarks.mock_openai.
+"""
+
+import pytest
+
+openai = pytest.importorskip("openai")
+
+from benchmarks.mock_openai import DISCLAIMER, MockConfig, MockOpenAIServer
+from brief_cache import BriefCache
+from brief_pipeline import (
+    BULK_LATENCY_POLICY, PROMPT_VERSION, coalesced_brief_stream, generate_brief, lookup_cached_brief
+)
+
+
+def make_client(server):
+    return openai.OpenAI(base_url=server.base_url, api_key="test", max_retries=0)
+
+
+@pytest.fixture(scope="module")
+def server():
+    with MockOpenAIServer(MockConfig(latency=0.0, tokens_per_second=0, completion_tokens=400, seed=1)) as server:
+        yield server
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return BriefCache(str(tmp_path / "briefs.sqlite3"))
+
+
+def test_generated_brief_is_cleaned_and_cached(server, cache):
+    client = make_client(server)
+    result = generate_brief(client, "Maersk", cache)
+    assert not result.cached
+    assert DISCLAIMER not in result.text
+    assert "1. 🏢 Company Overview" in result.text
+    assert "Maersk" in result.text
+
+    requests = server.stats()["requests"]
+    again = generate_brief(client, "maersk", cache)
+    assert again.cached and again.text == result.text
+    assert server.stats()["requests"] == requests
+
+
+def test_streamed_brief_matches_what_is_cached(server, cache):
+    text = "".join(coalesced_brief_stream(make_client(server), "DHL Group", cache))
+    assert DISCLAIMER not in text
+    assert lookup_cached_brief(cache, "DHL Group").text == text.strip()
+
+
+def test_scheduled_client_goes_through_the_scheduler(server, cache):
+    pytest.importorskip("langchain_core")
+    from openai_scheduler import INTERACTIVE, ScheduledOpenAI, Scheduler
+
+    scheduler = Scheduler()
+    client = ScheduledOpenAI(make_client(server), scheduler=scheduler)
+    assert "Siemens" in generate_brief(client, "Siemens", cache).text
+    assert scheduler.admitted[INTERACTIVE] == 1
+
+
+def test_failed_request_is_hedged_once_then_raised(cache):
+    config = MockConfig(latency=0.0, tokens_per_second=0, error_rate=1.0, error_status=500)
+    with MockOpenAIServer(config) as failing:
+        with pytest.raises(openai.InternalServerError):
+            generate_brief(make_client(failing), "Nestle", cache)
+        assert failing.stats()["requests"] == 2
+
+        with pytest.raises(openai.InternalServerError):
+            generate_brief(make_client(failing), "Nestle", cache, policy=BULK_LATENCY_POLICY)
+        assert failing.stats()["requests"] == 3
+    assert lookup_cached_brief(cache, "Nestle", PROMPT_VERSION) is None
@@ -0,0 +1,62 @@
+# test_postprocess.py
+
+import random
+
+import pytest
+
+from benchmarks.mock_openai import DISCLAIMER, render_completion
+from postprocess import ResponseCleaner, clean_stream, clean_text
+
+BRIEF = render_completion("Maersk", "brief", 600)
+
+
+def random_chunks(text, rng, max_size=12):
+    chunks = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, max_size)
+        chunks.append(text[position:position + size])
+        position += size
+    return chunks
+
+
+def test_clean_text_drops_the_disclaimer_and_preamble():
+    cleaned = clean_text(BRIEF)
+    assert DISCLAIMER not in cleaned
+    assert "Here is an overview" not in cleaned
+    assert cleaned.startswith("🧠 Company Analysis")
+    assert "1. 🏢 Company Overview" in cleaned
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_any_chunking_cleans_to_the_batch_result(seed):
+    rng = random.Random(seed)
+    assert "".join(clean_stream(random_chunks(BRIEF, rng))) == clean_text(BRIEF)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_head_overflow_passes_the_text_through_intact(seed):
+    # Past max_head_chars the cleaner stops looking for section 1, wherever the chunk boundary falls
+    rng = random.Random(seed)
+    text = "Intro line.\n" * 40 + "1. Overview\n- point\n"
+    assert "".join(clean_stream(random_chunks(text, rng), max_head_chars=64)) == text.strip()
+
+
+def test_single_character_chunks():
+    assert "".join(clean_stream(list(BRIEF))) == clean_text(BRIEF)
+
+
+def test_figures_are_not_taken_for_section_headings():
+    text = "Some intro.\n10.5% growth this year\n1. 🏢 Company Overview\n- text\n"
+    assert clean_text(text).startswith("Some intro.\n10.5% growth")
+
+
+def test_only_non_empty_chunks_are_yielded():
+    assert all(clean_stream(["", "  ", "1. Overview", "", "\n", "- point", "  \n"]))
+
+
+def test_trailing_whitespace_is_held_back():
+    cleaner = ResponseCleaner()
+    out = cleaner.feed("1. Overview\n") + cleaner.feed("- point   ") + cleaner.finish()
+    assert out == clean_text("1. Overview\n- point   ")
+    assert not out.endswith(" ")
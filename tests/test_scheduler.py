@@ -0,0 +1,203 @@
+# test_scheduler.py
+
+import threading
+
+import pytest
+
+openai = pytest.importorskip("openai")
+pytest.importorskip("langchain_core")
+import httpx
+
+from openai_scheduler import (
+    BULK, INTERACTIVE, PREFETCH, RequestCancelled, ScheduledOpenAI, Scheduler, estimate_tokens
+)
+from tests.test_singleflight import wait_for
+
+REQUEST = httpx.Request("POST", "http://127.0.0.1/v1/chat/completions")
+
+
+def connection_error():
+    return openai.APIConnectionError(request=REQUEST)
+
+
+def rate_limit_error():
+    response = httpx.Response(429, request=REQUEST, headers={"retry-after": "0"})
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def test_waiters_are_admitted_by_priority():
+    scheduler = Scheduler(requests_per_minute=600, tokens_per_minute=10 ** 9)
+    # Nothing is admitted for half a second, then one request every 0.1 s
+    scheduler.back_off(0.5)
+    order = []
+    lock = threading.Lock()
+
+    def waiter(priority):
+        scheduler.acquire(priority, tokens=1)
+        with lock:
+            order.append(priority)
+
+    threads = []
+    for priority in (PREFETCH, BULK, INTERACTIVE, BULK):
+        thread = threading.Thread(target=waiter, args=(priority,), daemon=True)
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: sum(scheduler.queue_depth().values()) == len(threads))
+    assert scheduler.queue_depth() == {"interactive": 1, "bulk": 2, "prefetch": 1}
+    for thread in threads:
+        thread.join(5)
+
+    assert order == [INTERACTIVE, BULK, BULK, PREFETCH]
+    assert scheduler.stats()["admitted"] == {"interactive": 1, "bulk": 2, "prefetch": 1}
+
+
+def test_token_budget_holds_requests_back():
+    scheduler = Scheduler(requests_per_minute=6000, tokens_per_minute=6000)
+    assert scheduler.acquire(tokens=6000) < 0.1
+    # The bucket refills at 100 tokens a second
+    waited = scheduler.acquire(tokens=50)
+    assert 0.3 < waited < 2
+
+
+def test_settle_returns_unused_tokens():
+    scheduler = Scheduler(requests_per_minute=6000, tokens_per_minute=6000)
+    scheduler.acquire(tokens=6000)
+    scheduler.settle(6000, 5900)
+    assert scheduler.acquire(tokens=100) < 0.1
+
+
+def test_refund_returns_the_whole_request():
+    scheduler = Scheduler(requests_per_minute=1, tokens_per_minute=6000)
+    scheduler.acquire(tokens=6000)
+    scheduler.refund(6000)
+    assert scheduler.acquire(tokens=6000) < 0.1
+
+
+def test_oversized_request_waits_for_a_full_bucket_only():
+    scheduler = Scheduler(requests_per_minute=6000, tokens_per_minute=6000)
+    assert scheduler.acquire(tokens=10 ** 6) < 0.1
+
+
+def test_retryable_errors_are_retried():
+    scheduler = Scheduler(requests_per_minute=6000, max_retries=3, backoff_base=0.001, backoff_max=0.01)
+    errors = [connection_error(), rate_limit_error()]
+
+    def flaky():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert scheduler.call(flaky) == "ok"
+    stats = scheduler.stats()
+    assert (stats["retries"], stats["rate_limited"], stats["failures"]) == (2, 1, 0)
+
+
+def test_failed_attempts_do_not_keep_their_token_charge():
+    scheduler = Scheduler(requests_per_minute=6000, tokens_per_minute=6000, max_retries=3,
+                          backoff_base=0.001, backoff_max=0.01)
+    errors = [connection_error(), rate_limit_error(), connection_error()]
+
+    def flaky():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert scheduler.call(flaky, tokens=2000) == "ok"
+    # Only the attempt that succeeded is charged
+    assert scheduler.tokens.tokens == pytest.approx(4000, abs=100)
+
+
+def test_retries_give_up_after_max_retries():
+    scheduler = Scheduler(requests_per_minute=6000, max_retries=2, backoff_base=0.001, backoff_max=0.01)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise connection_error()
+
+    with pytest.raises(openai.APIConnectionError):
+        scheduler.call(failing)
+    assert len(calls) == 3
+    assert scheduler.stats()["failures"] == 1
+
+
+def test_other_errors_are_not_retried():
+    scheduler = Scheduler(max_retries=3)
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        scheduler.call(broken)
+    assert len(calls) == 1
+
+
+class _Obj:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeClient:
+    """
+    Just enough of an OpenAI client for ScheduledOpenAI: records requests and answers with usage.
+    """
+
+    def __init__(self, total_tokens=10, chunks=()):
+        self.requests = []
+        self.total_tokens = total_tokens
+        self.chunks = chunks
+        self.chat = _Obj(completions=_Obj(create=self._create))
+
+    def with_options(self, **options):
+        return self
+
+    def _create(self, **kwargs):
+        self.requests.append(kwargs)
+        if kwargs.get("stream"):
+            return (chunk for chunk in self.chunks)
+        return _Obj(usage=_Obj(total_tokens=self.total_tokens))
+
+
+MESSAGES = [{"role": "user", "content": "Maersk"}]
+
+
+def test_scheduled_client_settles_the_reported_usage():
+    scheduler = Scheduler(requests_per_minute=6000, tokens_per_minute=60)
+    client = ScheduledOpenAI(FakeClient(total_tokens=10), scheduler=scheduler, priority=BULK)
+    client.chat.completions.create(model="m", messages=MESSAGES, max_tokens=20)
+    assert scheduler.admitted[BULK] == 1
+    assert scheduler.tokens.tokens == pytest.approx(50, abs=1)
+
+
+def test_scheduled_stream_settles_when_it_ends():
+    chunks = [_Obj(choices=[_Obj(delta=_Obj(content="x" * 40))], usage=None),
+              _Obj(choices=[], usage=_Obj(total_tokens=12))]
+    scheduler = Scheduler(requests_per_minute=6000, tokens_per_minute=60)
+    client = ScheduledOpenAI(FakeClient(chunks=chunks), scheduler=scheduler)
+    stream = client.chat.completions.create(model="m", messages=MESSAGES, max_tokens=20, stream=True)
+    assert scheduler.tokens.tokens == pytest.approx(60 - estimate_tokens(MESSAGES, 20), abs=1)
+    assert len(list(stream)) == 2
+    assert scheduler.tokens.tokens == pytest.approx(48, abs=1)
+
+
+def test_abandoned_stream_settles_on_its_estimate():
+    chunks = [_Obj(choices=[_Obj(delta=_Obj(content="x" * 40))], usage=None)] * 3
+    scheduler = Scheduler(requests_per_minute=6000, tokens_per_minute=60)
+    client = ScheduledOpenAI(FakeClient(chunks=chunks), scheduler=scheduler)
+    stream = client.chat.completions.create(model="m", messages=MESSAGES, max_tokens=20, stream=True)
+    next(iter(stream))
+    stream.close()
+    # No usage chunk: the prompt estimate plus 40 streamed characters at four per token
+    assert scheduler.tokens.tokens == pytest.approx(60 - 1 - 10, abs=1)
+
+
+def test_request_declined_on_admission_is_refunded_and_never_sent():
+    scheduler = Scheduler(requests_per_minute=6000, tokens_per_minute=60)
+    inner = FakeClient()
+    client = ScheduledOpenAI(inner, scheduler=scheduler)
+    with pytest.raises(RequestCancelled):
+        client.chat.completions.create(model="m", messages=MESSAGES, max_tokens=20, on_admitted=lambda: False)
+    assert inner.requests == []
+    assert scheduler.tokens.tokens == pytest.approx(60, abs=1)
@@ -0,0 +1,147 @@
+# test_singleflight.py
+
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out waiting for condition")
+        time.sleep(0.001)
+
+
+def run_in_thread(fn):
+    result = {}
+
+    def target():
+        try:
+            result["value"] = fn()
+        except BaseException as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread, result
+
+
+def test_follower_shares_the_leaders_result():
+    flights = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(5)
+        return "brief"
+
+    leader, leader_result = run_in_thread(lambda: flights.do("apple", work))
+    wait_for(lambda: flights.in_flight() == 1)
+    follower, follower_result = run_in_thread(lambda: flights.do("apple", work))
+    wait_for(lambda: flights.followers == 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert leader_result["value"] == ("brief", False)
+    assert follower_result["value"] == ("brief", True)
+    assert len(calls) == 1
+    assert flights.stats() == {"in_flight": 0, "leaders": 1, "calls_saved": 1, "stream_followers": 0}
+
+
+def test_distinct_keys_do_not_coalesce():
+    flights = SingleFlight()
+    assert flights.do("apple", lambda: "a") == ("a", False)
+    assert flights.do("google", lambda: "g") == ("g", False)
+    assert flights.leaders == 2 and flights.followers == 0
+
+
+def test_failure_reaches_followers_and_releases_the_key():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    leader, leader_result = run_in_thread(lambda: flights.do("apple", failing))
+    wait_for(lambda: flights.in_flight() == 1)
+    follower, follower_result = run_in_thread(lambda: flights.do("apple", failing))
+    wait_for(lambda: flights.followers == 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert isinstance(leader_result["error"], RuntimeError)
+    assert follower_result["error"] is leader_result["error"]
+    assert flights.in_flight() == 0
+    # The failure is not remembered: the next caller runs the work again
+    assert flights.do("apple", lambda: "recovered") == ("recovered", False)
+
+
+def test_stream_follower_replays_chunks_from_the_start():
+    flights = SingleFlight()
+    first_sent = threading.Event()
+    release = threading.Event()
+
+    def chunks():
+        yield "1. "
+        first_sent.set()
+        release.wait(5)
+        yield "Overview"
+        yield " text"
+
+    leader = flights.stream("apple", chunks)
+    assert next(leader) == "1. "
+    first_sent.wait(5)
+    follower = flights.stream("apple", chunks)
+    release.set()
+
+    assert "".join(follower) == "1. Overview text"
+    assert "1. " + "".join(leader) == "1. Overview text"
+    assert flights.stream_followers == 1
+
+
+def test_stream_failure_reaches_every_reader():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def chunks():
+        yield "partial"
+        release.wait(5)
+        raise ConnectionError("stream cut off")
+
+    leader = flights.stream("apple", chunks)
+    assert next(leader) == "partial"
+    follower = flights.stream("apple", chunks)
+    release.set()
+
+    with pytest.raises(ConnectionError):
+        list(leader)
+    with pytest.raises(ConnectionError):
+        list(follower)
+    wait_for(lambda: flights.in_flight() == 0)
+
+
+def test_blocking_follower_of_a_stream_receives_the_joined_text():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def chunks():
+        yield "a"
+        release.wait(5)
+        yield "b"
+
+    leader = flights.stream("apple", chunks)
+    assert next(leader) == "a"
+    follower, follower_result = run_in_thread(lambda: flights.do("apple", lambda: "unused"))
+    wait_for(lambda: flights.followers == 1)
+    release.set()
+    follower.join(5)
+
+    assert follower_result["value"] == ("ab", True)